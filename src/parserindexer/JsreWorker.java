@@ -0,0 +1,215 @@
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.OutputStreamWriter;
+import java.io.PrintStream;
+import java.io.Writer;
+import java.lang.reflect.Constructor;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.security.Permission;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.Properties;
+
+import org.itc.irst.tcc.sre.Predict;
+
+/**
+ * A long-lived jSRE prediction worker, started by jsre_worker.py, so that
+ * predictions do not pay for the start of a JVM, the loading (and JIT
+ * compilation) of the jSRE classes and the loading of the model every time.
+ *
+ * The worker builds one jSRE Predict object, which loads the model, and runs
+ * it for every request: the input and output files of the requests are
+ * always the same files of WORK_DIR, so the Predict parameters do not
+ * change. Predict is built and run through reflection, as this API is not
+ * part of the jSRE command line. If it is not available, or a request fails
+ * with it but succeeds with the jSRE command line (Predict.main), the worker
+ * runs the command line for every request, which reads the model again.
+ *
+ * Usage: java JsreWorker MODEL_FILE WORK_DIR
+ *
+ * The worker prints a line READY once started, followed by EXIT_UNTRAPPED if
+ * it cannot survive a System.exit() of jSRE (see trapExit()) and by
+ * MODEL_RELOADED if it reads the model for every request. It then reads
+ * requests on its standard input. A request is a list of records, one per
+ * line, followed by an empty line. The response is a line "OK n" followed by
+ * the n labels predicted by jSRE, or a line "ERROR message" if jSRE did not
+ * produce any prediction. "OK n MODEL_RELOADED" tells that the worker has
+ * just switched to the jSRE command line.
+ */
+public class JsreWorker {
+
+    /** Thrown instead of exiting the JVM when jSRE calls System.exit() */
+    static class ExitTrappedException extends SecurityException {
+        ExitTrappedException(int status) {
+            super("jSRE exited with status " + status);
+        }
+    }
+
+    /** Runs a loaded Predict object, or null for the jSRE command line */
+    private static Method run;
+    private static Object predict;
+
+    public static void main(String[] args) throws Exception {
+        if (args.length != 2) {
+            System.err.println("Usage: java JsreWorker MODEL_FILE WORK_DIR");
+            System.exit(1);
+        }
+        String modelFile = args[0];
+        File inFile = new File(args[1], "jsre_input.txt");
+        File outFile = new File(args[1], "jsre_output.txt");
+
+        // The standard output carries the responses, so the messages jSRE
+        // prints are discarded, as they are when it runs on its own
+        PrintStream responses = new PrintStream(
+                new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        System.setOut(new PrintStream(new OutputStream() {
+            @Override
+            public void write(int b) {
+            }
+        }));
+        boolean exitTrapped = trapExit();
+        loadModel(modelFile, inFile, outFile);
+
+        BufferedReader requests = new BufferedReader(
+                new InputStreamReader(System.in, "UTF-8"));
+        responses.println("READY" + (exitTrapped ? "" : " EXIT_UNTRAPPED") +
+                          (predict != null ? "" : " MODEL_RELOADED"));
+
+        String line;
+        while ((line = requests.readLine()) != null) {
+            // Records are written to the input file as they are read
+            Writer writer = new OutputStreamWriter(
+                    new FileOutputStream(inFile), "UTF-8");
+            while (line != null && line.length() > 0) {
+                writer.write(line);
+                writer.write('\n');
+                line = requests.readLine();
+            }
+            writer.close();
+
+            String reloaded = "";
+            boolean predicted = false;
+            if (predict != null) {
+                predicted = predictLoaded(outFile);
+                if (!predicted && predictCommandLine(modelFile, inFile,
+                                                     outFile)) {
+                    // The loaded model cannot be run again: the command line
+                    // is used from now on
+                    System.err.println("The loaded jSRE model failed, the "
+                                       + "model is read for every request");
+                    predict = null;
+                    reloaded = " MODEL_RELOADED";
+                    predicted = true;
+                }
+            } else {
+                predicted = predictCommandLine(modelFile, inFile, outFile);
+            }
+
+            if (!predicted) {
+                responses.println("ERROR jSRE did not produce an output file");
+                continue;
+            }
+
+            List<String> labels = new ArrayList<String>();
+            BufferedReader reader = new BufferedReader(new InputStreamReader(
+                    new FileInputStream(outFile), "UTF-8"));
+            String label;
+            while ((label = reader.readLine()) != null) {
+                labels.add(label);
+            }
+            reader.close();
+
+            responses.println("OK " + labels.size() + reloaded);
+            for (String l : labels) {
+                responses.println(l);
+            }
+        }
+    }
+
+    /**
+     * Builds a jSRE Predict object with the parameters of the jSRE command
+     * line, which loads the model once. Leaves predict null if Predict has
+     * no such constructor or cannot load the model.
+     */
+    private static void loadModel(String modelFile, File inFile,
+                                  File outFile) {
+        Properties parameter = new Properties();
+        parameter.setProperty("example-file", inFile.getPath());
+        parameter.setProperty("model-file", modelFile);
+        parameter.setProperty("output-file", outFile.getPath());
+        try {
+            Constructor<Predict> constructor =
+                    Predict.class.getConstructor(Properties.class);
+            run = Predict.class.getMethod("run");
+            predict = constructor.newInstance(parameter);
+        } catch (Throwable t) {
+            System.err.println("jSRE model cannot be loaded once: " + t);
+            predict = null;
+        }
+    }
+
+    /** Predicts the records of the input file with the loaded model */
+    private static boolean predictLoaded(File outFile) {
+        outFile.delete();
+        try {
+            run.invoke(predict);
+        } catch (InvocationTargetException e) {
+            if (!(e.getCause() instanceof ExitTrappedException)) {
+                System.err.println("jSRE failed: " + e.getCause());
+            }
+        } catch (Throwable t) {
+            System.err.println("jSRE failed: " + t);
+        }
+        return outFile.exists();
+    }
+
+    /** Predicts the records of the input file with the jSRE command line */
+    private static boolean predictCommandLine(String modelFile, File inFile,
+                                              File outFile) {
+        outFile.delete();
+        try {
+            Predict.main(new String[] {inFile.getPath(), modelFile,
+                                       outFile.getPath()});
+        } catch (ExitTrappedException e) {
+            // Predict is done
+        } catch (Throwable t) {
+            System.err.println("jSRE failed: " + t);
+        }
+        return outFile.exists();
+    }
+
+    /**
+     * Keeps the worker alive if jSRE calls System.exit(), by installing a
+     * security manager. JDK 18 and later refuse to install one unless the
+     * JVM is started with -Djava.security.manager=allow, which
+     * jsre_worker.py passes them, and JDK 24 and later always refuse. A jSRE exit would then end the worker after every
+     * request, so jsre_worker.py does not use the worker and starts a JVM
+     * for every prediction instead.
+     *
+     * @return false if exits cannot be trapped
+     */
+    private static boolean trapExit() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission permission) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrappedException(status);
+                }
+            });
+        } catch (UnsupportedOperationException e) {
+            System.err.println("jSRE exits cannot be trapped: " + e);
+            return false;
+        }
+        return true;
+    }
+}
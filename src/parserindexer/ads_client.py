@@ -0,0 +1,382 @@
+from __future__ import print_function
+
+import re
+import time
+import random
+import warnings
+import threading
+import requests
+from utils import Batcher
+from utils import parallel_map
+
+
+class AdsClient(object):
+    """
+    A client of the ADS search API that can be shared by several threads.
+    It limits the number of concurrent requests, paces the requests according
+    to the X-RateLimit-Remaining and X-RateLimit-Reset headers returned by
+    ADS, and retries the requests that fail with HTTP 429 or 5xx after an
+    exponential backoff with jitter.
+
+    Lookups of LPSC abstracts (year:Y AND page:P AND pub:"V") made at about
+    the same time by different threads can be batched into a single query
+    OR'ing the pages of the same year, whose results are demultiplexed back
+    to each lookup by year and page.
+    """
+
+    FIELDS = 'first_author,author,aff,pubdate,year,pub,title'
+    LPSC_QUERY = re.compile(r'^year:(\S+) AND page:(\S+) AND pub:(".+")$')
+    # Maximum number of rows ADS returns for a single query
+    MAX_ROWS = 2000
+
+    def __init__(self, ads_token, ads_base_url, max_concurrency=4,
+                 max_retries=5, batch_size=1, batch_wait=0.2,
+                 batch_submitters=None,
+                 backoff_base=1.0, backoff_cap=60.0, max_rate_limit_wait=3600,
+                 timeout=60):
+        """
+        :param ads_token: ADS API token
+        :param ads_base_url: ADS search API URL
+        :param max_concurrency: maximum number of requests in flight
+        :param max_retries: number of times a request failing with HTTP 429,
+        HTTP 5xx or a connection error is retried
+        :param batch_size: maximum number of LPSC lookups batched into one
+        query. 1 disables batching
+        :param batch_wait: number of seconds a batch waits for more lookups
+        before it is sent
+        :param batch_submitters: number of threads making LPSC lookups (see
+        Batcher), or None if unknown
+        :param backoff_base: backoff before the first retry, in seconds
+        :param backoff_cap: maximum backoff between retries, in seconds
+        :param max_rate_limit_wait: maximum number of seconds to wait for the
+        rate limit to reset once it is exhausted. Requests fail instead if it
+        resets later
+        :param timeout: timeout of a request, in seconds
+        """
+        if max_retries < 0:
+            raise RuntimeError('The number of ADS retries must be 0 or more: '
+                               '%d' % max_retries)
+
+        self.ads_token = ads_token
+        self.ads_base_url = ads_base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.batch_size = max(1, min(batch_size, self.MAX_ROWS))
+        self.batch_wait = batch_wait
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        # Rate limit as last reported by ADS. remaining is decremented for
+        # every request sent, so that the requests in flight are accounted
+        # for. None means unknown.
+        self.rate_lock = threading.Lock()
+        self.remaining = None
+        self.reset = None
+
+        # Batches of LPSC lookups, by (year, venue)
+        self.batcher = None
+        if self.batch_size > 1:
+            self.batcher = Batcher(self.send_batch, self.batch_size,
+                                   batch_wait,
+                                   submitters=batch_submitters)
+
+        self.requests = 0
+        self.retries = 0
+
+    def search(self, query_str):
+        """
+        Searches the ADS database
+        :param query_str: Solr query string
+        :return: list of the documents found, or None if the request failed
+        """
+        match = self.LPSC_QUERY.match(query_str)
+        if self.batcher is not None and match:
+            year, _, venue = match.groups()
+            return self.batcher.submit(match.groups(), (year, venue))
+
+        return self.request(query_str)
+
+    def search_many(self, query_strs):
+        """
+        Runs several searches concurrently
+        :param query_strs: Solr query strings
+        :return: list of the results of search(), in the order of query_strs
+        """
+        results = parallel_map(self.search, query_strs, self.max_concurrency)
+        return [docs for _, docs in results]
+
+    def send_batch(self, lookups):
+        """
+        Sends a batch of LPSC lookups of the same year with a single query
+        OR'ing their pages, and demultiplexes its results by page (see
+        Batcher)
+        :param lookups: list of (year, page, venue) tuples
+        :return: list of the documents found for each lookup, or None if the
+        request failed
+        """
+        year, _, venue = lookups[0]
+        if len(lookups) == 1:
+            return [self.request('year:%s AND page:%s AND pub:%s' % lookups[0])]
+
+        pages = sorted(set(page for _, page, _ in lookups))
+        query_str = 'year:%s AND pub:%s AND page:(%s)' % (year, venue,
+                                                          ' OR '.join(pages))
+        data = self.request(query_str, fields=self.FIELDS + ',page',
+                            rows=self.MAX_ROWS, full_response=True)
+        if data is None:
+            return [None] * len(lookups)
+
+        docs_by_page = dict((page, []) for page in pages)
+        for doc in data['docs']:
+            for page in doc.pop('page', []):
+                if page in docs_by_page and str(doc.get('year')) == year:
+                    docs_by_page[page].append(doc)
+
+        truncated = data['numFound'] > len(data['docs'])
+        results = []
+        for _, page, _ in lookups:
+            if truncated and not docs_by_page[page]:
+                # The page may be in the rows ADS did not return
+                results.append(self.request(
+                    'year:%s AND page:%s AND pub:%s' % (year, page, venue)))
+            else:
+                results.append(docs_by_page[page])
+
+        return results
+
+    def request_all(self, query_str, fields=FIELDS, sort='bibcode asc'):
+        """
+        Fetches all the documents matching a query, in pages of MAX_ROWS
+        documents
+        :param query_str: Solr query string
+        :param fields: comma-separated fields of the documents to return
+        :param sort: sort order, which keeps the pages consistent
+        :return: list of documents, or None if a request failed
+        """
+        docs = []
+        while True:
+            data = self.request(query_str, fields, rows=self.MAX_ROWS,
+                                start=len(docs), sort=sort, full_response=True)
+            if data is None:
+                return None
+
+            docs.extend(data['docs'])
+            if len(data['docs']) == 0 or len(docs) >= data['numFound']:
+                return docs
+
+    def request(self, query_str, fields=FIELDS, rows=None, start=None,
+                sort=None, full_response=False):
+        """
+        Sends a query to ADS, retrying it if it fails with HTTP 429, HTTP 5xx
+        or a connection error
+        :param query_str: Solr query string
+        :param fields: comma-separated fields of the documents to return
+        :param rows: maximum number of documents to return. None means the ADS
+        default
+        :param start: offset of the first document to return
+        :param sort: sort order of the documents, e.g. 'bibcode asc'
+        :param full_response: return the 'response' object of the ADS reply
+        instead of the list of documents
+        :return: list of documents (or response object), or None if the
+        request failed
+        """
+        headers = {
+            'Authorization': 'Bearer %s' % self.ads_token
+        }
+
+        params = [
+            ('q', query_str),
+            ('fl', fields)
+        ]
+        if rows is not None:
+            params.append(('rows', rows))
+        if start is not None:
+            params.append(('start', start))
+        if sort is not None:
+            params.append(('sort', sort))
+
+        for attempt in range(self.max_retries + 1):
+            if not self.wait_for_rate_limit():
+                warnings.warn('[WARNING] ADS rate limit exhausted until %s. '
+                              'The query string is %s' %
+                              (time.ctime(self.reset), query_str))
+                return None
+
+            response = None
+            with self.semaphore:
+                try:
+                    response = self.session.get(self.ads_base_url,
+                                                headers=headers,
+                                                params=params,
+                                                timeout=self.timeout)
+                except requests.exceptions.RequestException as e:
+                    error = str(e)
+
+            if response is not None:
+                self.update_rate_limit(response.headers)
+                if response.status_code == 200:
+                    data = response.json()['response']
+                    return data if full_response else data['docs']
+
+                error = 'The HTTP code is %d' % response.status_code
+                if response.status_code != 429 and \
+                        response.status_code < 500:
+                    break
+
+            if attempt < self.max_retries:
+                with self.rate_lock:
+                    self.retries += 1
+                time.sleep(self.backoff(attempt, response))
+
+        warnings.warn('[WARNING] Failed accessing ADS database. %s. The query '
+                      'string is %s' % (error, query_str))
+        return None
+
+    def backoff(self, attempt, response=None):
+        """
+        Computes the delay before a retry, with full jitter
+        :param attempt: number of the attempt that failed, from 0
+        :param response: failed HTTP response, if any
+        :return: delay in seconds
+        """
+        delay = random.uniform(0, min(self.backoff_cap,
+                                      self.backoff_base * 2 ** attempt))
+
+        # Honor the delay requested by the server, if any
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers['Retry-After']))
+            except (KeyError, ValueError):
+                pass
+
+        return delay
+
+    def update_rate_limit(self, headers):
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = float(headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+
+        with self.rate_lock:
+            self.remaining = remaining
+            self.reset = reset
+
+    def wait_for_rate_limit(self):
+        """
+        Blocks until the rate limit allows one more request
+        :return: False if the rate limit is exhausted for longer than
+        max_rate_limit_wait, True otherwise
+        """
+        while True:
+            with self.rate_lock:
+                if self.remaining is None or self.remaining > 0:
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    self.requests += 1
+                    return True
+
+                delay = self.reset - time.time()
+                if delay <= 0:
+                    # The quota has been renewed. The next response tells
+                    # how many requests are left.
+                    self.remaining = None
+                    continue
+
+            if delay > self.max_rate_limit_wait:
+                return False
+            time.sleep(delay)
+
+    def stats(self):
+        return 'requests: %d, retries: %d, rate limit remaining: %s' % (
+            self.requests, self.retries, self.remaining)
+
+
+class LpscIndex(object):
+    """
+    An index of the LPSC abstracts by year and abstract number. The first
+    lookup of a year fetches all the abstracts of that year in a few paged
+    bulk queries, and the lookups of the same year are answered from the
+    index afterwards. The volumes fetched are stored in the ADS cache, if any,
+    so that later runs do not fetch them again.
+    """
+
+    def __init__(self, ads_client, ads_cache=None):
+        """
+        :param ads_client: AdsClient used to fetch the volumes
+        :param ads_cache: optional SqliteCache storing the volumes
+        """
+        self.ads_client = ads_client
+        self.ads_cache = ads_cache
+        self.volumes = dict()
+        self.lock = threading.Lock()
+        self.volume_locks = dict()
+
+    def search(self, query_str):
+        """
+        Answers an LPSC query (year:Y AND page:P AND pub:"V") from the index
+        :param query_str: Solr query string
+        :return: list of the documents found, or None if query_str is not an
+        LPSC query or the volume of its year could not be fetched
+        """
+        match = AdsClient.LPSC_QUERY.match(query_str)
+        if match is None:
+            return None
+
+        year, page, venue = match.groups()
+        volume = self.volume(year, venue)
+        if volume is None:
+            return None
+
+        return volume.get(page, [])
+
+    def volume(self, year, venue):
+        """
+        Gets the abstracts of a year, fetching them if needed
+        :return: dictionary mapping abstract numbers to lists of documents, or
+        None if the volume could not be fetched
+        """
+        key = (year, venue)
+        with self.lock:
+            volume_lock = self.volume_locks.setdefault(key, threading.Lock())
+
+        # Lookups of the same year wait for the volume to be fetched once
+        with volume_lock:
+            if key not in self.volumes:
+                self.volumes[key] = self.fetch_volume(year, venue)
+            return self.volumes[key]
+
+    def fetch_volume(self, year, venue):
+        cache_key = 'lpsc-volume year:%s AND pub:%s' % (year, venue)
+        if self.ads_cache is not None:
+            volume = self.ads_cache.get(cache_key)
+            if volume is not None:
+                return volume
+
+        docs = self.ads_client.request_all(
+            'year:%s AND pub:%s' % (year, venue),
+            fields=AdsClient.FIELDS + ',page')
+        if docs is None:
+            # Failed volumes are not retried; lookups of that year fall back
+            # to one query per abstract
+            warnings.warn('[WARNING] Failed prefetching the LPSC abstracts '
+                          'of %s' % year)
+            return None
+
+        volume = dict()
+        for doc in docs:
+            for page in doc.pop('page', []):
+                volume.setdefault(page, []).append(doc)
+
+        if self.ads_cache is not None:
+            self.ads_cache.put(cache_key, volume)
+
+        return volume
@@ -1,16 +1,15 @@
 from __future__ import print_function
 
-import os
 import re
-import sys
 import json
 import warnings
-import requests
-from tqdm import tqdm
-from utils import LogUtil
-from ioutils import read_lines
+from ads_client import AdsClient
+from pipeline import Pipeline
+from pipeline import add_pipeline_args
+from pipeline import pipeline_args
 from tika_parser import TikaParser
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 # Always printing matching warnings
 warnings.filterwarnings('always')
@@ -21,10 +20,18 @@ class AdsParser(TikaParser):
     Data System (ADS) to extract the primary author, author list, author
     affiliations, publication venue.
     """
-    def __init__(self, ads_token, ads_base_url, tika_server_url):
-        super(AdsParser, self).__init__(tika_server_url)
+    def __init__(self, ads_token, ads_base_url, tika_server_url,
+                 tika_cache=None, ads_cache=None, ads_client=None,
+                 lpsc_index=None, bib_index=None):
+        super(AdsParser, self).__init__(tika_server_url, tika_cache)
         self.ads_token = ads_token
         self.ads_base_url = ads_base_url
+        self.ads_cache = ads_cache
+        if ads_client is None:
+            ads_client = AdsClient(ads_token, ads_base_url)
+        self.ads_client = ads_client
+        self.lpsc_index = lpsc_index
+        self.bib_index = bib_index
 
     @staticmethod
     def escape_solr_chars(text):
@@ -121,33 +128,43 @@ class AdsParser(TikaParser):
 
         return query_str
 
-    def query_ads_database(self, query_str):
-        ads_dict = dict()
-
-        headers = {
-            'Authorization': 'Bearer %s' % self.ads_token
-        }
-
-        params = (
-            ('q', query_str),
-            ('fl', 'first_author,author,aff,pubdate,year,pub,title')
-        )
-
-        response = requests.get(self.ads_base_url, headers=headers,
-                                params=params)
+    def fetch_ads_docs(self, query_str):
+        """
+        Queries the ADS database, or the LPSC index or the ADS cache if there
+        are some
+        :param query_str: Solr query string
+        :return: list of the documents found, or None if the ADS database
+        could not be accessed
+        """
+        if self.lpsc_index is not None:
+            data_docs = self.lpsc_index.search(query_str)
+            if data_docs is not None:
+                return data_docs
+
+        if self.ads_cache is not None:
+            data_docs = self.ads_cache.get(query_str)
+            if data_docs is not None:
+                return data_docs
+
+        data_docs = self.ads_client.search(query_str)
+        if data_docs is None:
+            return None
+
+        # Failed requests are not cached, but queries that found no document
+        # are, so that they are not sent again on every run
+        if self.ads_cache is not None:
+            self.ads_cache.put(query_str, data_docs)
+
+        return data_docs
 
-        if response.status_code != 200:
-            warnings.warn('[WARNING] Failed accessing ADS database. The HTTP '
-                          'code is %d. The query string is %s' %
-                          (response.status_code, query_str))
-            return ads_dict
-
-        data = response.json()
-        data_docs = data['response']['docs']
+    def query_ads_database(self, query_str):
+        data_docs = self.fetch_ads_docs(query_str)
+        if data_docs is None:
+            return dict()
 
         if len(data_docs) == 0:
             warnings.warn('[Warning] 0 document found in the ADS database')
-            return ads_dict
+            return dict()
 
         if len(data_docs) > 1:
             warnings.warn('[Warning] There are multiple documents returned '
@@ -155,8 +172,11 @@ class AdsParser(TikaParser):
                           'document.')
             warnings.warn(json.dumps(data_docs[0]['title']))
 
-        data_docs = data_docs[0]
+        return self.ads_record(data_docs[0])
 
+    @staticmethod
+    def ads_record(data_docs):
+        ads_dict = dict()
         ads_dict['title'] = data_docs['title'][0]
         ads_dict['primary_author'] = data_docs['first_author']
         ads_dict['author'] = data_docs['author']
@@ -167,15 +187,70 @@ class AdsParser(TikaParser):
 
         return ads_dict
 
+    def query_bib_index(self, tika_dict, query_dict=None):
+        """
+        Looks up a document in the offline bibliographic index instead of the
+        ADS database: by grobid title, matched approximately, or by year and
+        abstract number for LPSC abstracts
+        """
+        if query_dict is not None:
+            lpsc_dict = query_dict['lpsc_query_strategy']
+            records = self.bib_index.find_page(lpsc_dict['year'],
+                                               lpsc_dict['abstract_number'])
+            if len(records) == 0:
+                warnings.warn('[Warning] 0 document found in the '
+                              'bibliographic index')
+                return dict()
+            return self.ads_record(records[0])
+
+        title = self.special_rules(
+            tika_dict['metadata']['grobid:header_Title'])
+        record, score = self.bib_index.match(title)
+        if record is None:
+            warnings.warn('[Warning] 0 document found in the bibliographic '
+                          'index. The best similarity is %.3f' % score)
+            return dict()
+
+        return self.ads_record(record)
+
     def parse(self, file_path, query_dict=None):
-        tika_dict = super(AdsParser, self).parse(file_path)
+        tika_dict = self.parse_tika(file_path)
+        ads_dict = self.lookup(tika_dict, query_dict)
+
+        return self.attach(tika_dict, ads_dict)
+
+    def parse_tika(self, file_path):
+        """
+        Parses a file with TIKA only. The ADS metadata can be looked up and
+        attached afterwards with lookup() and attach(), or AdsEnrichmentStage.
+        """
+        return super(AdsParser, self).parse(file_path)
+
+    def lookup(self, tika_dict, query_dict=None):
+        """
+        Looks up the ADS record of a document parsed by TIKA
+        :param tika_dict: dictionary returned by parse_tika()
+        :param query_dict: see construct_query_string()
+        :return: ADS record dictionary, empty if no record is found
+        """
         query_str = self.construct_query_string(tika_dict, query_dict)
         if len(query_str) == 0:
             warnings.warn('[WARNING] grobid title not found')
-            return tika_dict
+            return dict()
+
+        # Query the ADS database, or the bibliographic index offline
+        if self.bib_index is not None:
+            return self.query_bib_index(tika_dict, query_dict)
+        return self.query_ads_database(query_str)
 
-        # Query the ADS database
-        ads_dict = self.query_ads_database(query_str)
+    @staticmethod
+    def attach(tika_dict, ads_dict):
+        """
+        Adds an ADS record to the metadata of a document parsed by TIKA
+        :param tika_dict: dictionary returned by parse_tika()
+        :param ads_dict: ADS record dictionary returned by lookup()
+        :return: tika_dict
+        """
         if len(ads_dict) == 0:
             return tika_dict
 
@@ -191,74 +266,65 @@ class AdsParser(TikaParser):
         return tika_dict
 
 
+class AdsEnrichment(object):
+    """ The pending ADS lookup of a document submitted to an
+    AdsEnrichmentStage
+    """
+    def __init__(self, tika_dict, result):
+        self.tika_dict = tika_dict
+        self.result = result
+
+    def get(self, timeout=None):
+        """
+        Waits for the ADS lookup to complete and attaches the ADS record to
+        the document. Exceptions raised by the lookup are raised here.
+        :return: the document dictionary
+        """
+        return AdsParser.attach(self.tika_dict, self.result.get(timeout))
+
+
+class AdsEnrichmentStage(object):
+    """ The AdsEnrichmentStage runs the ADS lookups of documents already
+    parsed by TIKA in a pool of threads, so that the network round trips to
+    the ADS database overlap with the TIKA parsing and the downstream
+    processing (e.g., CoreNLP) of this and other documents.
+    """
+    def __init__(self, ads_parser, workers=4):
+        self.ads_parser = ads_parser
+        self.pool = ThreadPool(workers)
+
+    def submit(self, tika_dict, query_dict=None):
+        """
+        Queues the ADS lookup of a document
+        :param tika_dict: dictionary returned by AdsParser.parse_tika()
+        :param query_dict: see AdsParser.construct_query_string()
+        :return: AdsEnrichment, whose get() returns the document with the ADS
+        metadata attached
+        """
+        result = self.pool.apply_async(self.ads_parser.lookup,
+                                       (tika_dict, query_dict))
+        return AdsEnrichment(tika_dict, result)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
 def process(in_file, in_list, out_file, log_file, tika_server_url, ads_url,
-            ads_token):
-    # Log input parameters
-    logger = LogUtil('ads-parser', log_file)
-    logger.info('Input parameters')
-    logger.info('in_file: %s' % in_file)
-    logger.info('in_list: %s' % in_list)
-    logger.info('out_file: %s' % out_file)
-    logger.info('tika_server_url: %s' % tika_server_url)
-    logger.info('ads_url: %s' % ads_url)
-    logger.info('ads_token: %s' % ads_token)
-    if in_file and in_list:
-        print('[ERROR] in_file and in_list cannot be provided simultaneously')
-        sys.exit(1)
-
-    ads_parser = AdsParser(ads_token, ads_url, tika_server_url)
-
-    if in_file:
-        files = [in_file]
-    else:
-        files = read_lines(in_list)
-
-    out_f = open(out_file, 'wb', 1)
-    for f in tqdm(files):
-        logger.info('Processing %s' % os.path.basename(f))
-        try:
-            ads_dict = ads_parser.parse(f)
-
-            out_f.write(json.dumps(ads_dict))
-            out_f.write('\n')
-        except Exception as e:
-            logger.info('ADS parser failed: %s' % os.path.abspath(f))
-            logger.error(e)
-
-    out_f.close()
+            ads_token, **options):
+    args = pipeline_args(['ads'], options, in_file=in_file, in_list=in_list,
+                         out_file=out_file, log_file=log_file,
+                         tika_server_url=tika_server_url, ads_url=ads_url,
+                         ads_token=ads_token)
+    pipeline = Pipeline(args, 'ADS parser')
+    pipeline.run()
 
 
 def main():
     import argparse
 
     parser = argparse.ArgumentParser()
-    input_parser = parser.add_mutually_exclusive_group(required=True)
-
-    input_parser.add_argument('-i', '--in_file', help='Path to input file')
-    input_parser.add_argument('-li', '--in_list', help='Path to input list')
-    parser.add_argument('-o', '--out_file', required=True,
-                        help='Path to output JSON file')
-    parser.add_argument('-l', '--log_file', default='./ads-parser-log.txt',
-                        help='Log file that contains processing information. '
-                             'It is default to ./ads-parser-log.txt unless '
-                             'otherwise specified.')
-    parser.add_argument('-p', '--tika_server_url', required=False,
-                        help='Tika server URL')
-    parser.add_argument('-a', '--ads_url',
-                        default='https://api.adsabs.harvard.edu/v1/search/query',
-                        help='ADS RESTful API. The ADS RESTful API should not '
-                             'need to be changed frequently unless someting at '
-                             'the ADS is changed.')
-    parser.add_argument('-t', '--ads_token',
-                        default='jON4eu4X43ENUI5ugKYc6GZtoywF376KkKXWzV8U',
-                        help='The ADS token, which is required to use the ADS '
-                             'RESTful API. The token was obtained using the '
-                             'instructions at '
-                             'https://github.com/adsabs/adsabs-dev-api#access. '
-                             'The ADS token should not need to be changed '
-                             'frequently unless something at the ADS is '
-                             'changed.')
-
+    add_pipeline_args(parser, './ads-parser-log.txt', stages=['ads'])
     args = parser.parse_args()
     process(**vars(args))
 
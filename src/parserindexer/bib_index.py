@@ -0,0 +1,192 @@
+from __future__ import print_function
+
+import re
+import csv
+import json
+import math
+from collections import defaultdict
+
+
+class BibIndex(object):
+    """
+    An offline index of bibliographic records (e.g., a bulk export of the ADS
+    database), in which titles are matched approximately using character
+    trigrams. Each record is a dictionary with the ADS fields returned by
+    AdsParser.query_ads_database: title, first_author, author, aff, pub,
+    year, pubdate, and optionally page.
+
+    The similarity of two titles is the Dice coefficient of their sets of
+    character trigrams, 2 * |A & B| / (|A| + |B|), computed on titles that are
+    lower-cased and stripped of punctuation.
+    """
+
+    # Fields that are lists in ADS records. In CSV files, their values are
+    # separated by semicolons.
+    LIST_FIELDS = ['title', 'author', 'aff', 'page']
+
+    def __init__(self, threshold=0.8):
+        """
+        :param threshold: minimum similarity of a match, between 0 and 1
+        """
+        self.threshold = threshold
+        self.records = []
+        self.grams = []
+        self.postings = defaultdict(list)
+        self.pages = defaultdict(list)
+
+    @staticmethod
+    def normalize(title):
+        title = re.sub(r'[\W_]+', ' ', title.lower(), flags=re.UNICODE)
+        return title.strip()
+
+    @staticmethod
+    def trigrams(title):
+        """
+        Gets the character trigrams of a title
+        :param title: title string
+        :return: set of trigrams of the normalized title, padded with spaces
+        so that short words and word boundaries count
+        """
+        padded = ' %s ' % BibIndex.normalize(title)
+        return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def add(self, record):
+        """
+        Adds a record to the index
+        :param record: dictionary with ADS fields
+        """
+        record_id = len(self.records)
+        titles = record.get('title') or ['']
+        grams = self.trigrams(titles[0])
+        self.records.append(record)
+        self.grams.append(grams)
+        for gram in grams:
+            self.postings[gram].append(record_id)
+        for page in record.get('page', []):
+            self.pages[(str(record.get('year')), page)].append(record_id)
+
+    def load(self, path):
+        """
+        Adds the records of a dump file to the index
+        :param path: a CSV file with a header row, a JSON file having a list
+        of records or an ADS API response, or a file having one JSON record
+        per line
+        :return: number of records added
+        """
+        count = len(self.records)
+        for record in read_records(path):
+            self.add(record)
+        return len(self.records) - count
+
+    def candidates(self, grams):
+        """
+        Finds the records that may be similar enough to a set of trigrams.
+        A record similar enough shares at least min_common trigrams with the
+        query, so it has to share one with any len(grams) - min_common + 1
+        of them: only the postings of that many trigrams, the rarest ones,
+        need to be scanned.
+        """
+        min_common = int(math.ceil(self.threshold * (len(grams) + 1) / 2.0))
+        prefix_size = max(1, len(grams) - min_common + 1)
+        rarest = sorted(grams, key=lambda g: len(self.postings.get(g, ())))
+        record_ids = set()
+        for gram in rarest[:prefix_size]:
+            record_ids.update(self.postings.get(gram, ()))
+        return record_ids
+
+    def match(self, title):
+        """
+        Finds the record whose title is the most similar to a title
+        :param title: title string (e.g., a grobid title)
+        :return: (record, similarity) of the best match, or (None, similarity
+        of the best candidate) if no record is similar enough
+        """
+        grams = self.trigrams(title)
+        best_id = None
+        best_score = 0.0
+        for record_id in self.candidates(grams):
+            record_grams = self.grams[record_id]
+            score = 2.0 * len(grams & record_grams) / (len(grams) +
+                                                       len(record_grams))
+            # Ties go to the record loaded first, as ADS results are ranked
+            if best_id is None or score > best_score or \
+                    (score == best_score and record_id < best_id):
+                best_id = record_id
+                best_score = score
+
+        if best_id is None or best_score < self.threshold:
+            return None, best_score
+        return self.records[best_id], best_score
+
+    def find_page(self, year, page):
+        """
+        Finds the records published in a year at a page (e.g., the abstract
+        number of an LPSC abstract)
+        :return: list of records
+        """
+        return [self.records[record_id]
+                for record_id in self.pages.get((str(year), str(page)), [])]
+
+
+def read_records(path):
+    if path.lower().endswith('.csv'):
+        with open(path, 'r') as f:
+            for row in csv.DictReader(f):
+                for field in BibIndex.LIST_FIELDS:
+                    if row.get(field) is not None:
+                        row[field] = [v.strip() for v in row[field].split(';')]
+                yield row
+        return
+
+    with open(path, 'r') as f:
+        text = f.read()
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # One JSON record per line
+        for line in text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+        return
+
+    if isinstance(data, dict):
+        data = data['response']['docs']
+    for record in data:
+        yield record
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Matches titles against an '
+                                     'offline bibliographic index and prints '
+                                     'the similarity of the best match of '
+                                     'each title, to tune the threshold')
+    parser.add_argument('-b', '--bib_file', required=True, nargs='+',
+                        help='Path(s) to bibliographic dump files (CSV, JSON '
+                             'or JSON lines)')
+    parser.add_argument('-q', '--titles_file', required=True,
+                        help='Path to a file having titles, one per line')
+    parser.add_argument('-th', '--threshold', type=float, default=0.0,
+                        help='Minimum similarity of the matches printed. '
+                             'Default is 0 (print the best candidate of every '
+                             'title)')
+
+    args = parser.parse_args()
+    bib_index = BibIndex(args.threshold)
+    for bib_file in args.bib_file:
+        bib_index.load(bib_file)
+
+    with open(args.titles_file, 'r') as f:
+        for title in f:
+            title = title.strip()
+            if not title:
+                continue
+            record, score = bib_index.match(title)
+            matched_title = record['title'][0] if record else ''
+            print('%.3f\t%s\t%s' % (score, title, matched_title))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import os
+import json
+import zlib
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class DiskCache(object):
+    """
+    A persistent cache of JSON-serializable objects. Each entry is stored as a
+    zlib-compressed JSON file named after its key. When the total size of the
+    cache exceeds `max_size` bytes, the least recently used entries are evicted.
+    The cache directory can be shared by several processes.
+    """
+
+    EXTENSION = '.json.z'
+
+    def __init__(self, cache_dir, max_size=None):
+        """
+        :param cache_dir: directory where the cache entries are stored
+        :param max_size: maximum total size of the cache in bytes. None means
+        the cache size is not limited
+        """
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.size = sum(size for _, _, size in self.entries())
+
+    @staticmethod
+    def key(*parts):
+        """
+        Builds a cache key from one or more strings
+        :param parts: strings that together identify a cache entry
+        :return: hex digest used as the cache key
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = part.encode('utf8')
+            digest.update(part)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + self.EXTENSION)
+
+    def entries(self):
+        """
+        Lists the entries stored in the cache
+        :return: stream of (path, last access time, size in bytes) tuples
+        """
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith(self.EXTENSION):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """
+        Looks up an entry
+        :param key: cache key
+        :return: the cached object, or None if the key is not in the cache
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = json.loads(zlib.decompress(f.read()).decode('utf8'))
+            # The modification time records the last access for LRU eviction
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, zlib.error):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Stores an entry, evicting least recently used entries if the cache
+        grows beyond its maximum size
+        :param key: cache key
+        :param value: JSON-serializable object
+        """
+        path = self.path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # Created by another thread or process in the meantime
+                pass
+
+        data = zlib.compress(json.dumps(value).encode('utf8'))
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(),
+                                     threading.current_thread().ident)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.rename(tmp_path, path)
+
+        with self.lock:
+            self.size += len(data) - old_size
+            if self.max_size is not None and self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        # Evict down to 90% of the maximum size, so that a full cache does
+        # not rescan the cache directory on every put.
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        self.size = sum(size for _, _, size in entries)
+        target_size = int(self.max_size * 0.9)
+        for path, _, size in entries:
+            if self.size <= target_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def stats(self):
+        return 'hits: %d, misses: %d, size: %d bytes' % (self.hits,
+                                                          self.misses,
+                                                          self.size)
+
+
+class SqliteCache(object):
+    """
+    A persistent cache of JSON-serializable objects stored in a SQLite
+    database, with an optional time to live. Empty values (e.g., a query that
+    found no document) are cached too, with their own time to live, so that
+    they are not looked up again on every run.
+    """
+
+    def __init__(self, db_file, ttl=None, negative_ttl=None):
+        """
+        :param db_file: path to the SQLite database file
+        :param ttl: number of seconds an entry stays valid. None means entries
+        never expire
+        :param negative_ttl: number of seconds an empty value stays valid.
+        None means the same as ttl
+        """
+        self.db_file = db_file
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        # The connection is shared by the worker threads and serialized by
+        # the lock. Autocommit mode makes every put durable right away.
+        self.conn = sqlite3.connect(db_file, timeout=60,
+                                    check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                          'key TEXT PRIMARY KEY, '
+                          'value TEXT NOT NULL, '
+                          'expires REAL)')
+
+    def get(self, key):
+        """
+        Looks up an entry
+        :param key: cache key
+        :return: the cached object, or None if the key is not in the cache or
+        the entry has expired
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT value, expires FROM entries '
+                                    'WHERE key = ?', (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < time.time()):
+                self.misses += 1
+                return None
+
+            value = json.loads(row[0])
+            if value:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores an entry, replacing any previous entry with the same key
+        :param key: cache key
+        :param value: JSON-serializable object
+        """
+        ttl = self.ttl if value else self.negative_ttl
+        expires = None if ttl is None else time.time() + ttl
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO entries '
+                              '(key, value, expires) VALUES (?, ?, ?)',
+                              (key, json.dumps(value), expires))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def stats(self):
+        return 'hits: %d, negative hits: %d, misses: %d' % (
+            self.hits, self.negative_hits, self.misses)
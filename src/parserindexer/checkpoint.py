@@ -0,0 +1,132 @@
+import os
+import json
+import threading
+from ioutils import file_sha256
+
+
+class Checkpoint(object):
+    """
+    A manifest of the input files a parser has completed or failed, used to
+    resume an interrupted run. Each line of the manifest is
+    `<status>\t<sha256 of the file content>\t<absolute path>`. Lines are
+    appended as documents finish, and the last line for a path wins.
+    """
+
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    def __init__(self, manifest_file, resume=False):
+        """
+        :param manifest_file: path to the manifest file
+        :param resume: if True, load the existing manifest and keep appending
+        to it. Otherwise, start a new manifest
+        """
+        self.manifest_file = manifest_file
+        self.entries = dict()
+        # Digests of the files being processed, computed when they were
+        # selected
+        self.digests = dict()
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t', 2)
+                    # Skip a line truncated by a crash
+                    if len(parts) != 3 or not line.endswith('\n'):
+                        continue
+                    status, digest, path = parts
+                    self.entries[path] = (status, digest)
+
+        self.manifest = open(manifest_file, 'a' if resume else 'w')
+
+    def current_paths(self):
+        """
+        Finds the files completed before whose content has not changed since.
+        Completed files that no longer exist keep their records.
+        :return: (set of the absolute paths of the current completed files,
+        number of completed files changed since)
+        """
+        current = set()
+        stale = 0
+        for path, (status, digest) in self.entries.items():
+            if status != Checkpoint.COMPLETED:
+                continue
+            if os.path.exists(path) and file_sha256(path) != digest:
+                stale += 1
+                continue
+            current.add(path)
+
+        return current, stale
+
+    def pending(self, files, current_paths):
+        """
+        Filters the input files lazily, so that a crawled directory is still
+        streamed
+        :param files: iterable of input file paths
+        :param current_paths: set returned by current_paths()
+        :return: generator of the files to process: the files not completed
+        before, the ones that failed, and the completed ones changed since
+        """
+        for f in files:
+            path = os.path.abspath(f)
+            if path in current_paths:
+                continue
+            if path in self.entries and os.path.exists(f):
+                # The content is hashed when the file is selected, and the
+                # digest is recorded once the file is processed
+                self.digests[path] = file_sha256(f)
+            yield f
+
+    def record(self, f, status):
+        path = os.path.abspath(f)
+        with self.lock:
+            digest = self.digests.pop(path, None)
+        if digest is None:
+            digest = file_sha256(f) if os.path.exists(f) else ''
+        with self.lock:
+            self.entries[path] = (status, digest)
+            self.manifest.write('%s\t%s\t%s\n' % (status, digest, path))
+            self.manifest.flush()
+
+    def completed(self, f):
+        self.record(f, Checkpoint.COMPLETED)
+
+    def failed(self, f):
+        self.record(f, Checkpoint.FAILED)
+
+    def close(self):
+        self.manifest.close()
+
+    @staticmethod
+    def prepare_output(out_file, current_paths):
+        """
+        Prepares an existing JSON lines output file for appending: keeps only
+        the records of the files the manifest marks completed and that have
+        not changed since. This removes a trailing record truncated by a
+        crash, the record of a file written just before a crash but not yet
+        marked completed (which is going to be processed again), and the
+        records of stale files.
+        :param out_file: path to the JSON lines output file
+        :param current_paths: set returned by current_paths()
+        :return: number of records removed
+        """
+        if not os.path.exists(out_file) or os.path.getsize(out_file) == 0:
+            return 0
+
+        removed = 0
+        tmp_file = '%s.tmp' % out_file
+        with open(out_file, 'rb') as in_f, open(tmp_file, 'wb') as out_f:
+            for line in in_f:
+                if not line.endswith(b'\n') or \
+                        json.loads(line.decode('utf8'))['file'] \
+                        not in current_paths:
+                    removed += 1
+                    continue
+                out_f.write(line)
+
+        if removed > 0:
+            os.rename(tmp_file, out_file)
+        else:
+            os.remove(tmp_file)
+        return removed
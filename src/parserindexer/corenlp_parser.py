@@ -1,34 +1,191 @@
 from __future__ import print_function
 
 import os
+import re
 import sys
 import json
+import time
 import urllib
+import requests
 import itertools
-from tqdm import tqdm
-from utils import LogUtil
+import threading
+from utils import Batcher
+from utils import parallel_map
+from spans import merge_pairs
 from parser import Parser
-from ioutils import read_lines
-from ads_parser import AdsParser
-from pycorenlp import StanfordCoreNLP
+from cache import DiskCache
+from ioutils import file_sha256
+from pipeline import Pipeline
+from pipeline import add_pipeline_args
+from pipeline import pipeline_args
+from corenlp_tokens import decode_document
+from corenlp_tokens import plain_sentences
+from corenlp_tokens import protobuf_available
+from corenlp_tokens import PROTOBUF_SERIALIZER
 
 # The following two lines make CoreNLP happy
 reload(sys)
 sys.setdefaultencoding('UTF8')
 
 
+class CoreNLPClient(object):
+    """ The CoreNLPClient class annotates texts with one or more CoreNLP
+    servers. Unlike pycorenlp, it keeps its HTTP connections alive and can be
+    shared by several threads, with up to max_concurrency requests in flight.
+    Requests go to the server with the fewest requests in flight, and to the
+    next server if a server cannot be reached. A server that cannot be
+    reached is tried last for retry_after seconds.
+    """
+
+    def __init__(self, server_urls, max_concurrency=4, timeout=90,
+                 retry_after=30):
+        """
+        Args:
+            server_urls (str): CoreNLP server URL, or several comma-separated
+                URLs
+            max_concurrency (int): Maximum number of requests in flight.
+            timeout (float): Timeout of a request in seconds. It should be
+                longer than the 'timeout' property of the CoreNLP server.
+            retry_after (float): Number of seconds a server that cannot be
+                reached is tried last.
+        """
+        self.server_urls = [url.strip().rstrip('/')
+                            for url in server_urls.split(',') if url.strip()]
+        if len(self.server_urls) == 0:
+            raise RuntimeError('At least one CoreNLP server URL is required')
+
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.in_flight = dict((url, 0) for url in self.server_urls)
+        self.down_until = dict((url, 0) for url in self.server_urls)
+        self.next_index = 0
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(self.server_urls),
+            pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def servers(self):
+        """ Orders the servers to try for a request, least loaded first. Ties
+        are broken round robin.
+        """
+        with self.lock:
+            start = self.next_index % len(self.server_urls)
+            self.next_index += 1
+            urls = self.server_urls[start:] + self.server_urls[:start]
+            now = time.time()
+            return sorted(urls, key=lambda url: (self.down_until[url] > now,
+                                                 self.in_flight[url]))
+
+    def annotate(self, text, properties=None):
+        """ Annotates a text, like pycorenlp.StanfordCoreNLP.annotate()
+
+        Args:
+            text (str): Text, percent-encoded.
+            properties (dict): CoreNLP properties.
+        Return:
+            this function returns the decoded output if the 'outputFormat'
+            property is 'json' or 'serialized' (protobuf) and the request
+            succeeded, and the text of the response (e.g., an error message)
+            otherwise
+        """
+        if properties is None:
+            properties = {}
+
+        with self.semaphore:
+            response = None
+            urls = self.servers()
+            for url in urls:
+                with self.lock:
+                    self.in_flight[url] += 1
+                try:
+                    response = self.session.post(
+                        url, params={'properties': str(properties)},
+                        data=text, timeout=self.timeout)
+                    break
+                except requests.exceptions.ConnectionError:
+                    with self.lock:
+                        self.down_until[url] = time.time() + self.retry_after
+                    if url == urls[-1]:
+                        raise RuntimeError('CoreNLP server not reachable at '
+                                           '%s' % ', '.join(urls))
+                except requests.exceptions.Timeout:
+                    # Report a client timeout like a server timeout
+                    return 'CoreNLP request timed out after %s seconds' % \
+                           self.timeout
+                finally:
+                    with self.lock:
+                        self.in_flight[url] -= 1
+
+        if properties.get('outputFormat') == 'serialized' and \
+                response.status_code == 200:
+            return decode_document(response.content)
+
+        output = response.text
+        if properties.get('outputFormat') == 'json':
+            try:
+                output = json.loads(output, strict=True)
+            except ValueError:
+                pass
+        return output
+
+
 class CoreNLPParser(Parser):
     """ The CoreNLPParser class builds upon Stanford CoreNLP package """
 
     CORENLP_PARSER = "edu.stanford.nlp.pipeline.CoreNLPServer"
+    # Token separating the documents annotated together by parse_batch(). It
+    # is a sentence boundary discarded by the sentence splitter, so it never
+    # shows up in the sentences or merges sentences of different documents.
+    BATCH_SEPARATOR_TOKEN = 'CoreNLPBatchSeparator'
+    BATCH_SEPARATOR = '\n\n%s\n\n' % BATCH_SEPARATOR_TOKEN
+
+    # CoreNLP annotators, in pipeline order, with the annotators they
+    # require. The NER models used here are trained on word features only
+    # (see src/corenlp/README.md), and SUTime and the numeric classifiers,
+    # which need POS tags and lemmas, are turned off, so NER does not need
+    # the pos and lemma annotators.
+    ANNOTATORS = [
+        ('tokenize', []),
+        ('ssplit', ['tokenize']),
+        ('pos', ['tokenize', 'ssplit']),
+        ('lemma', ['tokenize', 'ssplit', 'pos']),
+        ('ner', ['tokenize', 'ssplit'])
+    ]
+    # Annotator producing each token field
+    FIELD_ANNOTATORS = {
+        'word': 'tokenize',
+        'originalText': 'tokenize',
+        'characterOffsetBegin': 'tokenize',
+        'characterOffsetEnd': 'tokenize',
+        'before': 'tokenize',
+        'after': 'tokenize',
+        'index': 'ssplit',
+        'pos': 'pos',
+        'lemma': 'lemma',
+        'ner': 'ner'
+    }
+    # Token fields read by the parser. Subclasses declare the fields they
+    # read, and CoreNLP only runs the annotators producing them.
+    TOKEN_FIELDS = ['originalText', 'characterOffsetBegin',
+                    'characterOffsetEnd', 'ner']
+    # Token fields of the sentences written to the output files, which are
+    # annotated even if the parser does not read them, unless
+    # enable_minimal_annotators() is called
+    OUTPUT_TOKEN_FIELDS = ['pos', 'lemma']
 
     def __init__(self, corenlp_server_url, ner_model,
-                 parser_name='corenlp_parser'):
+                 parser_name='corenlp_parser', corenlp_concurrency=4):
         super(CoreNLPParser, self).__init__(parser_name)
 
-        self.corenlp = StanfordCoreNLP(corenlp_server_url)
+        self.corenlp = CoreNLPClient(corenlp_server_url, corenlp_concurrency)
         self.props = {
-            'annotators': 'tokenize,ssplit,lemma,pos,ner',
+            'annotators': ','.join(self.plan_annotators(
+                self.TOKEN_FIELDS + self.OUTPUT_TOKEN_FIELDS)),
             'outputFormat': 'json',
             # dont want SUTime model
             'ner.useSUTime': False,
@@ -45,6 +202,140 @@ class CoreNLPParser(Parser):
                                    os.path.abspath(ner_model))
             self.props['ner.model'] = ner_model
 
+        # Chunking mode of long documents, see enable_chunking()
+        self.chunk_chars = None
+        self.chunk_workers = 1
+        self.min_chunk_chars = 1000
+
+        # Persistent cache of annotations, see enable_cache()
+        self.annotation_cache = None
+        self.cache_props = None
+        self.ner_model_sha256 = None
+
+        # Batches of the documents parsed concurrently, see
+        # enable_document_batching()
+        self.document_batcher = None
+
+    def enable_protobuf(self):
+        """ Requests the protobuf output of CoreNLP rather than its JSON
+        output. The output is several times smaller, and the tokens are
+        decoded into compact CoreNLPToken objects rather than dictionaries.
+        The sentences returned have to be serialized with json_default.
+        """
+        if not protobuf_available():
+            raise RuntimeError('The protobuf output of CoreNLP requires the '
+                               'corenlp-protobuf package')
+
+        self.props['outputFormat'] = 'serialized'
+        self.props['serializer'] = PROTOBUF_SERIALIZER
+        if self.annotation_cache is not None:
+            self.cache_props = self.annotation_props()
+
+    def enable_minimal_annotators(self):
+        """ Runs only the CoreNLP annotators producing the token fields read
+        by the parser (TOKEN_FIELDS), which is faster. The sentences returned
+        lack the other fields (e.g., CoreNLPParser sentences have no pos and
+        lemma fields).
+        """
+        self.props['annotators'] = ','.join(
+            self.plan_annotators(self.TOKEN_FIELDS))
+        if self.annotation_cache is not None:
+            self.cache_props = self.annotation_props()
+
+    @classmethod
+    def plan_annotators(cls, token_fields):
+        """ Finds the CoreNLP annotators needed to produce token fields
+
+        Args:
+            token_fields (list): Names of token fields (e.g., 'word', 'ner').
+        Return:
+            this function returns the list of the annotators producing the
+            token fields and of the annotators they require, in pipeline
+            order. Sentences are always split, as the parsers read the
+            tokens sentence by sentence.
+        """
+        requirements = dict(cls.ANNOTATORS)
+        needed = set()
+        pending = ['ssplit'] + [cls.FIELD_ANNOTATORS[field]
+                                for field in token_fields]
+        while len(pending) > 0:
+            annotator = pending.pop()
+            if annotator not in needed:
+                needed.add(annotator)
+                pending.extend(requirements[annotator])
+
+        return [annotator for annotator, _ in cls.ANNOTATORS
+                if annotator in needed]
+
+    def enable_chunking(self, chunk_chars, workers=4, min_chunk_chars=1000):
+        """ Annotates the documents longer than chunk_chars characters in
+        chunks, so that long documents do not time out or occupy a single
+        CoreNLP server thread
+
+        Args:
+            chunk_chars (int): Maximum number of characters of a chunk.
+            workers (int): Number of chunks of a document annotated
+                concurrently.
+            min_chunk_chars (int): Chunks that time out are split again,
+                unless they are shorter than this.
+        """
+        self.chunk_chars = chunk_chars
+        self.chunk_workers = workers
+        self.min_chunk_chars = min_chunk_chars
+
+    def enable_document_batching(self, batch_size=16, batch_chars=100000,
+                                 batch_wait=0.5, submitters=None):
+        """ Annotates the documents parsed at about the same time by
+        different threads (e.g., with --workers) together, several documents
+        per CoreNLP request (see parse_batch()), so that short documents do
+        not each pay for a round trip to the CoreNLP server. The sentences and
+        offsets of each document are the same as if it were annotated alone.
+        Documents annotated in chunks (see enable_chunking()) are not batched.
+
+        Args:
+            batch_size (int): Maximum number of documents of a batch.
+            batch_chars (int): Number of characters from which a batch is
+                sent without waiting for more documents, and maximum number of
+                characters of the documents sent in one request.
+            batch_wait (float): Number of seconds a batch waits for more
+                documents.
+            submitters (int): Number of threads parsing documents (e.g.,
+                --workers), so that a batch is sent once all of them are
+                waiting for it. None if unknown.
+        """
+        self.document_batcher = Batcher(
+            lambda texts: self.parse_batch(texts, batch_chars), batch_size,
+            batch_wait, batch_chars, submitters=submitters)
+
+    def enable_cache(self, annotation_cache):
+        """ Caches the CoreNLP annotations of the documents, so that a
+        document annotated before (e.g., by a run with another jSRE or unary
+        model) is not sent to the CoreNLP server again. The annotations are
+        keyed by the text, the annotation properties (including the output
+        format, as JSON and protobuf runs cache different token objects) and
+        the checksum of the NER model file, so retraining the NER model
+        invalidates them.
+
+        Args:
+            annotation_cache (DiskCache): Cache storing the CoreNLP sentences.
+        """
+        if 'ner.model' in self.props:
+            self.ner_model_sha256 = file_sha256(self.props['ner.model'])
+
+        self.annotation_cache = annotation_cache
+        self.cache_props = self.annotation_props()
+
+    def annotation_props(self):
+        """ Returns the annotation properties keying the cached annotations
+        """
+        # The timeout does not change the annotations
+        props = dict((k, v) for k, v in self.props.items() if k != 'timeout')
+        if 'ner.model' in props:
+            props['ner.model.sha256'] = self.ner_model_sha256
+            del props['ner.model']
+
+        return json.dumps(props, sort_keys=True)
+
     def parse(self, text):
         """ Named entity recognition (NER) using stanford CoreNLP package
 
@@ -55,17 +346,293 @@ class CoreNLPParser(Parser):
             this function returns a dictionary contains the NERs identified,
             sentences extracted, and name of the source parser
         """
+        text = self.prepare_text(text)
+        if self.document_batcher is not None and \
+                (self.chunk_chars is None or len(text) <= self.chunk_chars):
+            return self.document_batcher.submit(text)
+
+        key = None
+        if self.annotation_cache is not None:
+            key = DiskCache.key(text, self.cache_props)
+            sentences = self.annotation_cache.get(key)
+            if sentences is not None:
+                return self.build_result(sentences)
+
+        if self.chunk_chars is not None and len(text) > self.chunk_chars:
+            sentences = self.annotate_chunked(text)
+        else:
+            # Quote (with percent-encoding) reserved characters in URL for
+            # CoreNLP
+            output = self.corenlp.annotate(urllib.quote(text),
+                                           properties=self.props)
+            sentences = output['sentences']
+
+        if key is not None:
+            self.annotation_cache.put(key, plain_sentences(sentences))
+
+        return self.build_result(sentences)
+
+    @staticmethod
+    def split_text(text, max_chars):
+        """ Splits a text into chunks of at most max_chars characters,
+        preferably at paragraph breaks, then at sentence ends, then between
+        words. The whitespace at a split is left at the end of the previous
+        chunk, so that every chunk but the first starts with a word.
+
+        Return:
+            this function returns a list of (offset, chunk) tuples, whose
+            chunks concatenate back to the text
+        """
+        chunks = []
+        start = 0
+        while len(text) - start > max_chars:
+            window = text[start:start + max_chars]
+            cut = 0
+            for boundary in (r'\n\s*\n', r'[.!?]\s', r'\s'):
+                ends = [m.end() for m in re.finditer(boundary, window)]
+                # Split at the last boundary, unless it makes a tiny chunk
+                if len(ends) > 0 and ends[-1] > max_chars // 4:
+                    cut = ends[-1]
+                    break
+            if cut == 0:
+                # No boundary: split within a word, but not within a UTF-8
+                # character
+                cut = max_chars
+                while cut > 1 and (ord(text[start + cut]) & 0xC0) == 0x80:
+                    cut -= 1
+            while start + cut < len(text) and text[start + cut].isspace():
+                cut += 1
+
+            chunks.append((start, text[start:start + cut]))
+            start += cut
+
+        if start < len(text):
+            chunks.append((start, text[start:]))
+
+        return chunks
+
+    def annotate_chunk(self, chunk):
+        """ Annotates a chunk of a document, splitting it again if CoreNLP
+        times out
+
+        Return:
+            this function returns a list of (offset in chunk, CoreNLP
+            sentences) tuples
+        """
+        output = self.corenlp.annotate(urllib.quote(chunk),
+                                       properties=self.props)
+        # The error message of the server is returned if the request failed
+        if isinstance(output, dict):
+            return [(0, output['sentences'])]
+        if 'timed out' not in output or len(chunk) <= self.min_chunk_chars:
+            raise RuntimeError('CoreNLP failed annotating a chunk of %d '
+                               'characters: %s' % (len(chunk), output))
+
+        sentences = []
+        for offset, sub_chunk in self.split_text(chunk, len(chunk) // 2):
+            for sub_offset, sub_sentences in self.annotate_chunk(sub_chunk):
+                sentences.append((offset + sub_offset, sub_sentences))
+
+        return sentences
+
+    def annotate_chunked(self, text):
+        """ Annotates a long document, whose chunks are annotated
+        concurrently and stitched back together with the character offsets,
+        sentence indices and token indices of the whole document
+
+        Args:
+            text (str): A string prepared by prepare_text().
+        Return:
+            this function returns the CoreNLP sentences of the document
+        """
+        chunks = self.split_text(text, self.chunk_chars)
+        results = parallel_map(lambda chunk: self.annotate_chunk(chunk[1]),
+                               chunks, self.chunk_workers)
+
+        sentences = []
+        token_count = 0
+        for (offset, _), chunk_sentences in results:
+            for sub_offset, sub_sentences in chunk_sentences:
+                if len(sub_sentences) == 0:
+                    continue
+                chunk_offset = offset + sub_offset
+                self.shift_sentences(sub_sentences,
+                                     self.java_len(text[:chunk_offset]),
+                                     len(sentences), token_count)
+                # The whitespace before the chunk is in the previous chunk
+                before = text[max(0, chunk_offset - 100):chunk_offset]
+                sub_sentences[0]['tokens'][0]['before'] = \
+                    before[len(before.rstrip()):]
+                token_count += sum(len(s['tokens']) for s in sub_sentences)
+                sentences.extend(sub_sentences)
+
+        return sentences
+
+    @staticmethod
+    def prepare_text(text):
         if type(text) != str:
             text = text.encode('utf8')
         if text[0].isspace():  # dont strip white spaces
             text = '.' + text[1:]
 
-        # Quote (with percent-encoding) reserved characters in URL for CoreNLP
-        text = urllib.quote(text)
-        output = self.corenlp.annotate(text, properties=self.props)
+        return text
 
+    @staticmethod
+    def java_len(text):
+        """ Length of a UTF-8 string in Java characters (UTF-16 code units),
+        the unit of the character offsets returned by CoreNLP
+        """
+        return len(text.decode('utf8', 'replace').encode('utf-16-le')) // 2
+
+    @staticmethod
+    def shift_sentences(sentences, char_offset, sentence_offset,
+                        token_offset):
+        """ Shifts, in place, the character offsets, sentence indices and
+        document token indices of CoreNLP sentences, e.g. to re-base the
+        sentences of a document annotated as part of a larger text
+
+        Args:
+            sentences (list): CoreNLP sentence dictionaries
+            char_offset (int): number of characters added to the offsets
+            sentence_offset (int): number added to the sentence indices
+            token_offset (int): number added to the document token indices
+        """
+        for sentence in sentences:
+            sentence['index'] += sentence_offset
+            for token in sentence['tokens']:
+                token['characterOffsetBegin'] += char_offset
+                token['characterOffsetEnd'] += char_offset
+            for mention in sentence.get('entitymentions', []):
+                mention['characterOffsetBegin'] += char_offset
+                mention['characterOffsetEnd'] += char_offset
+                if 'docTokenBegin' in mention:
+                    mention['docTokenBegin'] += token_offset
+                    mention['docTokenEnd'] += token_offset
+
+    @staticmethod
+    def batches(texts, max_chars):
+        """ Groups texts into batches of at most max_chars characters. A text
+        longer than max_chars makes a batch on its own.
+        """
+        batch = []
+        batch_chars = 0
+        for text in texts:
+            if len(batch) > 0 and batch_chars + len(text) > max_chars:
+                yield batch
+                batch = []
+                batch_chars = 0
+            batch.append(text)
+            batch_chars += len(text) + len(CoreNLPParser.BATCH_SEPARATOR)
+
+        if len(batch) > 0:
+            yield batch
+
+    def parse_batch(self, texts, max_chars=100000):
+        """ Named entity recognition (NER) of several documents, sending
+        several documents in each CoreNLP request
+
+        Args:
+            texts (list): Strings in which Named Entity Recognition will run.
+            max_chars (int): Maximum number of characters of the documents
+                sent in one request.
+        Return:
+            this function returns a list of dictionaries, one per document, as
+            returned by parse() for each document alone
+        """
+        results = [None] * len(texts)
+        keys = [None] * len(texts)
+        if self.annotation_cache is not None:
+            for i, text in enumerate(texts):
+                if len(text) == 0:
+                    continue
+                keys[i] = DiskCache.key(self.prepare_text(text),
+                                        self.cache_props)
+                sentences = self.annotation_cache.get(keys[i])
+                if sentences is not None:
+                    results[i] = self.build_result(sentences)
+
+        # Only the documents not found in the cache are sent to CoreNLP
+        pending = [i for i, result in enumerate(results) if result is None]
+        pending_results = []
+        for batch in self.batches([texts[i] for i in pending], max_chars):
+            pending_results.extend(self.annotate_batch(batch))
+
+        for i, result in zip(pending, pending_results):
+            results[i] = result
+            if keys[i] is not None:
+                self.annotation_cache.put(keys[i],
+                                          plain_sentences(result['sentences']))
+
+        return results
+
+    def annotate_batch(self, texts):
+        # Empty documents have no sentence
+        indices = [i for i, text in enumerate(texts) if len(text) > 0]
+        results = [self.build_result([]) for _ in texts]
+        if len(indices) == 0:
+            return results
+        texts = [self.prepare_text(texts[i]) for i in indices]
+
+        props = dict(self.props)
+        props['ssplit.boundariesToDiscard'] = '\n,*NL*,%s' % \
+                                              self.BATCH_SEPARATOR_TOKEN
+        text = self.BATCH_SEPARATOR.join(texts)
+        output = self.corenlp.annotate(urllib.quote(text), properties=props)
+
+        # Offsets of the documents in the batch
+        starts = []
+        start = 0
+        separator_len = self.java_len(self.BATCH_SEPARATOR)
+        for text in texts:
+            starts.append(start)
+            start += self.java_len(text) + separator_len
+
+        doc_sentences = [[] for _ in texts]
+        doc = 0
+        for sentence in output['sentences']:
+            begin = sentence['tokens'][0]['characterOffsetBegin']
+            while doc + 1 < len(texts) and begin >= starts[doc + 1]:
+                doc += 1
+            doc_sentences[doc].append(sentence)
+
+        token_base = 0
+        for doc, sentences in enumerate(doc_sentences):
+            if len(sentences) > 0:
+                self.shift_sentences(sentences, -starts[doc],
+                                     -sentences[0]['index'], -token_base)
+                token_base += sum(len(s['tokens']) for s in sentences)
+
+                # The whitespace around a document includes the separator
+                text = texts[doc]
+                sentences[0]['tokens'][0]['before'] = ''
+                sentences[-1]['tokens'][-1]['after'] = \
+                    text[len(text.rstrip()):]
+
+            results[indices[doc]] = self.build_result(sentences)
+
+        return results
+
+    @staticmethod
+    def name_begin(name):
+        return int(name['begin'])
+
+    @staticmethod
+    def name_end(name):
+        return int(name['end'])
+
+    @staticmethod
+    def targets_mergeable(name, next_name):
+        return name['label'] == 'Target' and next_name['label'] == 'Target'
+
+    @staticmethod
+    def merge_names(name, next_name):
+        name['text'] += ' ' + next_name['text']
+        name['end'] = next_name['end']
+
+    @staticmethod
+    def build_result(sentences):
         # flatten sentences and tokens
-        tokenlists = [s['tokens'] for s in output['sentences']]
+        tokenlists = [s['tokens'] for s in sentences]
         tokens = itertools.chain.from_iterable(tokenlists)
         names = []
         for token in tokens:
@@ -82,111 +649,47 @@ class CoreNLPParser(Parser):
         # Handle multi-word tokens:
         # Merge any adjacent Target tokens, if of the same type and
         # separated by a space, into one span.
-        names.sort(key=lambda x: int(x['begin']))
-        new_names = []
-        skip_names = []
-        for n in names:
-            if n in skip_names:
-                continue
-            next_name = [n2 for n2 in names if
-                         n['label'] == 'Target' and
-                         n2['label'] == 'Target' and
-                         int(n2['begin']) == int(n['end']) + 1]
-            if len(next_name) > 0:
-                n['text'] += ' ' + next_name[0]['text']
-                n['end'] = next_name[0]['end']
-                skip_names.append(next_name[0])
-
-            # Either way, save this one
-            new_names.append(n)
+        new_names = merge_pairs(names, CoreNLPParser.name_begin,
+                                CoreNLPParser.name_end,
+                                CoreNLPParser.targets_mergeable,
+                                CoreNLPParser.merge_names)
 
         return {
             'ner': new_names,
             'X-Parsed-By': CoreNLPParser.CORENLP_PARSER,
-            'sentences': output['sentences']
+            'sentences': sentences
         }
 
 
 def process(in_file, in_list, out_file, log_file, tika_server_url,
-            corenlp_server_url, ner_model, ads_url, ads_token):
-    # Log input parameters
-    logger = LogUtil('corenlp-parser', log_file)
-    logger.info('Input parameters')
-    logger.info('in_file: %s' % in_file)
-    logger.info('in_list: %s' % in_list)
-    logger.info('out_file: %s' % out_file)
-    logger.info('tika_server_url: %s' % tika_server_url)
-    logger.info('corenlp_server_url: %s' % corenlp_server_url)
-    logger.info('ner_model: %s' % os.path.abspath(ner_model))
-    logger.info('ads_url: %s' % ads_url)
-    logger.info('ads_token: %s' % ads_token)
-
-    if in_file and in_list:
-        print('[ERROR] in_file and in_list cannot be provided simultaneously')
-        sys.exit(1)
-
-    ads_parser = AdsParser(ads_token, ads_url, tika_server_url)
-    corenlp_parser = CoreNLPParser(corenlp_server_url, ner_model)
-
-    if in_file:
-        files = [in_file]
-    else:
-        files = read_lines(in_list)
-
-    out_f = open(out_file, 'wb', 1)
-    for f in tqdm(files):
-        try:
-            ads_dict = ads_parser.parse(f)
-            corenlp_dict = corenlp_parser.parse(ads_dict['content'])
-
-            ads_dict['metadata']['ner'] = corenlp_dict['ner']
-            ads_dict['metadata']['X-Parsed-By'].append(corenlp_dict['X-Parsed-By'])
-            ads_dict['metadata']['sentences'] = corenlp_dict['sentences']
-
-            out_f.write(json.dumps(ads_dict))
-            out_f.write('\n')
-        except Exception as e:
-            logger.info('CoreNLP parser failed: %s' % os.path.abspath(f))
-            logger.error(e)
-
-    out_f.close()
+            corenlp_server_url, ner_model, ads_url, ads_token, **options):
+    args = pipeline_args(['ads', 'corenlp'], options, in_file=in_file,
+                         in_list=in_list, out_file=out_file,
+                         log_file=log_file, tika_server_url=tika_server_url,
+                         corenlp_server_url=corenlp_server_url,
+                         ner_model=ner_model, ads_url=ads_url,
+                         ads_token=ads_token)
+    pipeline = Pipeline(args, 'CoreNLP parser')
+    corenlp_parser = pipeline.setup_corenlp(CoreNLPParser(
+        args.corenlp_server_url, args.ner_model,
+        corenlp_concurrency=args.corenlp_concurrency))
+
+    def parse_document(f, ads_dict):
+        corenlp_dict = corenlp_parser.parse(ads_dict['content'])
+
+        ads_dict['metadata']['ner'] = corenlp_dict['ner']
+        ads_dict['metadata']['X-Parsed-By'].append(corenlp_dict['X-Parsed-By'])
+        ads_dict['metadata']['sentences'] = pipeline.output_sentences(
+            corenlp_dict['sentences'])
+
+    pipeline.run(parse_document)
 
 
 if __name__ == '__main__':
     import argparse
 
     parser = argparse.ArgumentParser()
-    input_parser = parser.add_mutually_exclusive_group(required=True)
-
-    input_parser.add_argument('-i', '--in_file', help='Path to input file')
-    input_parser.add_argument('-li', '--in_list', help='Path to input list')
-    parser.add_argument('-o', '--out_file', required=True,
-                        help='Path to output JSON file')
-    parser.add_argument('-l', '--log_file', default='./corenlp-parser-log.txt',
-                        help='Log file that contains processing information. '
-                             'It is default to ./corenlp-parser-log.txt unless '
-                             'otherwise specified.')
-    parser.add_argument('-p', '--tika_server_url', required=False,
-                        help='Tika server URL')
-    parser.add_argument('-c', '--corenlp_server_url',
-                        default='http://localhost:9000',
-                        help='CoreNLP Server URL')
-    parser.add_argument('-n', '--ner_model', required=False,
-                        help='Path to a Named Entity Recognition (NER) model ')
-    parser.add_argument('-a', '--ads_url',
-                        default='https://api.adsabs.harvard.edu/v1/search/query',
-                        help='ADS RESTful API. The ADS RESTful API should not '
-                             'need to be changed frequently unless someting at '
-                             'the ADS is changed.')
-    parser.add_argument('-t', '--ads_token',
-                        default='jON4eu4X43ENUI5ugKYc6GZtoywF376KkKXWzV8U',
-                        help='The ADS token, which is required to use the ADS '
-                             'RESTful API. The token was obtained using the '
-                             'instructions at '
-                             'https://github.com/adsabs/adsabs-dev-api#access. '
-                             'The ADS token should not need to be changed '
-                             'frequently unless something at the ADS is '
-                             'changed.')
-
+    add_pipeline_args(parser, './corenlp-parser-log.txt',
+                      stages=['ads', 'corenlp'])
     args = parser.parse_args()
     process(**vars(args))
@@ -0,0 +1,182 @@
+from __future__ import print_function
+
+import time
+
+# The protobuf output of CoreNLP is optional: it requires the Python classes
+# generated from CoreNLP.proto, packaged as corenlp-protobuf (or within
+# stanza).
+try:
+    from corenlp_protobuf import Document
+    from corenlp_protobuf import parseFromDelimitedString
+except ImportError:
+    try:
+        from stanza.protobuf import Document
+        from stanza.protobuf import parseFromDelimitedString
+    except ImportError:
+        Document = None
+        parseFromDelimitedString = None
+
+PROTOBUF_SERIALIZER = 'edu.stanford.nlp.pipeline.ProtobufAnnotationSerializer'
+
+
+class CoreNLPToken(object):
+    """
+    A compact CoreNLP token. It only holds the fields of the tokens used by
+    the parsers, without the dictionary of each token of the JSON output, and
+    is accessed like a dictionary: token['word'], token['ner'], etc.
+    """
+
+    __slots__ = ('index', 'word', 'originalText', 'lemma',
+                 'characterOffsetBegin', 'characterOffsetEnd', 'pos', 'ner',
+                 'before', 'after')
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in self.__slots__
+
+    def get(self, field, default=None):
+        if field not in self.__slots__:
+            return default
+        return getattr(self, field, default)
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in self.__slots__)
+
+    def __repr__(self):
+        return 'CoreNLPToken(%r)' % self.to_dict()
+
+
+def protobuf_available():
+    return Document is not None
+
+
+def decode_document(data):
+    """
+    Decodes the protobuf output of CoreNLP into sentences like the ones of
+    its JSON output, with CoreNLPToken tokens
+    :param data: response of the CoreNLP server with the 'serialized' output
+    format and the protobuf serializer
+    :return: dictionary with the list of sentences
+    """
+    if Document is None:
+        raise RuntimeError('The protobuf output of CoreNLP requires the '
+                           'corenlp-protobuf package')
+
+    doc = Document()
+    parseFromDelimitedString(doc, data)
+
+    sentences = []
+    for sentence in doc.sentence:
+        tokens = [CoreNLPToken(i + 1, t.word, t.originalText, t.lemma,
+                               t.beginChar, t.endChar, t.pos, t.ner, t.before,
+                               t.after)
+                  for i, t in enumerate(sentence.token)]
+
+        mentions = []
+        for mention in sentence.mentions:
+            begin = mention.tokenStartInSentenceInclusive
+            end = mention.tokenEndInSentenceExclusive
+            text = ''.join(t.originalText + t.after
+                           for t in tokens[begin:end - 1])
+            mentions.append({
+                'docTokenBegin': sentence.tokenOffsetBegin + begin,
+                'docTokenEnd': sentence.tokenOffsetBegin + end,
+                'tokenBegin': begin,
+                'tokenEnd': end,
+                'text': text + tokens[end - 1].originalText,
+                'characterOffsetBegin': tokens[begin].characterOffsetBegin,
+                'characterOffsetEnd': tokens[end - 1].characterOffsetEnd,
+                'ner': mention.ner
+            })
+
+        sentences.append({
+            'index': sentence.sentenceIndex,
+            'tokens': tokens,
+            'entitymentions': mentions
+        })
+
+    return {'sentences': sentences}
+
+
+def plain_sentences(sentences):
+    """
+    Converts the CoreNLPToken tokens of sentences to dictionaries, e.g. to
+    store them as JSON
+    """
+    return [dict(sentence, tokens=[token.to_dict()
+                                   if isinstance(token, CoreNLPToken)
+                                   else token
+                                   for token in sentence['tokens']])
+            for sentence in sentences]
+
+
+def json_default(obj):
+    """
+    Serializes CoreNLPToken tokens with json.dump(s)(..., default=json_default)
+    """
+    if isinstance(obj, CoreNLPToken):
+        return obj.to_dict()
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+def main():
+    import argparse
+    import json
+    import urllib
+    from corenlp_parser import CoreNLPClient
+    from corenlp_parser import CoreNLPParser
+
+    parser = argparse.ArgumentParser(description='Compares the size and the '
+                                     'decoding time of the JSON and protobuf '
+                                     'outputs of a CoreNLP server')
+    parser.add_argument('-i', '--in_file', required=True,
+                        help='Path to a text file')
+    parser.add_argument('-c', '--corenlp_server_url',
+                        default='http://localhost:9000',
+                        help='CoreNLP Server URL')
+    parser.add_argument('-n', '--ner_model', required=False,
+                        help='Path to a Named Entity Recognition (NER) model')
+    args = parser.parse_args()
+
+    with open(args.in_file, 'r') as f:
+        text = urllib.quote(CoreNLPParser.prepare_text(f.read()))
+    props = CoreNLPParser(args.corenlp_server_url, args.ner_model).props
+    client = CoreNLPClient(args.corenlp_server_url)
+
+    for output_format in ['json', 'serialized']:
+        properties = dict(props, outputFormat=output_format,
+                          serializer=PROTOBUF_SERIALIZER)
+        response = client.session.post(
+            client.server_urls[0], params={'properties': str(properties)},
+            data=text, timeout=client.timeout)
+        response.raise_for_status()
+
+        start = time.time()
+        if output_format == 'json':
+            sentences = json.loads(response.text)['sentences']
+        else:
+            sentences = decode_document(response.content)['sentences']
+        elapsed = time.time() - start
+        print('%s: %d bytes, %d sentences decoded in %.3f seconds' %
+              (output_format, len(response.content), len(sentences), elapsed))
+
+
+if __name__ == '__main__':
+    main()
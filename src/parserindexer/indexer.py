@@ -212,7 +212,7 @@ def main():
         sys.exit(1)
 
     schema_mapper = schema_map[args['schema']]
-    docs = read_jsonlines(args['in'])
+    docs = read_jsonlines(args['in'], decode=True)
     # map to schema
     docs = map(schema_mapper, docs)
 
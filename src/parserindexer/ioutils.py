@@ -1,4 +1,8 @@
+import os
 import json
+import hashlib
+import fnmatch
+from sentences import decode_record
 
 
 def read_lines(listfile, skip_blank=True, skip_comments=True):
@@ -19,15 +23,21 @@ def read_lines(listfile, skip_blank=True, skip_comments=True):
         return paths
 
 
-def read_jsonlines(filename):
+def read_jsonlines(filename, decode=False):
     """
     reads json lines
     :param filename: path to dump file
+    :param decode: if True, the columnar sentences of the records are
+    decoded (see sentences.decode_record()). Records that are dumped again
+    must not be decoded, as decoded sentences are read-only views
     :return: stream of dictionary objects
     """
     with open(filename, 'rb') as lines:
         for line in lines:
-            yield json.loads(line)
+            doc = json.loads(line)
+            if decode:
+                decode_record(doc)
+            yield doc
 
 
 def dump_jsonlines(objects, filename):
@@ -46,3 +56,120 @@ def dump_jsonlines(objects, filename):
             count += 1
     print("Stored %d objects to %s" % (count, filename))
     return count
+
+
+def file_sha256(filename, block_size=1 << 20):
+    """
+    Computes the SHA-256 digest of a file's content
+    :param filename: path to the file
+    :param block_size: number of bytes read at a time
+    :return: hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def crawl_files(in_dir, patterns=('*.pdf',)):
+    """
+    Walks a directory tree and streams the paths of the files whose names
+    match any of the glob patterns (case insensitive)
+    :param in_dir: root directory
+    :param patterns: glob patterns of the file names, e.g. '*.pdf'
+    :return: stream of file paths, in sorted order within each directory
+    """
+    patterns = [p.lower() for p in patterns]
+    for dir_path, dir_names, file_names in os.walk(in_dir):
+        # Walk the sub-directories in a stable order
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            name = file_name.lower()
+            if any(fnmatch.fnmatch(name, p) for p in patterns):
+                yield os.path.join(dir_path, file_name)
+
+
+class CrawlState(object):
+    """
+    Remembers the modification time and size of the files processed by
+    previous runs, so that an incremental run only processes new or modified
+    files. The state is stored as a JSON file mapping absolute paths to
+    [mtime, size]. It is saved every save_every processed files, so that a
+    run that crashes keeps most of its progress.
+    """
+
+    def __init__(self, state_file, save_every=100):
+        self.state_file = state_file
+        self.save_every = save_every
+        self.processed = dict()
+        self.seen = dict()
+        self.unsaved = 0
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                self.processed = json.load(f)
+
+    def changed(self, paths):
+        """
+        Filters out the files that have not changed since they were processed
+        :param paths: stream of file paths
+        :return: stream of the paths of new or modified files
+        """
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted or renamed since the directory was walked
+                continue
+            signature = [stat.st_mtime, stat.st_size]
+            abs_path = os.path.abspath(path)
+            if self.processed.get(abs_path) == signature:
+                continue
+
+            self.seen[abs_path] = signature
+            yield path
+
+    def mark_processed(self, path):
+        """
+        Records a file as processed, with the modification time and size it
+        had when it was crawled
+        :param path: file path yielded by changed()
+        """
+        abs_path = os.path.abspath(path)
+        if abs_path in self.seen:
+            self.processed[abs_path] = self.seen.pop(abs_path)
+            self.unsaved += 1
+            if self.unsaved >= self.save_every:
+                self.save()
+
+    def save(self):
+        self.unsaved = 0
+        tmp_file = '%s.tmp' % self.state_file
+        with open(tmp_file, 'w') as f:
+            json.dump(self.processed, f)
+        os.rename(tmp_file, self.state_file)
+
+
+def input_files(in_file=None, in_list=None, in_dir=None, pattern='*.pdf',
+                crawl_state=None):
+    """
+    Gets the input files of a parser from exactly one of a single file, a list
+    file, or a directory tree
+    :param in_file: path to an input file
+    :param in_list: path to a list file having input paths, one per line
+    :param in_dir: path to a directory crawled for input files
+    :param pattern: comma-separated glob patterns of the file names to crawl
+    in in_dir
+    :param crawl_state: optional CrawlState used to skip the files of in_dir
+    that have not changed since they were processed
+    :return: list of paths, or a lazy stream of paths for in_dir
+    """
+    if in_file:
+        return [in_file]
+    if in_list:
+        return read_lines(in_list)
+
+    files = crawl_files(in_dir, [p.strip() for p in pattern.split(',')])
+    if crawl_state is not None:
+        files = crawl_state.changed(files)
+    return files
@@ -9,6 +9,7 @@
 import sys, os, shutil, io
 import json
 from ioutils import read_jsonlines
+from spans import merge_runs
 
 def usage():
     print './json2brat.py <JSON file> <output dir>'
@@ -50,51 +51,38 @@ def merge_adjacent(rels):
     [{'cont_ids': ['element_40_42', 'element_30_32'], 'target_names': ['Big Bob'], 'target_ids': ['target_1_8'], 'cont_names': ['Ca', 'Fl']}]
     """
 
-    rels = list(rels)
-    #print(len(rels))
-    #print(rels)
-    change = True
-    while change:
-        change = False
-        #print([r['target_ids'] for r in rels])
-        for i in range(len(rels) - 1):
-            if i >= len(rels) - 1:
-                break
-            tids = rels[i]['target_ids']
-            # jSRE only returns one target per relation,
-            # so we blindly index lists to 0 in several places
-            assert(len(tids) == 1)
-            start = int(tids[0].split('_')[1])
-            end = int(tids[0].split('_')[2])
-            next_start = int(rels[i+1]['target_ids'][0].split('_')[1])
-            next_end = int(rels[i+1]['target_ids'][0].split('_')[2])
-            if end + 1 == next_start:
-                merged_target_id = '_'.join(tids[0].split('_')[:2] + [str(next_end)])
-                rels[i]['target_ids'] = [merged_target_id]
-                rels[i]['target_names'] = [rels[i]['target_names'][0] + ' ' +
-                                           rels[i+1]['target_names'][0]]
-                #print('merged: ', rels[i]['target_ids'])
-                #print(' ', rels[i]['target_names'])
-                # Pick up any different components
-                rels[i]['cont_ids'].extend(rels[i+1]['cont_ids'])
-                rels[i]['cont_ids'] = list(set(rels[i]['cont_ids']))
-                rels[i]['cont_names'].extend(rels[i+1]['cont_names'])
-                rels[i]['cont_names'] = list(set(rels[i]['cont_names']))
-                #print(' cont ids: ', rels[i]['cont_ids'])
-                #print(' cont names: ', rels[i]['cont_names'])
-                # Remove the second one
-                rels.remove(rels[i + 1])
-                #print(rels)
-                #raw_input()
-                # In case we need to keep merging, keep checking the current one
-                i = i - 1
-                change = True
-    return rels
+    return merge_runs(list(rels), target_begin, target_end, merge_targets)
+
+
+def target_begin(rel):
+    tids = rel['target_ids']
+    # jSRE only returns one target per relation,
+    # so we blindly index lists to 0 in several places
+    assert(len(tids) == 1)
+    return int(tids[0].split('_')[1])
+
+
+def target_end(rel):
+    return int(rel['target_ids'][0].split('_')[2])
+
+
+def merge_targets(rel, next_rel):
+    tids = rel['target_ids']
+    merged_target_id = '_'.join(tids[0].split('_')[:2] +
+                                [str(target_end(next_rel))])
+    rel['target_ids'] = [merged_target_id]
+    rel['target_names'] = [rel['target_names'][0] + ' ' +
+                           next_rel['target_names'][0]]
+    # Pick up any different components
+    rel['cont_ids'].extend(next_rel['cont_ids'])
+    rel['cont_ids'] = list(set(rel['cont_ids']))
+    rel['cont_names'].extend(next_rel['cont_names'])
+    rel['cont_names'] = list(set(rel['cont_names']))
 
 
 def convert_json_to_brat(jsonfile, outdir):
     # Read in the JSON file
-    docs = read_jsonlines(jsonfile)
+    docs = read_jsonlines(jsonfile, decode=True)
 
     # Iterate over documents
     for d in docs:
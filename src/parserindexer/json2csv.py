@@ -9,6 +9,7 @@
 import sys, os, shutil
 import json
 from ioutils import read_jsonlines
+from spans import SpanIndex
 from progressbar import ProgressBar, ETA, Bar, Percentage
 
 def usage():
@@ -16,6 +17,10 @@ def usage():
     sys.exit(1)
 
 
+def target_start(rel):
+    return int(rel['target_ids'][0].split('_')[1])
+
+
 def convert_json_to_csv(jsonfile):
     # Get the number of lines (docs) to process
     # Do this before re-opening the file because read_jsonlines()
@@ -26,7 +31,7 @@ def convert_json_to_csv(jsonfile):
         f.close()
 
     # Read in the JSON file 
-    docs = read_jsonlines(jsonfile)
+    docs = read_jsonlines(jsonfile, decode=True)
 
     # Open the output CSV file
     outfn = jsonfile[:jsonfile.rfind('.')] + '.csv'
@@ -49,7 +54,11 @@ def convert_json_to_csv(jsonfile):
         # Output relations into the .csv file
         rels = d['metadata']['rel']
         ners = d['metadata']['ner']
-        skip_inds = []
+        skip_inds = set()
+        rel_index = SpanIndex(rels, target_start)
+        ner_texts = {}
+        for n in ners:
+            ner_texts.setdefault((n['begin'], n['end']), []).append(n['text'])
         for (t, r) in enumerate(rels):
             # Special merging step for adjacent Target tokens
             # If this matches a multi-word NER,
@@ -63,23 +72,20 @@ def convert_json_to_csv(jsonfile):
 
             if start_target in skip_inds:
                 continue
-            next_rels = [r2 for r2 in rels if
-                         int(r2['target_ids'][0].split('_')[1]) > end_target]
-            if len(next_rels) > 0:
-                next_rels.sort(key=lambda x: 
-                               int(x['target_ids'][0].split('_')[1]))
-                next_rel = next_rels[0]
+            # The relation whose target starts first after this one
+            next_rel = rel_index.first_after(end_target)
+            if next_rel is not None:
                 start_next_target = int(next_rel['target_ids'][0].split('_')[1])
                 end_next_target   = int(next_rel['target_ids'][0].split('_')[2])
-                ner_matches = [n for n in ners if \
-                               n['text'].startswith(targ_name) and
-                               n['begin'] == start_target and
-                               n['end'] == end_next_target]
+                ner_matches = [text for text in
+                               ner_texts.get((start_target, end_next_target),
+                                             []) if
+                               text.startswith(targ_name)]
                 if len(ner_matches) > 0:
                     print('Merging %s and %s' % (targ_name,
                                                  next_rel['target_names'][0]))
                     targ_name += ' ' + next_rel['target_names'][0]
-                    skip_inds.append(start_next_target)
+                    skip_inds.add(start_next_target)
 
             # If cont_name is something like Fe-rich or Mg_sulfate,
             # only keep the first bit.
@@ -2,59 +2,160 @@ from __future__ import print_function
 
 import os
 import io
-import sys
-import json
+import shutil
+import tempfile
 import warnings
 import itertools
+import threading
 import subprocess
-from tqdm import tqdm
-from utils import LogUtil
+import multiprocessing
 from shutil import copyfile
-from ioutils import read_lines
+from pipeline import Pipeline
+from pipeline import add_pipeline_args
+from pipeline import pipeline_args
+from jsre_worker import JsreWorkerPool
+from jsre_worker import WorkerUnsupportedError
+from jsre_worker import java_worker_command
+from utils import Batcher
 from utils import canonical_name
-from ads_parser import AdsParser
 from corenlp_parser import CoreNLPParser
 
 # Always printing matching warnings
 warnings.filterwarnings('always')
 
 
+class JsreTemplate(object):
+    """ The jSRE features of the tokens of a sentence, serialized once, into
+    which the labels of the two entities of each candidate pair are spliced
+    """
+
+    def __init__(self, sentence):
+        parts = list()
+        # Offset in the body of the entity label of each token, by index
+        self.label_offsets = dict()
+        offset = 0
+        for token in sentence['tokens']:
+            part = '%d&&%s&&%s&&%s&&%s&&' % (
+                token['index'] - 1, token['word'], token['lemma'],
+                token['pos'], token['ner'])
+            offset += len(part)
+            self.label_offsets[token['index']] = offset
+            parts.append(part + 'O ')
+            offset += 2
+        self.body = ''.join(parts)
+
+    def record(self, record_id, target, component):
+        """ Returns the jSRE input record of a candidate pair, in which the
+        target is labeled A, the component T and the other tokens O
+        """
+        splices = [(self.label_offsets.get(target['index']), 'A'),
+                   (self.label_offsets.get(component['index']), 'T')]
+        splices = sorted((o, l) for o, l in splices if o is not None)
+
+        pieces = list()
+        start = 0
+        for offset, label in splices:
+            if offset < start:
+                # The target and the component are the same token
+                continue
+            pieces.append(self.body[start:offset])
+            pieces.append(label)
+            start = offset + 1
+        pieces.append(self.body[start:])
+
+        return '%d\t%s\t%s\n' % (0, record_id, ''.join(pieces))
+
+
+class JsreRecords(object):
+    """ The jSRE input records of the candidate pairs of sentences. Only the
+    entities of each sentence are held: the pairs and their records are
+    generated when they are iterated (e.g., while the records are written to
+    the input of jSRE), and again on every iteration.
+    """
+
+    def __init__(self, sentences=None):
+        # (template, targets, components, sentence, rel_id) of each sentence
+        self.sentences = sentences if sentences is not None else list()
+        self.count = sum(len(s[1]) * len(s[2]) for s in self.sentences)
+
+    def add(self, template, targets, components, sentence, rel_id):
+        """ Adds the pairs of the targets and components of a sentence """
+        self.sentences.append((template, targets, components, sentence,
+                               rel_id))
+        self.count += len(targets) * len(components)
+
+    def __len__(self):
+        return self.count
+
+    def pairs(self):
+        """ Generates the (record_id, target, component, sentence) candidate
+        pairs, in the order of the records
+        """
+        for _, targets, components, sentence, rel_id in self.sentences:
+            for record_id, target, component in JsreParser.candidate_pairs(
+                    targets, components, sentence, rel_id):
+                yield record_id, target, component, sentence
+
+    def __iter__(self):
+        for template, targets, components, sentence, rel_id in \
+                self.sentences:
+            for record_id, target, component in JsreParser.candidate_pairs(
+                    targets, components, sentence, rel_id):
+                yield template.record(record_id, target, component)
+
+    @staticmethod
+    def concat(records_list):
+        """ Concatenates the records of several documents """
+        if all(isinstance(r, JsreRecords) for r in records_list):
+            return JsreRecords([s for r in records_list for s in r.sentences])
+        return [r for records in records_list for r in records]
+
+
 class JsreParser(CoreNLPParser):
     """ Relation extraction using JSRE package. The JsreParser class depends on
     the outputs provided by the CoreNLPParser class.
     """
     JSRE_PARSER = "org.itc.irst.tcc.sre.Predict"
+    # prepare_jsre_input() writes the lemma and POS tag of every token
+    TOKEN_FIELDS = CoreNLPParser.TOKEN_FIELDS + ['word', 'index', 'lemma',
+                                                 'pos']
 
     def __init__(self, corenlp_server_url, ner_model, jsre_root, jsre_model,
-                 jsre_tmp_dir='/tmp'):
+                 jsre_tmp_dir='/tmp', corenlp_concurrency=4,
+                 jsre_processes=None):
         super(JsreParser, self).__init__(corenlp_server_url, ner_model,
-                                         'jsre_parser')
-
-        self.jsre_root = jsre_root
-        self.jsre_model = jsre_model
-        self.jsre_tmp_dir = jsre_tmp_dir
+                                         'jsre_parser', corenlp_concurrency)
+
+        # jSRE runs in its own working directory (see predict_batch), so
+        # paths are made absolute
+        self.jsre_root = os.path.abspath(jsre_root)
+        self.jsre_model = os.path.abspath(jsre_model)
+        self.jsre_tmp_dir = os.path.abspath(jsre_tmp_dir)
+        if jsre_processes is None:
+            jsre_processes = multiprocessing.cpu_count()
+        self.predict_slots = threading.BoundedSemaphore(jsre_processes)
+        self.worker_pool = None
+        self.batcher = None
         self.set_classpath()
-        self.copy_config_files()
-
-    def copy_config_files(self):
-        src_log_config_file = os.path.join(self.jsre_root, 'log-config.txt')
-        trt_log_config_file = os.path.join(os.getcwd(), 'log-config.txt')
-        src_jsre_config_file = os.path.join(self.jsre_root, 'jsre-config.xml')
-        trt_jsre_config_file = os.path.join(os.getcwd(), 'jsre-config.xml')
-
-        if not os.path.exists(src_log_config_file):
-            raise RuntimeError('JSRE configuration file log-config.txt not '
-                               'found in JSRE root directory %s' %
-                               os.path.abspath(self.jsre_root))
-
-        if not os.path.exists(src_jsre_config_file):
-            raise RuntimeError('JSRE configuration file jsre-config.xml not '
-                               'found in JSRE root directory %s' %
-                               os.path.abspath(self.jsre_root))
-
-        # Copy the JSRE config files to the current working directory
-        copyfile(src_log_config_file, trt_log_config_file)
-        copyfile(src_jsre_config_file, trt_jsre_config_file)
+        self.config_files = self.find_config_files()
+
+    def find_config_files(self):
+        config_files = []
+        for name in ['log-config.txt', 'jsre-config.xml']:
+            config_file = os.path.join(self.jsre_root, name)
+            if not os.path.exists(config_file):
+                raise RuntimeError('JSRE configuration file %s not found in '
+                                   'JSRE root directory %s' %
+                                   (name, self.jsre_root))
+            config_files.append(config_file)
+
+        return config_files
+
+    def copy_config_files(self, target_dir):
+        # jSRE reads its config files from its working directory
+        for config_file in self.config_files:
+            copyfile(config_file, os.path.join(target_dir,
+                                               os.path.basename(config_file)))
 
     def set_classpath(self):
         jars = [
@@ -71,51 +172,162 @@ class JsreParser(CoreNLPParser):
         for jar in jars:
             if not os.path.exists(jar):
                 raise RuntimeError('JSRE required JAR file not found: %s' %
-                                   os.path.abspath(jar))
+                                   jar)
 
         os.environ['CLASSPATH'] = ':'.join(jars)
 
-    @staticmethod
-    def prepare_jsre_input(targets, components, sentence,
-                           rel_id):
-        relations = list()
-        records = list()
+    def enable_workers(self, workers=1):
+        """ Predicts with long-lived jSRE worker processes (see
+        jsre_worker.py) rather than a JVM started for every document. If the
+        workers cannot run on this JVM, a JVM is started for every document
+        after all.
+
+        Args:
+            workers (int): Number of worker processes, which predict
+                concurrently.
+        """
+        command = java_worker_command(
+            self.jsre_model, os.path.join(self.jsre_tmp_dir, 'jsre_worker'))
+        self.worker_pool = JsreWorkerPool(command, workers, self.jsre_tmp_dir,
+                                          self.config_files)
+
+    def enable_batching(self, batch_size=16, batch_records=1000,
+                        batch_wait=0.5, submitters=None):
+        """ Combines the jSRE records of the documents parsed at about the
+        same time by different threads into a single jSRE prediction, whose
+        labels are split back to each document (see Batcher)
+
+        Args:
+            batch_size (int): Maximum number of documents of a batch.
+            batch_records (int): Number of records from which a batch is
+                predicted without waiting for more documents.
+            batch_wait (float): Number of seconds a batch waits for more
+                documents.
+            submitters (int): Number of threads parsing documents (e.g.,
+                --workers), so that a batch is predicted once all of them are
+                waiting for it. None if unknown.
+        """
+        self.batcher = Batcher(self.predict_documents, batch_size, batch_wait,
+                               batch_records, submitters=submitters)
+
+    def close(self):
+        if self.worker_pool is not None:
+            self.worker_pool.close()
 
+    @staticmethod
+    def candidate_pairs(targets, components, sentence, rel_id):
+        """ Generates the (record_id, target, component) candidate pairs of a
+        sentence. The targets and components are distinct tokens of the
+        sentence, so every pair is distinct.
+        """
         tc_combinations = itertools.product(targets, components)
         for idx, (target, component) in enumerate(tc_combinations):
             record_id = '%s_%d_%d' % (rel_id, sentence['index'], idx)
-            body = ''
-
-            for token in sentence['tokens']:
-                if token['index'] == target['index']:
-                    entity_label = 'A'
-                elif token['index'] == component['index']:
-                    entity_label = 'T'
-                else:
-                    entity_label = 'O'
+            yield record_id, target, component
 
-                body += '%d&&%s&&%s&&%s&&%s&&%s ' % (
-                    token['index'] - 1, token['word'], token['lemma'],
-                    token['pos'], token['ner'], entity_label)
-
-            records.append('%d\t%s\t%s\n' % (0, record_id, body))
-            relations.append([target, component, sentence])
+    @staticmethod
+    def prepare_jsre_input(targets, components, sentence,
+                           rel_id, template=None):
+        records = JsreRecords()
+        if template is None:
+            template = JsreTemplate(sentence)
+        records.add(template, targets, components, sentence, rel_id)
+        relations = [[target, component, sentence]
+                     for _, target, component, sentence in records.pairs()]
 
         return relations, records
 
-    def predict(self, in_file, out_file):
+    def predict(self, in_file, out_file, work_dir=None):
         cmd = ['java', '-mx256M', self.JSRE_PARSER, in_file,
                self.jsre_model, out_file]
 
         fnull = open(os.devnull, 'w')
-        subprocess.call(cmd, stdout=fnull)
+        subprocess.call(cmd, stdout=fnull, cwd=work_dir)
         fnull.close()
 
+    def predict_records(self, records):
+        """ Run jSRE prediction over jSRE input records
+
+        Args:
+            records (JsreRecords or list): jSRE input records created by
+                prepare_jsre_input
+        Return:
+            the list of labels predicted by jSRE (one per record), or None if
+            jSRE did not produce an output file
+        """
+        if self.batcher is not None:
+            if len(records) == 0:
+                return []
+            return self.batcher.submit(records)
+
+        return self.predict_batch(records)
+
+    def predict_documents(self, records_list):
+        """ Run a single jSRE prediction over the records of several documents
+
+        Args:
+            records_list (list): jSRE input records of each document.
+        Return:
+            the list of the labels of each document (see predict_records)
+        """
+        records = JsreRecords.concat(records_list)
+        labels = self.predict_batch(records)
+        if labels is None:
+            return [None] * len(records_list)
+
+        if len(labels) != len(records) and len(records_list) > 1:
+            # The labels cannot be attributed to the documents
+            return [self.predict_batch(r) for r in records_list]
+
+        labels_list = []
+        start = 0
+        for r in records_list:
+            labels_list.append(labels[start:start + len(r)])
+            start += len(r)
+
+        return labels_list
+
+    def predict_batch(self, records):
+        """ Run a single jSRE prediction over jSRE input records, which may
+        come from several documents (see predict_records)
+        """
+        if self.worker_pool is not None and \
+                self.worker_pool.unsupported is None:
+            try:
+                return self.worker_pool.predict(records)
+            except WorkerUnsupportedError as e:
+                warnings.warn('[WARNING] %s. A JVM is started for every jSRE '
+                              'prediction instead.' % e)
+
+        # Each prediction has its own working directory, with its own config
+        # and input and output files, so that concurrent predictions (within
+        # this process or from other runs) do not overwrite each other's
+        # files. Up to jsre_processes predictions run in parallel.
+        work_dir = tempfile.mkdtemp(prefix='jsre_', dir=self.jsre_tmp_dir)
+        try:
+            self.copy_config_files(work_dir)
+            in_file = os.path.join(work_dir, 'jsre_input.txt')
+            out_file = os.path.join(work_dir, 'jsre_output.txt')
+            with io.open(in_file, 'w', encoding='utf8') as f:
+                for r in records:
+                    f.write(r)
+
+            with self.predict_slots:
+                self.predict(in_file, out_file, work_dir)
+            if not os.path.exists(out_file):
+                return None
+
+            with open(out_file, 'r') as jsre_out_file:
+                labels = jsre_out_file.readlines()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return labels
+
     def parse(self, text):
         corenlp_dict = super(JsreParser, self).parse(text)
 
-        relations = list()
-        records = list()
+        records = JsreRecords()
         for sentence in corenlp_dict['sentences']:
             targets = [t for t in sentence['tokens'] if t['ner'] == 'Target']
             elements = [t for t in sentence['tokens'] if t['ner'] == 'Element']
@@ -124,26 +336,14 @@ class JsreParser(CoreNLPParser):
             if len(targets) == 0 or (len(elements) == 0 and len(minerals) == 0):
                 continue
 
-            rels, recs = JsreParser.prepare_jsre_input(targets, elements,
-                                                       sentence, rel_id='te')
-            relations.extend(rels)
-            records.extend(recs)
-
-            rels, recs = JsreParser.prepare_jsre_input(targets, minerals,
-                                                       sentence, rel_id='tm')
-            relations.extend(rels)
-            records.extend(recs)
+            # The features of the tokens are serialized once per sentence
+            template = JsreTemplate(sentence)
+            records.add(template, targets, elements, sentence, 'te')
+            records.add(template, targets, minerals, sentence, 'tm')
 
         contains_relation = list()
-        in_file = '%s/jsre_input.txt' % self.jsre_tmp_dir
-        out_file = '%s/jsre_output.txt' % self.jsre_tmp_dir
-
-        with io.open(in_file, 'w', encoding='utf8') as f:
-            for r in records:
-                f.write(r)
-
-        self.predict(in_file, out_file)
-        if not os.path.exists(out_file):
+        labels = self.predict_records(records)
+        if labels is None:
             warnings.warn('jSRE output file not found, which indicates jSRE '
                           'run may be failed.')
 
@@ -154,9 +354,9 @@ class JsreParser(CoreNLPParser):
                 'X-Parsed-By': JsreParser.JSRE_PARSER
             } 
 
-        jsre_out_file = open(out_file, 'r')
-        labels = jsre_out_file.readlines()
-        for label, rel in zip(labels, relations):
+        relations = ((target, component, sentence)
+                     for _, target, component, sentence in records.pairs())
+        for label, rel in itertools.izip(labels, relations):
             # If the label is non-zero, then it's a relationship
             # 0.0 - negative
             # 1.0 - entity_1 contains entity_2
@@ -180,10 +380,6 @@ class JsreParser(CoreNLPParser):
                 'source': 'jsre'
             })
 
-        jsre_out_file.close()
-        os.remove(in_file)
-        os.remove(out_file)
-
         return {
             'ner': corenlp_dict['ner'],
             'sentences': corenlp_dict['sentences'],
@@ -194,98 +390,34 @@ class JsreParser(CoreNLPParser):
 
 def process(in_file, in_list, out_file, log_file, tika_server_url,
             corenlp_server_url, ner_model, jsre_root, jsre_model, jsre_tmp_dir,
-            ads_url, ads_token):
-    # Log input parameters
-    logger = LogUtil(log_file)
-    logger.info('Input parameters')
-    logger.info('in_file: %s' % in_file)
-    logger.info('in_list: %s' % in_list)
-    logger.info('out_file: %s' % out_file)
-    logger.info('tika_server_url: %s' % tika_server_url)
-    logger.info('corenlp_server_url: %s' % corenlp_server_url)
-    logger.info('ner_model: %s' % os.path.abspath(ner_model))
-    logger.info('jsre_root: %s' % os.path.abspath(jsre_root))
-    logger.info('jsre_model: %s' % os.path.abspath(jsre_model))
-    logger.info('jsre_tmp_dir: %s' % os.path.abspath(jsre_tmp_dir))
-    logger.info('ads_url: %s' % ads_url)
-    logger.info('ads_token: %s' % ads_token)
-
-    if in_file and in_list:
-        print('[ERROR] in_file and in_list cannot be provided simultaneously')
-        sys.exit(1)
-
-    ads_parser = AdsParser(ads_token, ads_url, tika_server_url)
-    jsre_parser = JsreParser(corenlp_server_url, ner_model, jsre_root,
-                             jsre_model, jsre_tmp_dir)
-
-    if in_file:
-        files = [in_file]
-    else:
-        files = read_lines(in_list)
-
-    out_f = open(out_file, 'wb', 1)
-    for f in tqdm(files):
-        try:
-            ads_dict = ads_parser.parse(f)
-            jsre_dict = jsre_parser.parse(ads_dict['content'])
+            ads_url, ads_token, **options):
+    args = pipeline_args(['ads', 'corenlp', 'jsre'], options, in_file=in_file,
+                         in_list=in_list, out_file=out_file,
+                         log_file=log_file, tika_server_url=tika_server_url,
+                         corenlp_server_url=corenlp_server_url,
+                         ner_model=ner_model, jsre_root=jsre_root,
+                         jsre_model=jsre_model, jsre_tmp_dir=jsre_tmp_dir,
+                         ads_url=ads_url, ads_token=ads_token,)
+    pipeline = Pipeline(args, 'JSRE parser')
+    jsre_parser = pipeline.jsre_parser()
 
-            ads_dict['metadata']['ner'] = jsre_dict['ner']
-            ads_dict['metadata']['rel'] = jsre_dict['relation']
-            ads_dict['metadata']['sentences'] = jsre_dict['sentences']
-            ads_dict['metadata']['X-Parsed-By'].append(jsre_dict['X-Parsed-By'])
+    def parse_document(f, ads_dict):
+        jsre_dict = jsre_parser.parse(ads_dict['content'])
 
-            out_f.write(json.dumps(ads_dict))
-            out_f.write('\n')
-        except Exception as e:
-            logger.info('JSRE parser failed: %s' % os.path.abspath(f))
-            logger.error(e)
+        ads_dict['metadata']['ner'] = jsre_dict['ner']
+        ads_dict['metadata']['rel'] = jsre_dict['relation']
+        ads_dict['metadata']['sentences'] = pipeline.output_sentences(
+            jsre_dict['sentences'])
+        ads_dict['metadata']['X-Parsed-By'].append(jsre_dict['X-Parsed-By'])
 
-    out_f.close()
+    pipeline.run(parse_document)
 
 
 if __name__ == '__main__':
     import argparse
 
     parser = argparse.ArgumentParser()
-    input_parser = parser.add_mutually_exclusive_group(required=True)
-
-    input_parser.add_argument('-i', '--in_file', help='Path to input file')
-    input_parser.add_argument('-li', '--in_list', help='Path to input list')
-    parser.add_argument('-o', '--out_file', required=True,
-                        help='Path to output JSON file')
-    parser.add_argument('-l', '--log_file', default='./jsre-parser-log.txt',
-                        help='Log file that contains processing information. '
-                             'It is default to ./jsre-parser-log.txt unless '
-                             'otherwise specified.')
-    parser.add_argument('-p', '--tika_server_url', required=False,
-                        help='Tika server URL')
-    parser.add_argument('-c', '--corenlp_server_url',
-                        default='http://localhost:9000',
-                        help='CoreNLP Server URL')
-    parser.add_argument('-n', '--ner_model', required=False,
-                        help='Path to a Named Entity Recognition (NER) model')
-    parser.add_argument('-jr', '--jsre_root', default='/proj/mte/jSRE/jsre-1.1',
-                        help='Path to jSRE installation directory. Default is '
-                             '/proj/mte/jSRE/jsre-1.1')
-    parser.add_argument('-jm', '--jsre_model', required=True,
-                        help='Path to jSRE model')
-    parser.add_argument('-jt', '--jsre_tmp_dir', default='/tmp',
-                        help='Path to a directory for jSRE to temporarily '
-                             'store input and output files. Default is /tmp')
-    parser.add_argument('-a', '--ads_url',
-                        default='https://api.adsabs.harvard.edu/v1/search/query',
-                        help='ADS RESTful API. The ADS RESTful API should not '
-                             'need to be changed frequently unless someting at '
-                             'the ADS is changed.')
-    parser.add_argument('-t', '--ads_token',
-                        default='jON4eu4X43ENUI5ugKYc6GZtoywF376KkKXWzV8U',
-                        help='The ADS token, which is required to use the ADS '
-                             'RESTful API. The token was obtained using the '
-                             'instructions at '
-                             'https://github.com/adsabs/adsabs-dev-api#access. '
-                             'The ADS token should not need to be changed '
-                             'frequently unless something at the ADS is '
-                             'changed.')
-
+    add_pipeline_args(parser, './jsre-parser-log.txt',
+                      stages=['ads', 'corenlp', 'jsre'])
     args = parser.parse_args()
     process(**vars(args))
@@ -0,0 +1,285 @@
+import os
+import re
+import Queue
+import shutil
+import tempfile
+import warnings
+import threading
+import subprocess
+
+# Source of the Java side of the worker, compiled on first use
+WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'JsreWorker.java')
+
+
+def compile_worker(build_dir):
+    """ Compiles JsreWorker.java against the jSRE classes of the CLASSPATH
+    environment variable (see JsreParser.set_classpath()), unless it was
+    compiled already. Several runs may compile it into the same directory at
+    the same time.
+
+    Args:
+        build_dir (str): Directory of the compiled class.
+    Return:
+        build_dir
+    """
+    class_file = os.path.join(build_dir, 'JsreWorker.class')
+    if os.path.exists(class_file) and \
+            os.path.getmtime(class_file) >= os.path.getmtime(WORKER_SOURCE):
+        return build_dir
+
+    if not os.path.exists(build_dir):
+        try:
+            os.makedirs(build_dir)
+        except OSError:
+            # Created by another run in the meantime
+            pass
+
+    # The classes are compiled into a directory of their own, and renamed
+    # into place one by one, the main class last, so that the runs starting
+    # the worker meanwhile never load a partially written class
+    tmp_dir = tempfile.mkdtemp(prefix='javac_', dir=build_dir)
+    try:
+        subprocess.check_call(['javac', '-d', tmp_dir, WORKER_SOURCE])
+        for name in sorted(os.listdir(tmp_dir),
+                           key=lambda n: n == 'JsreWorker.class'):
+            os.rename(os.path.join(tmp_dir, name),
+                      os.path.join(build_dir, name))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return build_dir
+
+
+def java_version():
+    """ Returns the major version of the java command (e.g., 8 for 1.8.0 and
+    17 for 17.0.2), or None if it is not known
+    """
+    try:
+        output = subprocess.check_output(['java', '-version'],
+                                         stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+    if match is None:
+        return None
+    major = int(match.group(1))
+    if major == 1 and match.group(2):
+        major = int(match.group(2))
+    return major
+
+
+def java_worker_command(jsre_model, build_dir, java_options=('-mx256M',)):
+    """ Returns the command starting a JsreWorker.java worker, compiling it if
+    needed
+
+    Args:
+        jsre_model (str): Path to the jSRE model.
+        build_dir (str): Directory of the compiled worker.
+    """
+    compile_worker(build_dir)
+    classpath = build_dir
+    if os.environ.get('CLASSPATH'):
+        classpath += ':' + os.environ['CLASSPATH']
+
+    java_options = list(java_options)
+    # JDK 18 to 23 only let the worker install the security manager trapping
+    # the exits of jSRE with this option (see JsreWorker.trapExit())
+    version = java_version()
+    if version is not None and 18 <= version < 24:
+        java_options.append('-Djava.security.manager=allow')
+
+    return ['java'] + java_options + \
+        ['-cp', classpath, 'JsreWorker', jsre_model]
+
+
+class WorkerError(Exception):
+    pass
+
+
+class WorkerUnsupportedError(WorkerError):
+    """ The worker cannot run on this JVM (e.g., it cannot trap the exits of
+    jSRE), so restarting it does not help """
+    pass
+
+
+class JsreWorker(object):
+    """ A long-lived jSRE prediction process, so that predictions do not pay
+    for the start of a JVM and the loading of the model each time. The process
+    reads batches of records on its standard input and writes their labels on
+    its standard output (see JsreWorker.java). If the process cannot keep the
+    model loaded, it reads the model for every batch, and model_reloaded is
+    set. The process is restarted if it crashes.
+    """
+
+    def __init__(self, command, tmp_dir='/tmp', config_files=(),
+                 max_restarts=3):
+        """
+        Args:
+            command (list): Command starting the worker process (e.g.,
+                java_worker_command()). The path to a work directory of the
+                process, which is also its working directory, is appended to
+                it.
+            tmp_dir (str): Directory of the work directories of the process.
+            config_files (list): Files copied to the work directory (e.g.,
+                the jSRE config files).
+            max_restarts (int): Number of times the process is restarted for
+                a batch before giving up.
+        """
+        self.command = command
+        self.tmp_dir = tmp_dir
+        self.config_files = config_files
+        self.max_restarts = max_restarts
+        self.process = None
+        self.work_dir = None
+        self.restarts = 0
+        self.batches = 0
+        self.model_reloaded = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.work_dir = os.path.abspath(
+            tempfile.mkdtemp(prefix='jsre_worker_', dir=self.tmp_dir))
+        for config_file in self.config_files:
+            shutil.copy(config_file, self.work_dir)
+        fnull = open(os.devnull, 'w')
+        self.process = subprocess.Popen(self.command + [self.work_dir],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=fnull,
+                                        cwd=self.work_dir)
+        fnull.close()
+
+        line = self.process.stdout.readline()
+        status = line.split()
+        if status[:1] != ['READY']:
+            self.stop()
+            raise WorkerError('jSRE worker did not start: %r' % line)
+        if 'EXIT_UNTRAPPED' in status:
+            self.stop()
+            raise WorkerUnsupportedError('jSRE worker cannot trap the exits '
+                                         'of jSRE on this JVM')
+        self.check_model_reloaded(status)
+
+    def check_model_reloaded(self, status):
+        if 'MODEL_RELOADED' in status and not self.model_reloaded:
+            self.model_reloaded = True
+            warnings.warn('[WARNING] The jSRE worker cannot keep the jSRE '
+                          'model loaded, and reads it for every prediction')
+
+    def stop(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except IOError:
+                pass
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+        if self.work_dir is not None:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+    def request(self, records):
+        # Records are streamed to the worker as they are generated, and
+        # followed by an empty line
+        for r in records:
+            self.process.stdin.write(r.encode('utf8')
+                                     if isinstance(r, unicode) else r)
+        self.process.stdin.write('\n')
+        self.process.stdin.flush()
+
+        status = self.process.stdout.readline()
+        if not status:
+            raise WorkerError('jSRE worker exited')
+        if status.startswith('ERROR'):
+            return None
+
+        status = status.split()
+        self.check_model_reloaded(status)
+        count = int(status[1])
+        labels = []
+        for _ in range(count):
+            line = self.process.stdout.readline()
+            if not line:
+                raise WorkerError('jSRE worker exited')
+            labels.append(line)
+
+        return labels
+
+    def predict(self, records):
+        """ Predicts the labels of jSRE input records
+
+        Args:
+            records (iterable): jSRE input records, one per line. They are
+                iterated again if the worker is restarted.
+        Return:
+            the list of labels predicted by jSRE (one per record), or None if
+            jSRE did not produce any prediction. WorkerUnsupportedError is
+            raised if the worker cannot run on this JVM, and WorkerError if
+            it failed max_restarts + 1 times in a row.
+        """
+        with self.lock:
+            error = None
+            for attempt in range(self.max_restarts + 1):
+                try:
+                    if self.process is None or \
+                            self.process.poll() is not None:
+                        if attempt > 0 or self.process is not None:
+                            self.restarts += 1
+                        self.stop()
+                        self.start()
+                    labels = self.request(records)
+                    self.batches += 1
+                    return labels
+                except WorkerUnsupportedError:
+                    raise
+                except (IOError, OSError, ValueError, WorkerError) as e:
+                    error = e
+                    self.stop()
+
+            raise WorkerError('jSRE worker failed %d times: %s' %
+                              (self.max_restarts + 1, error))
+
+
+class JsreWorkerPool(object):
+    """ A pool of JsreWorker workers, so that several documents can be
+    predicted concurrently. Workers are started when first needed.
+    """
+
+    def __init__(self, command, size=1, tmp_dir='/tmp', config_files=(),
+                 max_restarts=3):
+        self.workers = [JsreWorker(command, tmp_dir, config_files,
+                                   max_restarts)
+                        for _ in range(size)]
+        self.idle = Queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        # Why the workers cannot run on this JVM, if they cannot
+        self.unsupported = None
+
+    def predict(self, records):
+        worker = self.idle.get()
+        try:
+            return worker.predict(records)
+        except WorkerUnsupportedError as e:
+            self.unsupported = str(e)
+            raise
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            with worker.lock:
+                worker.stop()
+
+    def stats(self):
+        stats = 'batches: %d, restarts: %d' % (
+            sum(w.batches for w in self.workers),
+            sum(w.restarts for w in self.workers))
+        if any(w.model_reloaded for w in self.workers):
+            stats += ', model read for every batch'
+        if self.unsupported is not None:
+            stats += ', not used: %s' % self.unsupported
+        return stats
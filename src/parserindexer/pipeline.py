@@ -0,0 +1,540 @@
+from __future__ import print_function
+
+import os
+import json
+import argparse
+from tqdm import tqdm
+from utils import LogUtil
+from utils import parallel_map
+from cache import DiskCache
+from cache import SqliteCache
+from bib_index import BibIndex
+from ads_client import AdsClient
+from ads_client import LpscIndex
+from checkpoint import Checkpoint
+from ioutils import input_files
+from ioutils import CrawlState
+from corenlp_tokens import json_default
+from sentences import encode_sentences
+
+
+def add_pipeline_args(parser, log_file, stages=()):
+    """
+    Adds the command line arguments shared by the parsers to an argument
+    parser. They are read by Pipeline.
+    :param parser: argparse.ArgumentParser of a parser
+    :param log_file: default log file of the parser
+    :param stages: stages run by the parser after TIKA, among 'ads',
+    'corenlp' and 'jsre'
+    """
+    input_parser = parser.add_mutually_exclusive_group(required=True)
+    input_parser.add_argument('-i', '--in_file', help='Path to input file')
+    input_parser.add_argument('-li', '--in_list', help='Path to input list')
+    input_parser.add_argument('-d', '--in_dir',
+                              help='Path to an input directory, which '
+                                   'is searched recursively for the '
+                                   'files matching --pattern')
+    parser.add_argument('-o', '--out_file', required=True,
+                        help='Path to output JSON file')
+    parser.add_argument('-l', '--log_file', default=log_file,
+                        help='Log file that contains processing information. '
+                             'It is default to %s unless otherwise '
+                             'specified.' % log_file)
+    parser.add_argument('-p', '--tika_server_url', required=False,
+                        help='Tika server URL. Several comma-separated URLs '
+                             'spread the load over a pool of Tika servers')
+    parser.add_argument('-ps', '--tika_slow_threshold', type=float,
+                        help='With several Tika servers, eject the servers '
+                             'taking longer than this many seconds to answer '
+                             'a health probe, until they answer in time '
+                             'again. Default is no limit')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of documents processed concurrently. '
+                             'Default is 1 (sequential processing)')
+    parser.add_argument('-co', '--completion_order', action='store_true',
+                        help='Write documents to the output file in the order '
+                             'they complete rather than in the input order')
+    parser.add_argument('-tc', '--tika_cache_dir', required=False,
+                        help='Directory of a persistent cache of Tika parse '
+                             'results. Files whose content has not changed '
+                             'are not sent to the Tika server again')
+    parser.add_argument('-tcs', '--tika_cache_size', type=int,
+                        help='Maximum size of the Tika cache in MB. The least '
+                             'recently used entries are evicted when the '
+                             'cache grows beyond this size. Default is no '
+                             'limit')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='Resume an interrupted run: skip the files '
+                             'completed according to the manifest file '
+                             '(<out_file>.manifest), reprocess the ones '
+                             'changed since, and append to the output file')
+    parser.add_argument('-pt', '--pattern', default='*.pdf',
+                        help='Comma-separated glob patterns of the file '
+                             'names to process in --in_dir, matched case '
+                             'insensitively. Default is *.pdf')
+    parser.add_argument('-s', '--crawl_state', required=False,
+                        help='State file of incremental crawls of '
+                             '--in_dir. It records the modification time '
+                             'and size of the processed files, so that '
+                             'later runs only process new or modified '
+                             'files')
+
+    if 'ads' in stages:
+        add_ads_args(parser)
+    if 'corenlp' in stages:
+        add_corenlp_args(parser)
+    if 'jsre' in stages:
+        add_jsre_args(parser)
+
+
+def pipeline_args(stages, options, **params):
+    """
+    Builds the arguments of a Pipeline from the keyword arguments of the
+    process() function of a parser, so that it can be called from Python as
+    well as from its command line
+    :param stages: stages run by the parser after TIKA (see add_pipeline_args)
+    :param options: other arguments of add_pipeline_args() (e.g.,
+    {'workers': 4}). The missing ones take their command line defaults
+    :param params: named parameters of the process() function
+    :return: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser()
+    add_pipeline_args(parser, None, stages)
+    args = argparse.Namespace()
+    for action in parser._actions:
+        if action.default != argparse.SUPPRESS:
+            setattr(args, action.dest, action.default)
+
+    for key, value in options.items():
+        if not hasattr(args, key):
+            raise TypeError('process() got an unexpected keyword argument '
+                            '%r' % key)
+        setattr(args, key, value)
+    for key, value in params.items():
+        setattr(args, key, value)
+
+    return args
+
+
+def add_ads_args(parser):
+    parser.add_argument('-a', '--ads_url',
+                        default='https://api.adsabs.harvard.edu/v1/search/query',
+                        help='ADS RESTful API. The ADS RESTful API should not '
+                             'need to be changed frequently unless someting at '
+                             'the ADS is changed.')
+    parser.add_argument('-t', '--ads_token',
+                        default='jON4eu4X43ENUI5ugKYc6GZtoywF376KkKXWzV8U',
+                        help='The ADS token, which is required to use the ADS '
+                             'RESTful API. The token was obtained using the '
+                             'instructions at '
+                             'https://github.com/adsabs/adsabs-dev-api#access. '
+                             'The ADS token should not need to be changed '
+                             'frequently unless something at the ADS is '
+                             'changed.')
+    parser.add_argument('-ac', '--ads_cache_file', required=False,
+                        help='SQLite database file of a persistent '
+                             'cache of ADS query results. Queries found '
+                             'in the cache are not sent to the ADS '
+                             'database again')
+    parser.add_argument('-act', '--ads_cache_ttl', type=float,
+                        help='Number of days the ADS query results '
+                             'stay in the ADS cache. Default is no '
+                             'expiry')
+    parser.add_argument('-acn', '--ads_cache_negative_ttl', type=float,
+                        help='Number of days the ADS queries that '
+                             'found no document stay in the ADS cache. '
+                             'Default is the same as --ads_cache_ttl')
+    parser.add_argument('-acc', '--ads_concurrency', type=int, default=4,
+                        help='Maximum number of concurrent requests to '
+                             'the ADS database. Default is 4')
+    parser.add_argument('-ar', '--ads_retries', type=int, default=5,
+                        help='Number of times an ADS request failing '
+                             'with HTTP 429, HTTP 5xx or a connection '
+                             'error is retried, with exponential '
+                             'backoff. Default is 5')
+    parser.add_argument('-ab', '--ads_batch_size', type=int, default=1,
+                        help='Maximum number of concurrent LPSC '
+                             'abstract lookups batched into a single '
+                             'ADS query. Default is 1 (no batching)')
+    parser.add_argument('-bf', '--bib_files', nargs='+',
+                        help='Bibliographic dump files (CSV, JSON or '
+                             'JSON lines) of ADS records. If provided, '
+                             'documents are looked up offline in an '
+                             'index of these records instead of the ADS '
+                             'database')
+    parser.add_argument('-bt', '--bib_threshold', type=float, default=0.8,
+                        help='Minimum similarity (between 0 and 1) of the '
+                             'titles matched in the bibliographic index. '
+                             'Default is 0.8')
+
+
+def add_corenlp_args(parser):
+    parser.add_argument('-c', '--corenlp_server_url',
+                        default='http://localhost:9000',
+                        help='CoreNLP Server URL. Several comma-separated '
+                             'URLs spread the load over several CoreNLP '
+                             'servers')
+    parser.add_argument('-n', '--ner_model', required=False,
+                        help='Path to a Named Entity Recognition (NER) model')
+    parser.add_argument('-cc', '--corenlp_chunk_chars', type=int,
+                        help='Annotate the documents longer than this '
+                             'number of characters in chunks, split at '
+                             'paragraph or sentence boundaries. Chunks '
+                             'that time out are split again. Default is '
+                             'no chunking')
+    parser.add_argument('-ccw', '--corenlp_chunk_workers', type=int,
+                        default=4,
+                        help='Number of chunks of a document annotated '
+                             'concurrently by CoreNLP. Default is 4')
+    parser.add_argument('-cn', '--corenlp_concurrency', type=int,
+                        default=4,
+                        help='Maximum number of concurrent requests to '
+                             'the CoreNLP server(s), over kept-alive '
+                             'connections. Default is 4')
+    parser.add_argument('-cd', '--corenlp_cache_dir', required=False,
+                        help='Directory of a persistent cache of CoreNLP '
+                             'annotations. Documents annotated before with '
+                             'the same NER model are not sent to the '
+                             'CoreNLP server again')
+    parser.add_argument('-cds', '--corenlp_cache_size', type=int,
+                        help='Maximum size of the CoreNLP cache in MB. The '
+                             'least recently used entries are evicted when '
+                             'the cache grows beyond this size. Default is '
+                             'no limit')
+    parser.add_argument('-cp', '--corenlp_protobuf', action='store_true',
+                        help='Request the protobuf output of CoreNLP, which '
+                             'is several times smaller than its JSON output, '
+                             'and decode its tokens into compact objects. '
+                             'Requires the corenlp-protobuf package')
+    parser.add_argument('-cm', '--corenlp_minimal_annotators',
+                        action='store_true',
+                        help='Only run the CoreNLP annotators producing the '
+                             'token fields the parser reads. The sentences '
+                             'written by the CoreNLP and unary parsers then '
+                             'have no pos and lemma fields')
+    parser.add_argument('-cb', '--corenlp_batch_size', type=int, default=1,
+                        help='Maximum number of documents parsed '
+                             'concurrently (see --workers) annotated by a '
+                             'single CoreNLP request. Default is 1 (no '
+                             'batching)')
+    parser.add_argument('-cbc', '--corenlp_batch_chars', type=int,
+                        default=100000,
+                        help='Number of characters from which a batch is '
+                             'sent without waiting for more documents, and '
+                             'maximum number of characters of a CoreNLP '
+                             'request. Default is 100000')
+    parser.add_argument('-cbw', '--corenlp_batch_wait', type=float,
+                        default=0.5,
+                        help='Number of seconds a batch waits for more '
+                             'documents. Default is 0.5')
+    parser.add_argument('-cs', '--compact_sentences', action='store_true',
+                        help='Write the sentences of the documents in a '
+                             'compact columnar encoding (see sentences.py) '
+                             'rather than as CoreNLP sentences')
+
+
+def add_jsre_args(parser):
+    parser.add_argument('-jr', '--jsre_root', default='/proj/mte/jSRE/jsre-1.1',
+                        help='Path to jSRE installation directory. Default is '
+                             '/proj/mte/jSRE/jsre-1.1')
+    parser.add_argument('-jm', '--jsre_model', required=True,
+                        help='Path to jSRE model')
+    parser.add_argument('-jt', '--jsre_tmp_dir', default='/tmp',
+                        help='Path to a directory for jSRE to temporarily '
+                             'store input and output files. Default is /tmp')
+    parser.add_argument('-jw', '--jsre_workers', type=int, default=0,
+                        help='Number of long-lived jSRE worker processes, '
+                             'which start a JVM and load the jSRE model once '
+                             'and predict the relations of many documents. '
+                             'Default is 0 (a JVM is started for every '
+                             'document)')
+    parser.add_argument('-jb', '--jsre_batch_size', type=int, default=1,
+                        help='Maximum number of documents parsed '
+                             'concurrently (see --workers) whose relations '
+                             'are predicted by a single jSRE run. Default '
+                             'is 1 (no batching)')
+    parser.add_argument('-jbr', '--jsre_batch_records', type=int,
+                        default=1000,
+                        help='Number of jSRE records from which a batch is '
+                             'predicted without waiting for more documents. '
+                             'Default is 1000')
+    parser.add_argument('-jbw', '--jsre_batch_wait', type=float, default=0.5,
+                        help='Number of seconds a batch waits for more '
+                             'documents. Default is 0.5')
+    parser.add_argument('-jp', '--jsre_processes', type=int,
+                        help='Maximum number of jSRE predictions running in '
+                             'parallel, each in its own working directory '
+                             'under --jsre_tmp_dir. Default is the number '
+                             'of CPUs')
+
+
+def disk_cache(cache_dir, cache_size):
+    """
+    Opens the DiskCache of a --xxx_cache_dir argument, if provided
+    :param cache_size: maximum size of the cache in MB, or None
+    """
+    if not cache_dir:
+        return None
+    return DiskCache(cache_dir, cache_size and cache_size * 1024 * 1024)
+
+
+class Pipeline(object):
+    """ The Pipeline runs a parser over the input files of its command line
+    (see add_pipeline_args). It owns what the parsers share: the TIKA parser
+    and its cache, the ADS enrichment stage with its cache and client, the
+    CoreNLP cache, the checkpoint manifest, the crawl state and the output
+    file. The statistics of the caches, clients and batchers are written to
+    the log file at the end of the run.
+    """
+
+    def __init__(self, args, name):
+        """
+        Args:
+            args (argparse.Namespace): Arguments added by add_pipeline_args(),
+                and those of the parser, which are all logged. The documents
+                are enriched with ADS metadata if the ADS arguments were
+                added.
+            name (str): Name of the parser in the log messages (e.g., 'JSRE
+                parser').
+        """
+        # Imported here, as the parser modules import this module
+        from tika_parser import TikaParser
+        from ads_parser import AdsParser
+        from ads_parser import AdsEnrichmentStage
+
+        self.args = args
+        self.name = name
+        self.logger = LogUtil(args.log_file)
+        self.logger.info('Input parameters')
+        for key, value in sorted(vars(args).items()):
+            self.logger.info('%s: %s' % (key, value))
+
+        # (label, object with a stats() method) tuples logged at the end of
+        # the run, and functions called at the end of the run
+        self.stats = []
+        self.closers = []
+
+        self.tika_cache = disk_cache(args.tika_cache_dir, args.tika_cache_size)
+        self.log_stats('Tika cache', self.tika_cache)
+        self.corenlp_cache = None
+        self.ads_parser = None
+        self.ads_stage = None
+        if not hasattr(args, 'ads_url'):
+            self.tika_parser = TikaParser(args.tika_server_url,
+                                          self.tika_cache)
+            self.parse_tika = self.tika_parser.parse
+            self.setup_tika()
+            return
+
+        ads_cache = None
+        if args.ads_cache_file:
+            ads_cache = SqliteCache(args.ads_cache_file,
+                                    args.ads_cache_ttl and
+                                    args.ads_cache_ttl * 86400,
+                                    args.ads_cache_negative_ttl and
+                                    args.ads_cache_negative_ttl * 86400)
+            self.log_stats('ADS cache', ads_cache)
+            self.closers.append(ads_cache.close)
+        # The lookups run in the threads of the ADS enrichment stage, for at
+        # most the documents pending in the parallel_map of run(): 2 per
+        # worker, or 1 without workers
+        ads_threads = max(args.ads_concurrency, args.ads_batch_size)
+        ads_lookups = 2 * args.workers if args.workers > 1 else 1
+        ads_client = AdsClient(args.ads_token, args.ads_url,
+                               args.ads_concurrency, args.ads_retries,
+                               args.ads_batch_size,
+                               batch_submitters=min(ads_threads, ads_lookups))
+        self.log_stats('ADS client', ads_client)
+        lpsc_index = None
+        if getattr(args, 'lpsc_prefetch', False):
+            lpsc_index = LpscIndex(ads_client, ads_cache)
+        bib_index = None
+        if args.bib_files:
+            bib_index = BibIndex(args.bib_threshold)
+            for bib_file in args.bib_files:
+                bib_index.load(bib_file)
+            self.logger.info('Bibliographic index: %d records' %
+                             len(bib_index.records))
+
+        self.ads_parser = AdsParser(args.ads_token, args.ads_url,
+                                    args.tika_server_url, self.tika_cache,
+                                    ads_cache, ads_client, lpsc_index,
+                                    bib_index)
+        self.ads_stage = AdsEnrichmentStage(self.ads_parser, ads_threads)
+        self.tika_parser = self.ads_parser
+        self.parse_tika = self.ads_parser.parse_tika
+        self.setup_tika()
+
+    def setup_tika(self):
+        """ Configures the pool of Tika servers, if any """
+        if self.args.tika_slow_threshold is not None:
+            self.tika_parser.enable_slow_server_ejection(
+                self.args.tika_slow_threshold)
+        self.log_stats('Tika servers', self.tika_parser.server_pool)
+        if self.tika_parser.server_pool is not None:
+            self.closers.append(self.tika_parser.server_pool.close)
+
+    def log_stats(self, label, obj):
+        """ Logs obj.stats() at the end of the run, unless obj is None """
+        if obj is not None:
+            self.stats.append((label, obj))
+
+    def setup_corenlp(self, corenlp_parser):
+        """ Configures a CoreNLPParser (or subclass) from the CoreNLP
+        arguments: chunking, cache, output format and batching
+
+        Return:
+            corenlp_parser
+        """
+        args = self.args
+        if args.corenlp_chunk_chars:
+            corenlp_parser.enable_chunking(args.corenlp_chunk_chars,
+                                           args.corenlp_chunk_workers)
+        self.corenlp_cache = disk_cache(args.corenlp_cache_dir,
+                                        args.corenlp_cache_size)
+        if self.corenlp_cache is not None:
+            corenlp_parser.enable_cache(self.corenlp_cache)
+            self.log_stats('CoreNLP cache', self.corenlp_cache)
+        if args.corenlp_protobuf:
+            corenlp_parser.enable_protobuf()
+        if args.corenlp_minimal_annotators:
+            corenlp_parser.enable_minimal_annotators()
+        if args.corenlp_batch_size > 1:
+            corenlp_parser.enable_document_batching(args.corenlp_batch_size,
+                                                    args.corenlp_batch_chars,
+                                                    args.corenlp_batch_wait,
+                                                    args.workers)
+            self.log_stats('CoreNLP batches', corenlp_parser.document_batcher)
+
+        return corenlp_parser
+
+    def jsre_parser(self):
+        """ Builds the JsreParser of the jSRE-based parsers from the CoreNLP
+        and jSRE arguments
+        """
+        from jsre_parser import JsreParser
+
+        args = self.args
+        jsre_parser = JsreParser(args.corenlp_server_url, args.ner_model,
+                                 args.jsre_root, args.jsre_model,
+                                 args.jsre_tmp_dir, args.corenlp_concurrency,
+                                 args.jsre_processes)
+        self.setup_corenlp(jsre_parser)
+        if args.jsre_workers > 0:
+            jsre_parser.enable_workers(args.jsre_workers)
+            self.log_stats('jSRE workers', jsre_parser.worker_pool)
+        if args.jsre_batch_size > 1:
+            jsre_parser.enable_batching(args.jsre_batch_size,
+                                        args.jsre_batch_records,
+                                        args.jsre_batch_wait, args.workers)
+            self.log_stats('jSRE batches', jsre_parser.batcher)
+        self.closers.append(jsre_parser.close)
+
+        return jsre_parser
+
+    def output_sentences(self, sentences):
+        """ Returns the CoreNLP sentences of a document as they are written
+        to the output file (see --compact_sentences)
+        """
+        if getattr(self.args, 'compact_sentences', False):
+            return encode_sentences(sentences)
+        return sentences
+
+    def run(self, parse_document=None, query=None):
+        """
+        Parses the input files with TIKA, enriches them with ADS metadata if
+        the ADS arguments were added, and writes them to the output file
+
+        Args:
+            parse_document (callable): Function called with the path and the
+                dictionary of each document parsed by TIKA, which it updates
+                in place (e.g., with CoreNLP entities). The ADS lookup of the
+                document runs in the background meanwhile.
+            query (callable): Function returning the ADS query dictionary of
+                a path (see AdsParser.construct_query_string). By default,
+                documents are looked up by title.
+        """
+        args = self.args
+
+        def parse_file(f):
+            self.logger.info('Processing %s' % os.path.basename(f))
+            try:
+                doc = self.parse_tika(f)
+                enrichment = None
+                if self.ads_stage is not None:
+                    enrichment = self.ads_stage.submit(
+                        doc, query(f) if query is not None else None)
+                if parse_document is not None:
+                    parse_document(f, doc)
+
+                return doc, enrichment
+            except Exception as e:
+                self.logger.info('%s failed: %s' % (self.name,
+                                                    os.path.abspath(f)))
+                self.logger.error(e)
+
+        def enrich_file(f, result):
+            # Attaches the ADS metadata once its lookup, which runs in the
+            # background, completes
+            if result is None:
+                return None
+            doc, enrichment = result
+            if enrichment is None:
+                return doc
+            try:
+                return enrichment.get()
+            except Exception as e:
+                self.logger.info('%s failed: %s' % (self.name,
+                                                    os.path.abspath(f)))
+                self.logger.error(e)
+
+        # Incremental crawls skip the files of in_dir that have not changed
+        # since a previous run processed them
+        state = CrawlState(args.crawl_state) if args.crawl_state else None
+        files = input_files(args.in_file, args.in_list, args.in_dir,
+                            args.pattern, state)
+
+        # The manifest records the completed and failed files, so that an
+        # interrupted run can be resumed
+        checkpoint = Checkpoint('%s.manifest' % args.out_file, args.resume)
+        if args.resume:
+            current_paths, stale = checkpoint.current_paths()
+            removed = Checkpoint.prepare_output(args.out_file, current_paths)
+            files = checkpoint.pending(files, current_paths)
+            self.logger.info('Resuming: skipping %d completed files, '
+                             'processing again %d files changed since, '
+                             'removed %d records from the output file' %
+                             (len(current_paths), stale, removed))
+
+        # Crawled directories are streamed, so their size is not known upfront
+        total = len(files) if isinstance(files, list) else None
+        out_f = open(args.out_file, 'ab' if args.resume else 'wb', 1)
+        results = parallel_map(parse_file, files, args.workers,
+                               ordered=not args.completion_order)
+        try:
+            for f, result in tqdm(results, total=total):
+                doc = enrich_file(f, result)
+                if doc is None:
+                    checkpoint.failed(f)
+                    continue
+
+                out_f.write(json.dumps(doc, default=json_default))
+                out_f.write('\n')
+                checkpoint.completed(f)
+                if state is not None:
+                    state.mark_processed(f)
+        finally:
+            # The files processed so far are not crawled again, even if the
+            # run fails
+            if state is not None:
+                state.save()
+
+        if self.ads_stage is not None:
+            self.ads_stage.close()
+        out_f.close()
+        checkpoint.close()
+
+        for label, obj in self.stats:
+            self.logger.info('%s %s' % (label, obj.stats()))
+        for close in self.closers:
+            close()
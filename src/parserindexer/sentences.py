@@ -0,0 +1,389 @@
+from __future__ import print_function
+
+import time
+
+# Version of the columnar encoding, stored in the encoded sentences.
+# Version 1 did not tell fields missing from a record from None values.
+COLUMNAR_VERSION = 2
+
+OFFSET_FIELDS = ('characterOffsetBegin', 'characterOffsetEnd')
+
+
+def encode_sentences(sentences):
+    """
+    Encodes the CoreNLP sentences of a document into columns: the values of
+    each token field are stored in one list per sentence, the strings (words,
+    lemmas, POS and NER tags, etc.) as indices in a table of the distinct
+    strings of the document, and the character offsets as differences with
+    the previous offset. Other lists of records of the sentences (e.g., the
+    entity mentions) are stored in columns too. Tokens no longer repeat the
+    names of their fields, and the output is several times smaller.
+    :param sentences: list of CoreNLP sentences
+    :return: dictionary with the encoded sentences, to be decoded by
+    decode_sentences()
+    """
+    strings = []
+    string_ids = {}
+
+    def intern(value):
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    encoded = []
+    for sentence in sentences:
+        tokens = sentence['tokens']
+        offsets = None
+        if all(isinstance(token.get(field), int) for token in tokens
+               for field in OFFSET_FIELDS):
+            offsets = []
+            previous = 0
+            for token in tokens:
+                for field in OFFSET_FIELDS:
+                    offsets.append(token[field] - previous)
+                    previous = token[field]
+
+        encoded_tokens = encode_columns(
+            tokens, intern, OFFSET_FIELDS if offsets is not None else ())
+        columns = encoded_tokens['columns']
+        if columns.get('_index') == list(range(1, len(tokens) + 1)):
+            # Token indices are implicit
+            del columns['_index']
+        elif '_index' not in columns and 'index' not in columns:
+            encoded_tokens['no_index'] = True
+        if offsets is not None:
+            encoded_tokens['offsets'] = offsets
+
+        encoded_sentence = {}
+        for key, value in sentence.items():
+            if key != 'tokens' and is_record_list(value):
+                value = encode_columns(value, intern)
+            encoded_sentence[key] = value
+        encoded_sentence['tokens'] = encoded_tokens
+        encoded.append(encoded_sentence)
+
+    return {
+        'columnar': COLUMNAR_VERSION,
+        'strings': strings,
+        'sentences': encoded
+    }
+
+
+def is_record_list(value):
+    return isinstance(value, list) and len(value) > 0 and \
+        all(isinstance(v, dict) for v in value)
+
+
+def encode_columns(records, intern, skip_fields=()):
+    """
+    Encodes records into columns
+    :param records: list of dictionaries (or CoreNLPToken tokens)
+    :param intern: function returning the index of a string in the string
+    table
+    :param skip_fields: fields not encoded
+    :return: dictionary with the number of records ('count'), the values of
+    each field ('columns') and, if some records lack some fields, the indices
+    of these records by field ('missing'). Fields whose values are all
+    strings are stored as string indices, others as they are, with an
+    underscore prefix. Missing values are stored as None.
+    """
+    fields = []
+    for record in records:
+        for field in record.keys():
+            if field not in fields and field not in skip_fields:
+                fields.append(field)
+
+    columns = {}
+    missing = {}
+    for field in fields:
+        values = []
+        for i, record in enumerate(records):
+            if field in record:
+                values.append(record[field])
+            else:
+                missing.setdefault(field, []).append(i)
+                values.append(None)
+
+        absent = set(missing.get(field, []))
+        if all(isinstance(v, basestring) for i, v in enumerate(values)
+               if i not in absent):
+            columns[field] = [None if i in absent else intern(v)
+                              for i, v in enumerate(values)]
+        else:
+            # Other values (e.g., numbers) are stored as they are
+            columns['_' + field] = values
+
+    encoded = {'count': len(records), 'columns': columns}
+    if len(missing) > 0:
+        encoded['missing'] = missing
+    return encoded
+
+
+def decode_columns(records, strings, version=COLUMNAR_VERSION):
+    """
+    Decodes records encoded by encode_columns()
+    :param version: version of the encoding
+    :return: list of dictionaries
+    """
+    missing = missing_fields(records, version)
+    decoded = [{} for _ in range(records['count'])]
+    for column, values in records['columns'].items():
+        field = column[1:] if column.startswith('_') else column
+        absent = missing.get(field, ())
+        for i, (record, value) in enumerate(zip(decoded, values)):
+            if i in absent:
+                continue
+            record[field] = value if column.startswith('_') else strings[value]
+
+    return decoded
+
+
+def missing_fields(records, version=COLUMNAR_VERSION):
+    """
+    :param records: records encoded by encode_columns()
+    :param version: version of the encoding
+    :return: dictionary of the sets of indices of the records lacking each
+    field, for the fields some records lack
+    """
+    if version > 1:
+        return dict((field, set(indices))
+                    for field, indices in records.get('missing', {}).items())
+
+    # Version 1 stored missing values as None, and no explicit None
+    missing = {}
+    for column, values in records['columns'].items():
+        if column.startswith('_'):
+            indices = set(i for i, v in enumerate(values) if v is None)
+            if len(indices) > 0:
+                missing[column[1:]] = indices
+    return missing
+
+
+def decode_sentences(value):
+    """
+    Decodes the sentences of a document
+    :param value: the sentences field of a document, either encoded by
+    encode_sentences() or a list of CoreNLP sentences
+    :return: a list of sentences, whose tokens are accessed like CoreNLP
+    tokens (e.g., sentences[0]['tokens'][1]['word']). Encoded sentences are
+    decoded lazily, when their tokens are accessed.
+    """
+    if isinstance(value, dict) and 'columnar' in value:
+        if value['columnar'] not in (1, COLUMNAR_VERSION):
+            raise RuntimeError('Unsupported columnar sentences version: %s' %
+                               value['columnar'])
+        return SentenceList(value)
+    return value
+
+
+def decode_record(doc):
+    """
+    Decodes the sentences of a record of an output file in place, so that
+    they are read like CoreNLP sentences whatever their encoding (see
+    --compact_sentences)
+    :param doc: record of a JSON lines output file
+    :return: doc
+    """
+    metadata = doc.get('metadata')
+    if isinstance(metadata, dict) and 'sentences' in metadata:
+        metadata['sentences'] = decode_sentences(metadata['sentences'])
+    return doc
+
+
+class SentenceList(object):
+    """ A read-only list of columnar sentences """
+
+    def __init__(self, encoded):
+        self.strings = encoded['strings']
+        self.sentences = encoded['sentences']
+        self.version = encoded['columnar']
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [SentenceView(s, self.strings, self.version)
+                    for s in self.sentences[i]]
+        return SentenceView(self.sentences[i], self.strings, self.version)
+
+    def __iter__(self):
+        for sentence in self.sentences:
+            yield SentenceView(sentence, self.strings, self.version)
+
+    def to_list(self):
+        """
+        :return: the sentences as a list of CoreNLP sentences
+        """
+        return [sentence.to_dict() for sentence in self]
+
+
+class SentenceView(object):
+    """ A read-only columnar sentence, accessed like a CoreNLP sentence """
+
+    def __init__(self, sentence, strings, version=COLUMNAR_VERSION):
+        self.sentence = sentence
+        self.strings = strings
+        self.version = version
+        self.tokens = None
+
+    def __getitem__(self, key):
+        if key == 'tokens':
+            if self.tokens is None:
+                self.tokens = TokenList(self.sentence['tokens'], self.strings,
+                                        self.version)
+            return self.tokens
+        value = self.sentence[key]
+        if isinstance(value, dict) and 'columns' in value:
+            return decode_columns(value, self.strings, self.version)
+        return value
+
+    def __contains__(self, key):
+        return key in self.sentence
+
+    def get(self, key, default=None):
+        return self[key] if key in self.sentence else default
+
+    def keys(self):
+        return list(self.sentence.keys())
+
+    def to_dict(self):
+        sentence = dict((key, self[key]) for key in self.sentence)
+        sentence['tokens'] = [token.to_dict() for token in self['tokens']]
+        return sentence
+
+
+class TokenList(object):
+    """ The read-only tokens of a columnar sentence """
+
+    def __init__(self, tokens, strings, version=COLUMNAR_VERSION):
+        self.count = tokens['count']
+        self.columns = tokens['columns']
+        self.strings = strings
+        self.missing = missing_fields(tokens, version)
+        # Token indices 1..n are elided
+        self.implicit_index = '_index' not in self.columns and \
+            'index' not in self.columns and not tokens.get('no_index', False)
+        self.offsets = None
+        if 'offsets' in tokens:
+            # Differences with the previous offset
+            self.offsets = []
+            offset = 0
+            for delta in tokens['offsets']:
+                offset += delta
+                self.offsets.append(offset)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [TokenView(self, j) for j in range(self.count)[i]]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('token index out of range')
+        return TokenView(self, i)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield TokenView(self, i)
+
+    def fields(self, i=None):
+        """
+        :param i: index of a token
+        :return: the fields of the tokens, or of token i only
+        """
+        fields = [f[1:] if f.startswith('_') else f for f in self.columns]
+        if i is not None and len(self.missing) > 0:
+            fields = [f for f in fields if i not in self.missing.get(f, ())]
+        if self.implicit_index:
+            fields.append('index')
+        if self.offsets is not None:
+            fields.extend(OFFSET_FIELDS)
+        return fields
+
+
+class TokenView(object):
+    """ A read-only token of a columnar sentence, accessed like a CoreNLP
+    token """
+
+    __slots__ = ('tokens', 'i')
+
+    def __init__(self, tokens, i):
+        self.tokens = tokens
+        self.i = i
+
+    def __getitem__(self, field):
+        tokens = self.tokens
+        if field in tokens.missing and self.i in tokens.missing[field]:
+            raise KeyError(field)
+        column = tokens.columns.get(field)
+        if column is not None:
+            return tokens.strings[column[self.i]]
+        column = tokens.columns.get('_' + field)
+        if column is not None:
+            return column[self.i]
+        if field == 'index' and tokens.implicit_index:
+            return self.i + 1
+        if tokens.offsets is not None and field in OFFSET_FIELDS:
+            return tokens.offsets[2 * self.i + OFFSET_FIELDS.index(field)]
+        raise KeyError(field)
+
+    def __contains__(self, field):
+        return field in self.tokens.fields(self.i)
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.tokens.fields(self.i)
+
+    def to_dict(self):
+        return dict((field, self[field]) for field in self.keys())
+
+
+def main():
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compares the size and the '
+                                     'loading time of the sentences of the '
+                                     'documents of a JSON lines file, as '
+                                     'CoreNLP sentences and encoded into '
+                                     'columns')
+    parser.add_argument('-i', '--in_file', required=True,
+                        help='Path to the JSON lines output file of a parser')
+    args = parser.parse_args()
+
+    raw_lines = []
+    encoded_lines = []
+    with open(args.in_file, 'r') as f:
+        for line in f:
+            sentences = json.loads(line)['metadata'].get('sentences')
+            if not sentences:
+                continue
+            sentences = decode_sentences(sentences)
+            if isinstance(sentences, SentenceList):
+                sentences = sentences.to_list()
+            raw_lines.append(json.dumps(sentences))
+            encoded_lines.append(json.dumps(encode_sentences(sentences)))
+
+    for name, lines in [('CoreNLP', raw_lines), ('columnar', encoded_lines)]:
+        start = time.time()
+        words = 0
+        for line in lines:
+            for sentence in decode_sentences(json.loads(line)):
+                words += len([t['word'] for t in sentence['tokens']])
+        elapsed = time.time() - start
+        print('%s: %d bytes, %d words loaded in %.3f seconds' %
+              (name, sum(len(line) for line in lines), words, elapsed))
+
+
+if __name__ == '__main__':
+    main()
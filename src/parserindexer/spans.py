@@ -0,0 +1,243 @@
+from __future__ import print_function
+
+import time
+import random
+from bisect import bisect_right
+from collections import defaultdict
+
+
+class SpanIndex(object):
+    """
+    An index of spans (e.g., named entities or relation targets) by begin
+    offset, to find the spans beginning at or after an offset without
+    scanning all the spans. Spans beginning at the same offset are kept in
+    their input order.
+    """
+
+    def __init__(self, spans, begin):
+        """
+        :param spans: list of spans
+        :param begin: function returning the begin offset of a span
+        """
+        order = sorted(range(len(spans)), key=lambda i: begin(spans[i]))
+        self.spans = [spans[i] for i in order]
+        self.begins = [begin(span) for span in self.spans]
+        self.by_begin = defaultdict(list)
+        for span, span_begin in zip(self.spans, self.begins):
+            self.by_begin[span_begin].append(span)
+
+    def starting_at(self, offset):
+        """
+        :return: list of the spans beginning at offset
+        """
+        return self.by_begin.get(offset, [])
+
+    def first_after(self, offset):
+        """
+        :return: the first span beginning after offset, or None
+        """
+        i = bisect_right(self.begins, offset)
+        return self.spans[i] if i < len(self.spans) else None
+
+
+def merge_pairs(spans, begin, end, can_merge, merge, gap=1):
+    """
+    Merges each span with the first span beginning gap characters after its
+    end, if they can be merged. Merged spans are not merged again: of three
+    adjacent spans, the first two are merged and the third one is left alone.
+    :param spans: list of spans, which is sorted by begin offset
+    :param begin: function returning the begin offset of a span
+    :param end: function returning the end offset of a span
+    :param can_merge: function telling whether two spans can be merged
+    :param merge: function merging the second span into the first one, in
+    place
+    :param gap: number of characters between the spans merged
+    :return: list of the spans left after merging, sorted by begin offset
+    """
+    spans.sort(key=begin)
+    index = SpanIndex(spans, begin)
+    merged_ids = set()
+    new_spans = []
+    for span in spans:
+        if id(span) in merged_ids:
+            continue
+        for next_span in index.starting_at(end(span) + gap):
+            if can_merge(span, next_span):
+                merge(span, next_span)
+                merged_ids.add(id(next_span))
+                break
+
+        # Either way, save this one
+        new_spans.append(span)
+
+    return new_spans
+
+
+def merge_runs(spans, begin, end, merge, gap=1):
+    """
+    Merges the runs of consecutive spans in which each span begins gap
+    characters after the end of the previous one, in a single pass over the
+    spans in their input order
+    :param spans: list of spans
+    :param begin: function returning the begin offset of a span
+    :param end: function returning the end offset of a span
+    :param merge: function merging the second span into the first one, in
+    place
+    :param gap: number of characters between the spans merged
+    :return: list of the spans left after merging
+    """
+    new_spans = []
+    for span in spans:
+        if len(new_spans) > 0 and end(new_spans[-1]) + gap == begin(span):
+            merge(new_spans[-1], span)
+        else:
+            new_spans.append(span)
+
+    return new_spans
+
+
+# Tokens joining the words around them into a single entity
+JOINERS = ['_', '-']
+
+
+def append_token(entities, token):
+    """
+    Appends the entity of a token to the entities of the previous tokens of
+    a sentence, merging it with the last entity if they have the same label
+    (other than 'O'), or with the second last one if they have the same label
+    and are joined by a hyphen or an underscore
+    :param entities: entities of the previous tokens, updated in place
+    :param token: entity dictionary of the token, with text, label,
+    doc_end_char and sent_end_idx keys. It is copied rather than added to
+    the entities.
+    """
+    if len(entities) == 0 or token['label'] == 'O':
+        entities.append(dict(token))
+        return
+
+    last = entities[-1]
+    if last['label'] == token['label']:
+        last['text'] = '%s %s' % (last['text'], token['text'])
+        last['doc_end_char'] = token['doc_end_char']
+        last['sent_end_idx'] = token['sent_end_idx']
+    elif len(entities) > 1 and last['text'] in JOINERS and \
+            entities[-2]['label'] == token['label']:
+        first = entities[-2]
+        first['text'] = '%s%s%s' % (first['text'], last['text'],
+                                    token['text'])
+        first['doc_end_char'] = token['doc_end_char']
+        first['sent_end_idx'] = token['sent_end_idx']
+        entities.pop(-1)
+    else:
+        entities.append(dict(token))
+
+
+def baseline_merge_pairs(spans, begin, end, can_merge, merge, gap=1):
+    """
+    Same as merge_pairs(), by scanning all the spans for the span following
+    each span (quadratic time), as CoreNLPParser did before spans.py. It is the baseline of
+    the benchmark of main().
+    """
+    spans.sort(key=begin)
+    new_spans = []
+    skip_spans = []
+    for span in spans:
+        if span in skip_spans:
+            continue
+        next_spans = [s for s in spans if can_merge(span, s) and
+                      begin(s) == end(span) + gap]
+        if len(next_spans) > 0:
+            merge(span, next_spans[0])
+            skip_spans.append(next_spans[0])
+
+        new_spans.append(span)
+
+    return new_spans
+
+
+def baseline_merge_runs(spans, begin, end, merge, gap=1):
+    """
+    Same as merge_runs(), by passing over the spans until no span can be
+    merged (one pass per span of the longest run), as json2brat.py did
+    before spans.py. It is the baseline of the
+    benchmark of main().
+    """
+    spans = list(spans)
+    change = True
+    while change:
+        change = False
+        for i in range(len(spans) - 1):
+            if i >= len(spans) - 1:
+                break
+            if end(spans[i]) + gap == begin(spans[i + 1]):
+                merge(spans[i], spans[i + 1])
+                del spans[i + 1]
+                change = True
+
+    return spans
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Times span merging on '
+                                     'synthetic documents having thousands '
+                                     'of entities, against the '
+                                     'implementations it replaced')
+    parser.add_argument('-n', '--num_entities', type=int, nargs='+',
+                        default=[1000, 4000, 16000],
+                        help='Numbers of entities of the documents. Default '
+                             'is 1000 4000 16000')
+    parser.add_argument('-nb', '--no_baseline', action='store_true',
+                        help='Do not time the previous implementations, '
+                             'whose pair merging takes about a minute on '
+                             '16000 entities')
+    args = parser.parse_args()
+
+    begin = lambda s: s['begin']
+    end = lambda s: s['end']
+    can_merge = lambda s1, s2: s1['label'] == s2['label'] == 'Target'
+    merge = lambda s1, s2: s1.update(text=s1['text'] + ' ' + s2['text'],
+                                     end=s2['end'])
+
+    for n in args.num_entities:
+        # Targets of one or two words, separated by other entities
+        names = []
+        offset = 0
+        for i in range(n):
+            label = random.choice(['Target', 'Target', 'Element', 'Mineral'])
+            names.append({'label': label, 'begin': offset,
+                          'end': offset + 4, 'text': 'Word'})
+            offset += random.choice([5, 5, 10])
+        random.shuffle(names)
+
+        benchmarks = [
+            ('merging pairs', merge_pairs, baseline_merge_pairs,
+             lambda f: f([dict(s) for s in names], begin, end, can_merge,
+                         merge)),
+            ('merging runs', merge_runs, baseline_merge_runs,
+             lambda f: f(sorted([dict(s) for s in names], key=begin), begin,
+                         end, merge))
+        ]
+        for label, function, baseline, run in benchmarks:
+            start = time.time()
+            merged = run(function)
+            elapsed = time.time() - start
+            print('%d entities: %d after %s in %.3f seconds' %
+                  (n, len(merged), label, elapsed))
+            if args.no_baseline:
+                continue
+
+            start = time.time()
+            baseline_merged = run(baseline)
+            baseline_elapsed = time.time() - start
+            print('%d entities: %d after %s in %.3f seconds with the '
+                  'previous implementation (%.1f times as long)%s' %
+                  (n, len(baseline_merged), label, baseline_elapsed,
+                   baseline_elapsed / max(elapsed, 1e-6),
+                   '' if baseline_merged == merged else
+                   ', WHICH MERGES DIFFERENTLY'))
+
+
+if __name__ == '__main__':
+    main()
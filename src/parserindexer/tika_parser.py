@@ -1,28 +1,71 @@
 from __future__ import print_function
 
 import os
-import sys
-import json
 import tika
-from tqdm import tqdm
-from utils import LogUtil
 from parser import Parser
-from ioutils import read_lines
+from ioutils import file_sha256
+from tika_pool import TikaServerPool
+from pipeline import Pipeline
+from pipeline import add_pipeline_args
+from pipeline import pipeline_args
 from tika import parser as tk_parser
 
 
 class TikaParser(Parser):
     """ The TikaParser class is wrapper of the Apache TIKA parse """
-    def __init__(self, tika_server_url):
+    def __init__(self, tika_server_url, cache=None):
+        """
+        Args:
+            tika_server_url (str): Tika server URL, or several comma-separated
+                URLs to spread the load over a pool of Tika servers. If None,
+                tika-python will start and use a local Tika server
+            cache (DiskCache): Optional cache of parse results. Results are
+                keyed by the SHA-256 of the file content and the Tika server
+                configuration, so unchanged files are not sent to Tika again
+        """
         super(TikaParser, self).__init__('tika_parser')
 
+        self.cache = cache
+        self.server_pool = None
+        urls = []
         if tika_server_url:
+            urls = [u.strip() for u in tika_server_url.split(',') if u.strip()]
+
+        # The servers of a pool are expected to be configured identically, so
+        # the cache fingerprint does not depend on which one parsed a file.
+        self.fingerprint = 'tika-python %s; endpoint %s' % (
+            getattr(tika, '__version__', 'unknown'),
+            ','.join(sorted(urls)) or 'local')
+
+        if urls:
             os.environ['TIKA_CLIENT_ONLY'] = 'True'
-            os.environ['TIKA_SERVER_ENDPOINT'] = tika_server_url
-            print("Tika Server Endpoint %s" %
-                  os.environ['TIKA_SERVER_ENDPOINT'])
+            os.environ['TIKA_SERVER_ENDPOINT'] = urls[0]
+            self.server_pool = TikaServerPool(urls)
+            print("Tika Server Endpoint %s" % ', '.join(urls))
         tika.initVM()
 
+    def from_file(self, file_path):
+        """ Send one file to Tika. With a pool of Tika servers, a request that
+        fails because of its server (e.g., connection refused, timed out or
+        HTTP 5xx) is retried on another server.
+        """
+        if self.server_pool is None:
+            return tk_parser.from_file(file_path)
+
+        return self.server_pool.request(
+            lambda url: tk_parser.from_file(file_path, serverEndpoint=url))
+
+    def enable_slow_server_ejection(self, slow_threshold):
+        """ Eject the servers of the pool of Tika servers that take longer
+        than slow_threshold seconds to answer a health probe, until they
+        answer in time again
+
+        Args:
+            slow_threshold (float): health probe duration in seconds
+        """
+        if self.server_pool is not None:
+            self.server_pool.slow_threshold = slow_threshold
+
     def parse(self, file_path):
         """ Parse one PDF file using Apache TIKA parser
 
@@ -35,67 +78,41 @@ class TikaParser(Parser):
             raise RuntimeError('%s error. File not found: %s' %
                                (self.parse_name, os.path.abspath(file_path)))
 
-        try:
-            tika_dict = tk_parser.from_file(file_path)
-        except Exception:
-            raise RuntimeError('Internal TIKA error occurred while parsing the '
-                               'file: %s' % os.path.abspath(file_path))
-
-        tika_dict['file'] = os.path.abspath(file_path)
-
-        return tika_dict
-
-
-def process(in_file, in_list, out_file, log_file, tika_server_url):
-    # Log input parameters
-    logger = LogUtil('lpsc-parser', log_file)
-    logger.info('Input parameters')
-    logger.info('in_file: %s' % in_file)
-    logger.info('in_list: %s' % in_list)
-    logger.info('out_file: %s' % out_file)
-    logger.info('tika_server_url: %s' % tika_server_url)
+        tika_dict = None
+        if self.cache is not None:
+            cache_key = self.cache.key(file_sha256(file_path), self.fingerprint)
+            tika_dict = self.cache.get(cache_key)
 
-    if in_file and in_list:
-        print('[ERROR] in_file and in_list cannot be provided simultaneously')
-        sys.exit(1)
+        if tika_dict is None:
+            try:
+                tika_dict = self.from_file(file_path)
+            except Exception:
+                raise RuntimeError('Internal TIKA error occurred while parsing '
+                                   'the file: %s' % os.path.abspath(file_path))
 
-    tika_parser = TikaParser(tika_server_url)
+            # Only cache successful parses
+            if self.cache is not None and tika_dict.get('status') == 200:
+                self.cache.put(cache_key, tika_dict)
 
-    if in_file:
-        files = [in_file]
-    else:
-        files = read_lines(in_list)
+        tika_dict['file'] = os.path.abspath(file_path)
 
-    out_f = open(out_file, 'wb', 1)
-    for f in tqdm(files):
-        try:
-            tika_dict = tika_parser.parse(f)
+        return tika_dict
 
-            out_f.write(json.dumps(tika_dict))
-            out_f.write('\n')
-        except Exception as e:
-            logger.info('TIKA parser failed: %s' % os.path.abspath(f))
-            logger.error(e)
 
-    out_f.close()
+def process(in_file, in_list, out_file, log_file, tika_server_url,
+            **options):
+    args = pipeline_args([], options, in_file=in_file, in_list=in_list,
+                         out_file=out_file, log_file=log_file,
+                         tika_server_url=tika_server_url)
+    pipeline = Pipeline(args, 'TIKA parser')
+    pipeline.run()
 
 
 def main():
     import argparse
 
     parser = argparse.ArgumentParser()
-    input_parser = parser.add_mutually_exclusive_group(required=True)
-
-    input_parser.add_argument('-i', '--in_file', help='Path to input file')
-    input_parser.add_argument('-li', '--in_list', help='Path to input list')
-    parser.add_argument('-o', '--out_file', required=True,
-                        help='Path to output JSON file')
-    parser.add_argument('-l', '--log_file', default='./tika-parser-log.txt',
-                        help='Log file that contains processing information. '
-                             'It is default to ./tika-parser-log.txt unless '
-                             'otherwise specified.')
-    parser.add_argument('-p', '--tika_server_url', required=False,
-                        help='Tika server URL')
+    add_pipeline_args(parser, './tika-parser-log.txt')
     args = parser.parse_args()
     process(**vars(args))
 
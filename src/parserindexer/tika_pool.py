@@ -0,0 +1,213 @@
+import time
+import random
+import warnings
+import threading
+import requests
+
+
+class TikaServer(object):
+    """ State of one Tika server endpoint in a TikaServerPool """
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.failures = 0
+        self.healthy = True
+
+    def __repr__(self):
+        return 'TikaServer(%s, healthy=%s, in_flight=%d, failures=%d)' % (
+            self.url, self.healthy, self.in_flight, self.failures)
+
+
+class TikaServerPool(object):
+    """ The TikaServerPool class spreads requests over several Tika servers.
+    Servers that fail repeatedly (connection errors, timeouts or HTTP 5xx
+    responses) or respond slowly to health probes are ejected from the pool,
+    and re-admitted once they pass a health probe again.
+    """
+    STRATEGIES = ['round_robin', 'least_loaded']
+
+    def __init__(self, urls, strategy='least_loaded', max_failures=3,
+                 health_check_interval=30, probe_timeout=5,
+                 slow_threshold=None):
+        """
+        Args:
+            urls (list): Tika server URLs
+            strategy (str): 'round_robin' cycles through the healthy servers,
+                'least_loaded' picks the healthy server with the fewest
+                requests in flight (ties are broken round robin)
+            max_failures (int): number of consecutive failed requests after
+                which a server is ejected
+            health_check_interval (float): seconds between health probes. 0
+                disables the background health probes
+            probe_timeout (float): timeout of a health probe in seconds
+            slow_threshold (float): servers taking longer than this many
+                seconds to answer a health probe are ejected. None disables
+                the check
+        """
+        if len(urls) == 0:
+            raise RuntimeError('At least one Tika server URL is required')
+        if strategy not in TikaServerPool.STRATEGIES:
+            raise RuntimeError('Unrecognized load balancing strategy: %s. You '
+                               'need to choose from [%s]' %
+                               (strategy, ', '.join(self.STRATEGIES)))
+
+        self.servers = [TikaServer(url.rstrip('/')) for url in urls]
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.probe_timeout = probe_timeout
+        self.slow_threshold = slow_threshold
+        self.next_index = 0
+        self.ejections = 0
+        self.readmissions = 0
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+
+        if health_check_interval > 0 and len(self.servers) > 1:
+            thread = threading.Thread(target=self.run_health_checks,
+                                      args=(health_check_interval,))
+            thread.daemon = True
+            thread.start()
+
+    def acquire(self, exclude=()):
+        """ Pick a server for the next request. The caller must hand the
+        server back with release() once the request completes.
+
+        Args:
+            exclude (list): servers not to pick unless there is no other
+                server (e.g., the servers a request already failed on)
+        """
+        with self.lock:
+            candidates = [s for s in self.servers if s not in exclude] or \
+                self.servers
+            healthy = [s for s in candidates if s.healthy]
+            if len(healthy) > 0:
+                candidates = healthy
+            elif not any(s.healthy for s in self.servers):
+                # Rather than failing every remaining document, keep trying
+                # all servers until one of them recovers.
+                warnings.warn('[WARNING] All Tika servers are ejected from the '
+                              'pool. Trying all of them.')
+
+            # Rotate the candidates so that ties go round robin
+            start = self.next_index % len(candidates)
+            candidates = candidates[start:] + candidates[:start]
+            self.next_index += 1
+
+            if self.strategy == 'least_loaded':
+                server = min(candidates, key=lambda s: s.in_flight)
+            else:
+                server = candidates[0]
+
+            server.in_flight += 1
+            return server
+
+    def release(self, server, ok=True):
+        """ Hand a server back after a request
+
+        Args:
+            server (TikaServer): server returned by acquire()
+            ok (bool): False if the request failed because of the server
+                (e.g., connection refused, timed out or HTTP 5xx)
+        """
+        with self.lock:
+            server.in_flight -= 1
+            if ok:
+                server.failures = 0
+                return
+
+            server.failures += 1
+            if server.healthy and server.failures >= self.max_failures:
+                server.healthy = False
+                self.ejections += 1
+                warnings.warn('[WARNING] Ejecting Tika server %s after %d '
+                              'consecutive failures' %
+                              (server.url, server.failures))
+
+    def request(self, send):
+        """ Send a request to a server of the pool. A request that fails
+        because of its server (connection error, timeout or HTTP 5xx) is
+        retried on another server.
+
+        Args:
+            send (function): sends the request to the server URL it is given
+                and returns the tika-python response dictionary, whose
+                'status' is the HTTP status of the response
+        Return:
+            the response of the first server that did not fail, or the HTTP
+            5xx response of the last server tried
+        """
+        response = None
+        tried = []
+        for attempt in range(len(self.servers)):
+            server = self.acquire(tried)
+            tried.append(server)
+            try:
+                response = send(server.url)
+            except requests.exceptions.RequestException:
+                self.release(server, ok=False)
+                continue
+
+            if response.get('status', 200) >= 500:
+                self.release(server, ok=False)
+                continue
+
+            self.release(server)
+            return response
+
+        if response is None:
+            raise RuntimeError('No Tika server answered the request')
+        return response
+
+    def probe(self, server):
+        """ Check whether a server is up and responsive
+
+        Return:
+            True if the server passed the probe
+        """
+        start = time.time()
+        try:
+            response = requests.get('%s/tika' % server.url,
+                                    timeout=self.probe_timeout)
+        except requests.exceptions.RequestException:
+            return False
+        elapsed = time.time() - start
+
+        if response.status_code != 200:
+            return False
+        if self.slow_threshold is not None and elapsed > self.slow_threshold:
+            return False
+        return True
+
+    def health_check(self):
+        """ Probe every server, ejecting the ones that fail the probe and
+        re-admitting the ejected ones that pass it
+        """
+        for server in self.servers:
+            ok = self.probe(server)
+            with self.lock:
+                if ok and not server.healthy:
+                    server.healthy = True
+                    server.failures = 0
+                    self.readmissions += 1
+                    warnings.warn('[WARNING] Re-admitting Tika server %s' %
+                                  server.url)
+                elif not ok and server.healthy:
+                    server.healthy = False
+                    self.ejections += 1
+                    warnings.warn('[WARNING] Ejecting Tika server %s after a '
+                                  'failed health probe' % server.url)
+
+    def run_health_checks(self, interval):
+        # Spread the probes of several parser processes sharing the servers
+        self.closed.wait(random.uniform(0, interval))
+        while not self.closed.is_set():
+            self.health_check()
+            self.closed.wait(interval)
+
+    def close(self):
+        self.closed.set()
+
+    def stats(self):
+        return 'healthy: %d/%d, ejections: %d, re-admissions: %d' % (
+            sum(s.healthy for s in self.servers), len(self.servers),
+            self.ejections, self.readmissions)
@@ -0,0 +1,108 @@
+from __future__ import print_function
+
+import time
+import torch
+
+# Inference backends of the Container and Containee models
+BACKENDS = ['eager', 'int8']
+
+
+def quantize_model(model):
+    """
+    Applies dynamic int8 quantization to the linear layers of a model, i.e.
+    those of the BERT encoder and of the classification head: their weights
+    are stored as int8 and their inputs quantized on the fly. The model is
+    about 2.5 times smaller and runs faster on the CPU, where quantized
+    layers run exclusively.
+    :param model: Model, on the CPU
+    :return: the model, quantized in place
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear},
+                                               dtype=torch.qint8, inplace=True)
+
+
+def main():
+    import copy
+    import json
+    import argparse
+    from unary_parser import UnaryParser
+
+    parser = argparse.ArgumentParser(description='Checks that the int8 '
+                                     'backend predicts like the eager '
+                                     'Container and Containee models on the '
+                                     'sentences of the documents of a JSON '
+                                     'lines file, and compares their speed '
+                                     'on the CPU')
+    parser.add_argument('-i', '--in_file', required=True,
+                        help='Path to the JSON lines output file of a parser '
+                             '(e.g., held-out documents parsed by '
+                             'corenlp_parser.py)')
+    parser.add_argument('-cnte', '--containee_model_file', required=True,
+                        help='Path to a trained Containee model')
+    parser.add_argument('-cntr', '--container_model_file', required=True,
+                        help='Path to a trained Container model')
+    parser.add_argument('-b', '--batch_size', type=int, default=10,
+                        help='Batch size at inference time. Default is 10')
+    parser.add_argument('-th', '--threads', type=int,
+                        help='Number of threads used by PyTorch. Default is '
+                             'the PyTorch default')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    unary_parser = UnaryParser('http://localhost:9000', None,
+                               args.containee_model_file,
+                               args.container_model_file, gpu_id=-1)
+
+    instances = {'Container': [], 'Containee': []}
+    num_sentences = 0
+    with open(args.in_file, 'r') as f:
+        for line in f:
+            sentences = json.loads(line)['metadata'].get('sentences')
+            if not sentences:
+                continue
+            targets, components = unary_parser.make_instances(
+                {'sentences': sentences})
+            instances['Container'].extend(targets)
+            instances['Containee'].extend(components)
+            num_sentences += len(set(ins.sentid
+                                     for ins in targets + components))
+
+    elapsed = dict((backend, 0.0) for backend in BACKENDS)
+    for model_name, model in [('Container', unary_parser.container),
+                              ('Containee', unary_parser.containee)]:
+        model_instances = instances[model_name]
+        if len(model_instances) == 0:
+            continue
+        int8_model = quantize_model(copy.deepcopy(model))
+
+        predictions = {}
+        for backend, backend_model in [('eager', model), ('int8', int8_model)]:
+            start = time.time()
+            unary_parser.predict_instances(backend_model, model_instances,
+                                           args.batch_size)
+            elapsed[backend] += time.time() - start
+            predictions[backend] = [(ins.pred_relation_label,
+                                     float(ins.pred_score[0]))
+                                    for ins in model_instances]
+
+        agree = sum(e[0] == q[0] for e, q in zip(predictions['eager'],
+                                                  predictions['int8']))
+        max_diff = max(abs(e[1] - q[1]) for e, q in zip(predictions['eager'],
+                                                        predictions['int8']))
+        print('%s: int8 predicts like eager for %d of %d instances (%.2f%%), '
+              'largest difference of Contains scores %.4f' %
+              (model_name, agree, len(model_instances),
+               100.0 * agree / len(model_instances), max_diff))
+
+    for backend in BACKENDS:
+        print('%s: %d sentences (%d instances) in %.2f seconds, %.2f '
+              'sentences/sec' %
+              (backend, num_sentences,
+               len(instances['Container']) + len(instances['Containee']),
+               elapsed[backend], num_sentences / max(elapsed[backend], 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
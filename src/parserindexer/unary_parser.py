@@ -1,18 +1,23 @@
 from __future__ import print_function
 
-import sys, os, json, torch, logging, numpy as np, argparse, re, pickle, random, string
+import sys, os, json, torch, logging, numpy as np, argparse, re, pickle, random, string, itertools, bisect
 from sys import stdout
 from os.path import exists, abspath, dirname, join
 from collections import Counter
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 from tqdm import tqdm
 from copy import deepcopy 
 from transformers import *
 
-from ioutils import read_lines 
-from ads_parser import AdsParser 
+from pipeline import Pipeline
+from pipeline import add_pipeline_args
+from pipeline import pipeline_args
 from corenlp_parser import CoreNLPParser  
-from utils import canonical_name, canonical_component_name, LogUtil, targettab
+from spans import append_token
+from sentences import decode_sentences
+from unary_backends import BACKENDS
+from unary_backends import quantize_model
+from utils import canonical_name, canonical_component_name, LogUtil, targettab, Batcher
 
 label2ind = {
   "Contains": 0,
@@ -34,6 +39,14 @@ def add_marker_tokens(tokenizer, ner_labels):
     tokenizer.add_tokens(new_tokens)
 
 
+def base_vocab(tokenizer):
+    """
+    This function returns the vocabulary of a tokenizer without the tokens added to it, such as the entity markers
+    """
+    added_tokens = tokenizer.get_added_vocab()
+    return dict((token, i) for token, i in tokenizer.get_vocab().items() if token not in added_tokens)
+
+
 def to_device(tensor, gpu_id):
     """
       Move a tensor to a specific gpu depending on self.gpu_id 
@@ -50,18 +63,25 @@ def pad_seqs(seqs, tensor_type):
       batch_size = len(seqs)
 
       seq_lenths = torch.LongTensor([len(s) for s in seqs])
-      max_seq_len = seq_lenths.max()
+      max_seq_len = int(seq_lenths.max())
 
-      seq_tensor = torch.zeros(batch_size, max_seq_len, dtype = tensor_type)
+      # the mask is 1 for the positions before the end of each seq, and the values of all the seqs are copied at once
+      mask = (torch.arange(max_seq_len).unsqueeze(0) < seq_lenths.unsqueeze(1)).long()
 
-      mask = torch.zeros(batch_size, max_seq_len, dtype = torch.long)
+      seq_tensor = torch.zeros(batch_size, max_seq_len, dtype = tensor_type)
+      seq_tensor[mask.bool()] = torch.tensor(list(itertools.chain.from_iterable(seqs)), dtype = tensor_type)
 
-      for i, (seq, seq_len) in enumerate(zip(seqs, seq_lenths)):
-        seq_tensor[i,:seq_len] = torch.tensor(seq, dtype = tensor_type)
-        mask[i,:seq_len] = torch.LongTensor([1]*int(seq_len))
       return seq_tensor, mask
 
 
+def length_buckets(instances, batch_size):
+    """
+    Splits instances into batches of instances whose input_ids have similar lengths, so that the batches are padded as little as possible
+    """
+    instances = sorted(instances, key = lambda ins: len(ins.input_ids))
+    return [instances[i:i + batch_size] for i in range(0, len(instances), batch_size)]
+
+
 def collate(batch):
     
     batch_size = len(batch)
@@ -111,7 +131,8 @@ class Model(torch.nn.Module):
     if self.gpu_id < 0: 
       logger.info("GPU is not used due to negative GPU ID %s." % (str(self.gpu_id)))
 
-    self.tokenizer = BertTokenizer.from_pretrained(self.model_type)
+    # the fast (Rust) tokenizer returns the character offsets of the word pieces, so a sentence is tokenized in one call (see SentencePieces)
+    self.tokenizer = BertTokenizerFast.from_pretrained(self.model_type)
 
     if self.model_name == 'Containee':
       add_marker_tokens(self.tokenizer, ['Component'])
@@ -152,25 +173,46 @@ class Model(torch.nn.Module):
   
 
 # ============ Instances =================
-def truncate(temp_prespan_ids, temp_posspan_ids, num_cut):
-    # This function truncates previous and pos-context iteratively for  num_cut times . NOTE, the ids are assume to come with [CLS] and [SEP], and the truncation would not touch these two tokens
-    prespan_ids = temp_prespan_ids[:]
-    posspan_ids = temp_posspan_ids[:]
-
-    while num_cut and (len(prespan_ids) > 1 or len(posspan_ids) > 1):
-
-        if len(prespan_ids) > 1:
-            prespan_ids.pop(1)
-            num_cut -= 1
-
-        if num_cut == 0:
-            break
-        if len(posspan_ids) > 1:
-            posspan_ids.pop(-2)
-            num_cut -= 1
-        if num_cut == 0:
-            break
-    return prespan_ids, posspan_ids, num_cut
+def window_cuts(num_pre, num_pos, num_cut):
+    # This function computes how many ids to cut from the start of the previous context (num_pre ids, after [CLS]) and from the end of the posterior context (num_pos ids, before [SEP]), cutting them alternately one from each for num_cut times, so that the sequence can be sliced once. It also returns the number of ids left to cut when both contexts are exhausted
+    both = min(num_pre, num_pos)
+    if num_cut <= 2 * both:
+        return (num_cut + 1) // 2, num_cut // 2, 0
+
+    pre_cut, pos_cut = both, both
+    num_cut -= 2 * both
+    extra = min(num_cut, max(num_pre, num_pos) - both)
+    if num_pre > both:
+        pre_cut += extra
+    else:
+        pos_cut += extra
+    return pre_cut, pos_cut, num_cut - extra
+
+class SentencePieces(object):
+    """
+    The word piece ids of the words of a sentence, tokenized once and shared by the instances of the entities of the sentence. The word pieces of a word do not depend on its neighbours, so the ids of any span of words can be sliced from the ids of the sentence.
+
+    A fast tokenizer tokenizes the whole sentence in one call, and its offset map tells which word each word piece comes from. A slow tokenizer tokenizes the words one by one.
+    """
+    def __init__(self, tokenizer, words):
+        # offsets[i] is the index of the first id of the i-th word, and offsets[-1] the number of ids
+        if getattr(tokenizer, 'is_fast', False):
+            word_starts = []
+            start = 0
+            for word in words:
+                word_starts.append(start)
+                start += len(word) + 1
+
+            encoding = tokenizer(' '.join(words), add_special_tokens = False, return_offsets_mapping = True)
+            self.ids = encoding['input_ids']
+            piece_starts = [piece_start for piece_start, _ in encoding['offset_mapping']]
+            self.offsets = [bisect.bisect_left(piece_starts, word_start) for word_start in word_starts] + [len(self.ids)]
+        else:
+            self.ids = []
+            self.offsets = [0]
+            for word in words:
+                self.ids.extend(tokenizer.convert_tokens_to_ids(tokenizer.tokenize(word)))
+                self.offsets.append(len(self.ids))
 
 class Span_Instance:
     def __init__(self, venue, year, docname, doc_start_char, doc_end_char, text, ner_label, sent_toks = None, sentid = None, sent_start_idx = None, sent_end_idx = None):
@@ -222,39 +264,41 @@ class Span_Instance:
         self.bert_end_idx = None
         self.relation_label = None
 
-    def insert_type_markers(self, tokenizer, use_std_text = True, max_len = 512):
+    def insert_type_markers(self, tokenizer, use_std_text = True, max_len = 512, sentence_pieces = None):
         """
             This function inserts type markers such as <Target> around the entity in the sentence 
 
             use_std_text: whether to substitute the entity's text with its canonical name in the sentence. for example, 
             if use_std_text is true, then the sentence 'A contains K' would be turned into 'A contains <T>Potassium<\\T>'
+
+            sentence_pieces: SentencePieces of the sentence, shared by the entities of the sentence. The sentence is tokenized here if it is not provided
         """
         assert self.sent_toks is not None
 
+        if sentence_pieces is None:
+            sentence_pieces = SentencePieces(tokenizer, self.sent_toks)
 
         self.input_ids = []
         exceed_leng = 0 
 
-        prespans = tokenizer.tokenize(" ".join(["[CLS]"] + self.sent_toks[:self.sent_start_idx]))
-        start_markers = ["<ner_start=%s>" % (self.ner_label.lower())]
+        ids = sentence_pieces.ids
+        span_begin = sentence_pieces.offsets[self.sent_start_idx]
+        span_end = sentence_pieces.offsets[self.sent_end_idx]
+
+        cls_id, sep_id, start_marker_id, end_marker_id = tokenizer.convert_tokens_to_ids(["[CLS]", "[SEP]", "<ner_start=%s>" % (self.ner_label.lower()), "<ner_end=%s>" % (self.ner_label.lower())])
         if use_std_text:
-            spans = tokenizer.tokenize(self.std_text)
+            span_ids = tokenizer.convert_tokens_to_ids(tokenizer.tokenize(self.std_text))
         else:
-            spans = tokenizer.tokenize(" ".join(self.sent_toks[self.sent_start_idx:self.sent_end_idx]))
-
-        end_markers = ["<ner_end=%s>" % (self.ner_label.lower())]
-
-        posspans = tokenizer.tokenize(' '.join(self.sent_toks[self.sent_end_idx:] + ["[SEP]"]))
+            span_ids = ids[span_begin:span_end]
 
-        if len(prespans + start_markers + spans + end_markers + posspans) > max_len:
-            # truncate now 
-            diff = len(prespans + start_markers + spans + end_markers + posspans) - max_len
+        # if the sequence is longer than max_len, the posterior context is cut by as many ids as the alternate cuts of the previous and posterior contexts take from it. The previous context is never cut: the models were trained and evaluated on these inputs
+        num_cut = (1 + span_begin) + 1 + len(span_ids) + 1 + (len(ids) - span_end + 1) - max_len
+        _, pos_cut, num_cut = window_cuts(span_begin, len(ids) - span_end, max(num_cut, 0))
+        pre_cut = 0
 
-            prepsans, posspans, diff = truncate(prespans, posspans, diff)
-
-        self.input_ids = tokenizer.convert_tokens_to_ids(prespans + start_markers + spans + end_markers + posspans)
-        self.bert_start_idx = len(prespans)
-        self.bert_end_idx = len(prespans + start_markers + spans)
+        self.input_ids = [cls_id] + ids[pre_cut:span_begin] + [start_marker_id] + span_ids + [end_marker_id] + ids[span_end:len(ids) - pos_cut] + [sep_id]
+        self.bert_start_idx = 1 + span_begin - pre_cut
+        self.bert_end_idx = self.bert_start_idx + 1 + len(span_ids)
 
         # assert tokenizer.convert_ids_to_tokens(self.input_ids)[self.bert_start_idx] == f"<ner_start={self.ner_label.lower()}>" and  tokenizer.convert_ids_to_tokens(self.input_ids)[self.bert_end_idx] == f"<ner_end={self.ner_label.lower()}>"
 
@@ -484,8 +528,10 @@ class UnaryParser(CoreNLPParser):
     """ Relation extraction using unary classifiers. The unaryParser class depends on
     the outputs provided by the CoreNLPParser class.
     """
+    # Entities are extracted from the words, NER labels and offsets of the tokens
+    TOKEN_FIELDS = CoreNLPParser.TOKEN_FIELDS + ['word']
 
-    def __init__(self, corenlp_server_url, ner_model_file, containee_model_file, container_model_file, gpu_id = 0 ):
+    def __init__(self, corenlp_server_url, ner_model_file, containee_model_file, container_model_file, gpu_id = 0, corenlp_concurrency = 4, backend = 'eager'):
         """
         Args:
             containee_model_file: 
@@ -496,9 +542,16 @@ class UnaryParser(CoreNLPParser):
             
             gpu_id:
                 id of GPU. Negative gpu_id means no GPU to be used. 
+
+            backend:
+                'eager' runs the models as they are trained, 'int8' runs them with their linear layers quantized to int8 (see unary_backends.py), on the CPU only
         """
+        if backend not in BACKENDS:
+            raise NameError("Unrecognized backend: %s. You need to choose from [%s] !" % (backend, ', '.join(BACKENDS)))
+        if backend == 'int8' and gpu_id >= 0:
+            raise RuntimeError('The int8 backend runs on the CPU only. Use a negative gpu_id.')
 
-        super(UnaryParser, self).__init__(corenlp_server_url,ner_model_file,'jsre_parser')
+        super(UnaryParser, self).__init__(corenlp_server_url,ner_model_file,'jsre_parser', corenlp_concurrency)
 
         self.corenlp_server_url = corenlp_server_url
         self.ner_model_file = ner_model_file
@@ -507,6 +560,8 @@ class UnaryParser(CoreNLPParser):
         self.containee = None 
         self.container = None 
         self.gpu_id = gpu_id
+        self.backend = backend
+        self.batchers = None
 
         logger = logging.getLogger('py.warnings')
 
@@ -519,6 +574,9 @@ class UnaryParser(CoreNLPParser):
         self.container = to_device(self.load_unary_model('Container'), self.gpu_id)
         self.container.eval()
 
+        # the marker tokens added to each tokenizer differ, but the word pieces of the words are the same if the base vocabularies are
+        self.shared_vocab = base_vocab(self.containee.tokenizer) == base_vocab(self.container.tokenizer)
+
 
     def load_unary_model(self, model_name):
         """ Load pretrained Container and Containee model"""
@@ -535,6 +593,9 @@ class UnaryParser(CoreNLPParser):
             else:
                 model.load_state_dict(torch.load(self.containee_model_file))
 
+        if self.backend == 'int8':
+            model = quantize_model(model)
+
         return model 
 
     def predict(self, model, dataloader):
@@ -559,26 +620,29 @@ class UnaryParser(CoreNLPParser):
 
         return pred_instances
 
+    def predict_instances(self, model, instances, batch_size = 10):
+        """ Predict instances in place, in batches of instances of similar lengths """
+
+        return self.predict(model, (collate(batch) for batch in length_buckets(instances, batch_size)))
+
+    def enable_batching(self, batch_size = 10, batch_documents = 16, batch_wait = 0.5, submitters = None):
+        """ Predict the instances of the documents parsed at about the same time by different threads in shared batches, so that the forward passes are larger (see Batcher). A batch holds up to batch_documents documents, and waits for more documents for up to batch_wait seconds, or until all the submitters (e.g., the --workers threads) are waiting for it """
+
+        self.batchers = {
+            'Container': Batcher(lambda instances_list: self.predict_documents(self.container, instances_list, batch_size), batch_documents, batch_wait, submitters = submitters),
+            'Containee': Batcher(lambda instances_list: self.predict_documents(self.containee, instances_list, batch_size), batch_documents, batch_wait, submitters = submitters)
+        }
+
+    def predict_documents(self, model, instances_list, batch_size = 10):
+        """ Predict the instances of several documents in place, in shared batches of instances of similar lengths """
+
+        self.predict_instances(model, [ins for instances in instances_list for ins in instances], batch_size)
+        return [None] * len(instances_list)
+
     def add_entities(self, queue, e):
         # add entities and merge entities if possible. Merge entities when two words have the same ner label that is not 'O' and (adjacent or two words are separated by hyphens or underscores). Note that this method is not perfect since we always merge adjacent words with the same NER into an entity, thus will lose a lot of smaller entities. For example, we will get only "Iron - Feldspar" and miss "Iron" and "Feldspar"
 
-        if not len(queue) or e['label'] == 'O':
-            queue.append(deepcopy(e))
-            return 
-        last_e = queue[-1]
-        if last_e['label'] == e['label']:
-            # merge 
-            last_e['text'] = "%s %s" % (last_e['text'], e['text'])
-            last_e['doc_end_char'] = e['doc_end_char']
-            last_e['sent_end_idx'] = e['sent_end_idx']
-        else:
-            if len(queue) > 1 and queue[-1]['text'] in ["_", "-"] and queue[-2]['label'] == e['label']: # words that are splitted by hyphen or underscores
-                queue[-2]['text'] = "%s%s%s" % (queue[-2]['text'],last_e['text'],e['text'])
-                queue[-2]['doc_end_char'] = e['doc_end_char']
-                queue[-2]['sent_end_idx'] = e['sent_end_idx']
-                queue.pop(-1)
-            else:
-                queue.append(deepcopy(e))
+        append_token(queue, e)
 
     def extract_entities(self, doc, use_component = True):
 
@@ -639,47 +703,18 @@ class UnaryParser(CoreNLPParser):
         return entities
 
 
-    def parse(self, text, batch_size = 10, entity_linking_method = 'closest_container_closest_containee'): 
-        
-        """
-        Args:
-            text:   
-                text of the document 
+    def make_instances(self, corenlp_dict):
+        """ Make the Target and Component instances of the sentences of a document for inference
 
-            batch_size:
-                batch size at prediction time.
+        Args:
+            corenlp_dict:
+                dictionary with the sentences of the document, either CoreNLP sentences or the columnar sentences of an output file (see sentences.py)
 
-            entity_linking_method:
-                strategy to form Contains relations from Targets and Components.  
-                
-                Options:
-                    closest_containee:
-                        for each Container instance, link it to its closest Containee instance with a Contains relation
-                    closest_container:
-                        for each Containee instance, link it to its closest Container instance with a Contains relation
-                    closest_component:
-                        for each Container instance, link it to its closest Component instance with a Contains relation,
-                    closest_target:
-                        for each Containee instance, link it to its closest Target instance with a Contains relation
-                    union_closest_containee_closest_container:
-                        union the relation instances found by closest_containee and closest_container
+        Return:
+            the lists of Target and Component instances
         """
 
-        entity_linking_methods = [
-            'closest_container_closest_containee',
-            'closest_target_closest_component'
-            'closest_containee',
-            'closest_container',
-            'closest_component',
-            'closest_target'
-        ]
-
-        entity_linking_method = entity_linking_method.lower()
-        if entity_linking_method not in entity_linking_methods:
-            raise NameError("Unrecognized entity linking method: %s. You need to choose from [%s] !" % (entity_linking_method, ', '.join(entity_linking_methods)))
-        
-        corenlp_dict = super(UnaryParser, self).parse(text)
-
+        corenlp_dict = dict(corenlp_dict, sentences = decode_sentences(corenlp_dict['sentences']))
 
         entities = [e for e in self.extract_entities(corenlp_dict, use_component = True) if e['label'] in ['Target', 'Component']]
 
@@ -714,15 +749,21 @@ class UnaryParser(CoreNLPParser):
 
             sent_toks = [token['word'] for token in corenlp_dict['sentences'][sentid]['tokens']]
 
+            # the sentence is tokenized once for all its entities, and for both models if their tokenizers have the same base vocabulary
+            sentence_pieces = {}
+
             seen_spanids = set() # used to remove duplicates in case
             for e in sent_entities:
-                # e doesn't have any venue, year and docname, since they are not provided in the arguments. So just assign a 'None' to these. 
-                span = Span_Instance('None', 'None', 'None', e['doc_start_char'], e['doc_end_char'], e['text'], e['label'], sent_toks = deepcopy(sent_toks), sentid = sentid, sent_start_idx = e['sent_start_idx'], sent_end_idx = e['sent_end_idx'])
+                # e doesn't have any venue, year and docname, since they are not provided in the arguments. So just assign a 'None' to these. The words of the sentence are only read, so they are shared by its entities
+                span = Span_Instance('None', 'None', 'None', e['doc_start_char'], e['doc_end_char'], e['text'], e['label'], sent_toks = sent_toks, sentid = sentid, sent_start_idx = e['sent_start_idx'], sent_end_idx = e['sent_end_idx'])
 
                 # insert type markers 
                 if span.span_id not in seen_spanids:
                     tokenizer = self.containee.tokenizer if e['label'] == 'Component' else self.container.tokenizer 
-                    exceed = span.insert_type_markers(tokenizer, max_len = 512) # insert entity markers around the entity in its sentence, convert the sentence to token ids and check if the insertion makes the number of token ids more than 512
+                    pieces_key = 'shared' if self.shared_vocab else e['label']
+                    if pieces_key not in sentence_pieces:
+                        sentence_pieces[pieces_key] = SentencePieces(tokenizer, sent_toks)
+                    exceed = span.insert_type_markers(tokenizer, max_len = 512, sentence_pieces = sentence_pieces[pieces_key]) # insert entity markers around the entity in its sentence, convert the sentence to token ids and check if the insertion makes the number of token ids more than 512
 
                     if e['label'] == 'Target':
                         target_instances.append(span)
@@ -733,16 +774,66 @@ class UnaryParser(CoreNLPParser):
         logger.info('Collected %d Targets and %d Components that co-occur with Components/Targets in the same sentence for relation inference.' % (len(target_instances), len(component_instances)))
         logger.info('%d of them exceed 512 tokens after inserting entity markers in the sentences.' % (exceed_len_cases))
 
-        # make dataset the model takes for prediction
+        return target_instances, component_instances
+
+    def parse(self, text, batch_size = 10, entity_linking_method = 'closest_container_closest_containee'): 
+        
+        """
+        Args:
+            text:   
+                text of the document 
+
+            batch_size:
+                batch size at prediction time.
+
+            entity_linking_method:
+                strategy to form Contains relations from Targets and Components.  
+                
+                Options:
+                    closest_containee:
+                        for each Container instance, link it to its closest Containee instance with a Contains relation
+                    closest_container:
+                        for each Containee instance, link it to its closest Container instance with a Contains relation
+                    closest_component:
+                        for each Container instance, link it to its closest Component instance with a Contains relation,
+                    closest_target:
+                        for each Containee instance, link it to its closest Target instance with a Contains relation
+                    union_closest_containee_closest_container:
+                        union the relation instances found by closest_containee and closest_container
+        """
+
+        entity_linking_methods = [
+            'closest_container_closest_containee',
+            'closest_target_closest_component'
+            'closest_containee',
+            'closest_container',
+            'closest_component',
+            'closest_target'
+        ]
+
+        entity_linking_method = entity_linking_method.lower()
+        if entity_linking_method not in entity_linking_methods:
+            raise NameError("Unrecognized entity linking method: %s. You need to choose from [%s] !" % (entity_linking_method, ', '.join(entity_linking_methods)))
+        
+        corenlp_dict = super(UnaryParser, self).parse(text)
+
+
+        target_instances, component_instances = self.make_instances(corenlp_dict)
+
+        # make dataset the model takes for prediction. The predictions are returned in the order of the (shuffled) datasets
         target_dataset = MyDataset(target_instances)
         component_dataset = MyDataset(component_instances)
 
-        target_dataloader = DataLoader(target_dataset, batch_size = batch_size, collate_fn = collate)
-        component_dataloader = DataLoader(component_dataset, batch_size= batch_size, collate_fn = collate)
-
-        # Inference using Container and Containee
-        target_preds = self.predict(self.container, target_dataloader)
-        component_preds = self.predict(self.containee, component_dataloader)
+        # Inference using Container and Containee, in batches of instances of similar lengths, possibly shared with other documents
+        if self.batchers is not None:
+            for model_name, instances in [('Container', target_dataset.instances), ('Containee', component_dataset.instances)]:
+                if len(instances) > 0:
+                    self.batchers[model_name].submit(instances)
+        else:
+            self.predict_instances(self.container, target_dataset.instances, batch_size)
+            self.predict_instances(self.containee, component_dataset.instances, batch_size)
+        target_preds = list(target_dataset.instances)
+        component_preds = list(component_dataset.instances)
 
         contains_relations = self.form_relations(target_preds, component_preds, corenlp_dict, entity_linking_method)
 
@@ -790,91 +881,31 @@ class UnaryParser(CoreNLPParser):
             })
         return contains_relations
 
-def process(in_file, in_list, out_file, log_file, tika_server_url, ads_url, ads_token, corenlp_server_url, ner_model, containee_model_file, container_model_file, entity_linking_method, gpu_id, batch_size): 
-
-    # Log input parameters
-    logger = LogUtil(log_file)
-    logger.info('Input parameters')
-    logger.info('in_file: %s' % in_file)
-    logger.info('in_list: %s' % in_list)
-    logger.info('out_file: %s' % out_file)
-    logger.info('log_file: %s' % log_file)
-    logger.info('tika_server_url: %s' % tika_server_url)
-    logger.info('ads_url: %s' % ads_url)
-    logger.info('ads_token: %s' % ads_token)
-    logger.info('corenlp_server_url: %s' % corenlp_server_url)
-    logger.info('ner_model: %s' % os.path.abspath(ner_model))
-    logger.info('container_model_file: %s' % os.path.abspath(container_model_file))
-    logger.info('containee_model_file: %s' % os.path.abspath(containee_model_file))
-    logger.info('entity_linking_method: %s' % entity_linking_method)
-    logger.info('gpu_id: %s' % str(gpu_id))
-    
-    if in_file and in_list:
-        raise NameError('[ERROR] in_file and in_list cannot be provided simultaneously')
+def process(in_file, in_list, out_file, log_file, tika_server_url, ads_url, ads_token, corenlp_server_url, ner_model, containee_model_file, container_model_file, entity_linking_method, gpu_id, batch_size, batch_documents = 1, batch_wait = 0.5, backend = 'eager', **options):
+    args = pipeline_args(['ads', 'corenlp'], options, in_file = in_file, in_list = in_list, out_file = out_file, log_file = log_file, tika_server_url = tika_server_url, ads_url = ads_url, ads_token = ads_token, corenlp_server_url = corenlp_server_url, ner_model = ner_model, containee_model_file = containee_model_file, container_model_file = container_model_file, entity_linking_method = entity_linking_method, gpu_id = gpu_id, batch_size = batch_size, batch_documents = batch_documents, batch_wait = batch_wait, backend = backend)
+    pipeline = Pipeline(args, 'Unary parser')
 
-    ads_parser = AdsParser(ads_token, ads_url, tika_server_url)
+    unary_parser = UnaryParser(args.corenlp_server_url, args.ner_model, args.containee_model_file, args.container_model_file, gpu_id = args.gpu_id, corenlp_concurrency = args.corenlp_concurrency, backend = args.backend)
+    pipeline.setup_corenlp(unary_parser)
+    if args.batch_documents > 1:
+        unary_parser.enable_batching(args.batch_size, args.batch_documents, args.batch_wait, args.workers)
+        for model_name, batcher in unary_parser.batchers.items():
+            pipeline.log_stats('%s batches' % model_name, batcher)
 
-    unary_parser = UnaryParser(corenlp_server_url, ner_model, containee_model_file, container_model_file, gpu_id = gpu_id)
+    def parse_document(f, ads_dict):
+        unary_dict = unary_parser.parse(ads_dict['content'], batch_size = args.batch_size, entity_linking_method = args.entity_linking_method)
 
-    if in_file:
-        files = [in_file]
-    else:
-        files = read_lines(in_list)
+        ads_dict['metadata']['ner'] = unary_dict['ner']
+        ads_dict['metadata']['rel'] = unary_dict['relation']
+        ads_dict['metadata']['sentences'] = pipeline.output_sentences(unary_dict['sentences'])
+        ads_dict['metadata']['X-Parsed-By'].append(unary_dict['X-Parsed-By'])
 
-    out_f = open(out_file, 'wb', 1)
-    for f in tqdm(files):
-        try:
-            ads_dict = ads_parser.parse(f)
-
-            unary_dict = unary_parser.parse(ads_dict['content'], batch_size = batch_size, entity_linking_method = entity_linking_method)
-
-            ads_dict['metadata']['ner'] = unary_dict['ner']
-            ads_dict['metadata']['rel'] = unary_dict['relation']
-            ads_dict['metadata']['sentences'] = unary_dict['sentences']
-            ads_dict['metadata']['X-Parsed-By'].append(unary_dict['X-Parsed-By'])
-
-            out_f.write(json.dumps(ads_dict))
-            out_f.write('\n')
-        except Exception as e:
-            logger.info('Unary parser failed: %s' % abspath(f))
-            logger.error(e)
-
-    out_f.close()
+    pipeline.run(parse_document)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    input_parser = parser.add_mutually_exclusive_group(required=True)
-
-    input_parser.add_argument('-i', '--in_file', help='Path to input file')
-    input_parser.add_argument('-li', '--in_list', help='Path to input list')
-    parser.add_argument('-o', '--out_file', required=True,
-                        help='Path to output JSON file')
-    parser.add_argument('-l', '--log_file', default='./unary-parser-log.txt',
-                        help='Log file that contains processing information. '
-                             'It is default to ./unary-parser-log.txt unless '
-                             'otherwise specified.')
-    parser.add_argument('-p', '--tika_server_url', required=False,
-                        help='Tika server URL')
-    parser.add_argument('-a', '--ads_url',
-                        default='https://api.adsabs.harvard.edu/v1/search/query',
-                        help='ADS RESTful API. The ADS RESTful API should not '
-                             'need to be changed frequently unless someting at '
-                             'the ADS is changed.')
-    parser.add_argument('-t', '--ads_token',
-                        default='jON4eu4X43ENUI5ugKYc6GZtoywF376KkKXWzV8U',
-                        help='The ADS token, which is required to use the ADS '
-                             'RESTful API. The token was obtained using the '
-                             'instructions at '
-                             'https://github.com/adsabs/adsabs-dev-api#access. '
-                             'The ADS token should not need to be changed '
-                             'frequently unless something at the ADS is '
-                             'changed.')
-    parser.add_argument('-c', '--corenlp_server_url',
-                        default='http://localhost:9000',
-                        help='CoreNLP Server URL')
-    parser.add_argument('-n', '--ner_model', required=False,
-                        help='Path to a Named Entity Recognition (NER) model')
-    
+    add_pipeline_args(parser, './unary-parser-log.txt', stages = ['ads', 'corenlp'])
+
     parser.add_argument('-cnte', '--containee_model_file',
                     required = True,
                     help='Path to a trained Containee model')
@@ -906,7 +937,19 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--batch_size',
                     default = 10,
                     type = int, 
-                    help='Batch size at inference time.')
+                    help='Batch size at inference time. Instances are batched with instances of similar lengths.')
+    parser.add_argument('-bd', '--batch_documents',
+                    default = 1,
+                    type = int,
+                    help='Maximum number of documents parsed concurrently (see --workers) whose instances are predicted in shared batches. Default is 1 (each document is predicted on its own)')
+    parser.add_argument('-bw', '--batch_wait',
+                    default = 0.5,
+                    type = float,
+                    help='Number of seconds a shared batch waits for more documents. Default is 0.5')
+    parser.add_argument('-be', '--backend',
+                    default = 'eager',
+                    choices = ['eager', 'int8'],
+                    help='Inference backend of the Container and Containee models. [eager]: the models as they are trained, [int8]: the models with their linear layers quantized to int8, which is faster on the CPU and requires a negative --gpu_id (see unary_backends.py to check its accuracy and speed). Default is eager')
 
     args = parser.parse_args()
     process(**vars(args))
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 import re
+import Queue
 import logging
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
 
 # Redirect warnings from stderr to Python standard logging (e.g., warnings
 # raised by `warnings.warn()` will be directly write to the log file)
@@ -218,6 +222,195 @@ def canonical_component_name(name):
     name = " ".join([canonical_name(k) for k in name.split()])
     return name
 
+def parallel_map(func, items, workers=1, ordered=True, max_pending=None):
+    """
+    Applies a function to items using a pool of worker threads, so that up to
+    `workers` items are processed at the same time (e.g., several documents
+    waiting on Tika/CoreNLP/ADS HTTP round trips). The items are read as
+    workers need them: at most `max_pending` items are submitted whose results
+    have not been yielded yet, so a slow item does not let the whole input be
+    read and the finished results pile up behind it.
+    :param func: function applied to each item
+    :param items: iterable of items
+    :param workers: number of worker threads. With 1 (or less) the items are
+    processed sequentially in the calling thread
+    :param ordered: yield results in input order if True, otherwise in
+    completion order
+    :param max_pending: maximum number of items submitted whose results have
+    not been yielded yet. Default is 2 * workers
+    :return: stream of (item, func(item)) tuples. An exception raised by func
+    is raised when its result is reached
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * workers
+    max_pending = max(max_pending, workers)
+
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    pool = ThreadPool(workers)
+    # Results of the submitted items, in input order, and in completion
+    # order if the results are not ordered
+    pending = deque()
+    completed = Queue.Queue()
+
+    def next_result():
+        if ordered:
+            item, result, error = pending.popleft().get()
+        else:
+            pending.popleft()
+            item, result, error = completed.get()
+        if error is not None:
+            raise error
+        return item, result
+
+    try:
+        for item in items:
+            pending.append(pool.apply_async(
+                call, (item,), callback=None if ordered else completed.put))
+            if len(pending) >= max_pending:
+                yield next_result()
+        while len(pending) > 0:
+            yield next_result()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class Batcher(object):
+    """
+    Combines the requests made at about the same time by different threads
+    (e.g., the documents parsed concurrently by parallel_map) into batches.
+    The first request of a batch waits for more requests, until the batch is
+    full, every thread submitting requests is waiting for a result, or
+    batch_wait seconds have passed, and then runs the whole batch on behalf
+    of all of them. The other requests wait for their results.
+    """
+
+    def __init__(self, run_batch, batch_size=16, batch_wait=0.5,
+                 max_weight=None, weight=len, submitters=None):
+        """
+        :param run_batch: function given the list of the requests of a batch,
+        and returning the list of their results, in the same order. It is the
+        place of the prediction (or query) of the batch and of the split of
+        its results back to each request
+        :param batch_size: maximum number of requests of a batch
+        :param batch_wait: number of seconds a batch waits for more requests
+        :param max_weight: a batch is also full once the total weight of its
+        requests reaches max_weight (e.g., a number of jSRE records). None
+        means no limit
+        :param weight: function returning the weight of a request
+        :param submitters: number of threads submitting requests (e.g., the
+        number of workers of parallel_map). Once all of them are waiting for
+        a result, no request can join the batches being collected, which are
+        run without waiting any longer. None means unknown
+        """
+        self.run_batch = run_batch
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_weight = max_weight
+        self.weight = weight
+        self.submitters = submitters
+        self.lock = threading.Lock()
+        # Batches being collected, by key
+        self.batches = dict()
+        # Number of requests waiting for their result
+        self.waiting = 0
+
+        self.batch_count = 0
+        self.request_count = 0
+        self.total_weight = 0
+
+    def submit(self, request, key=None):
+        """
+        Adds a request to a batch and waits for its result
+        :param request: request, passed to run_batch
+        :param key: requests of different keys go to different batches (e.g.,
+        ADS lookups of different years)
+        :return: the result of the request. An exception raised by run_batch
+        is raised in every request of the batch
+        """
+        entry = {'request': request, 'result': None, 'error': None,
+                 'done': threading.Event()}
+        weight = self.weight(request) if self.max_weight is not None else 0
+        with self.lock:
+            batch = self.batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = self.batches[key] = {'entries': [], 'weight': 0,
+                                             'full': threading.Event()}
+            batch['entries'].append(entry)
+            batch['weight'] += weight
+            self.waiting += 1
+            if len(batch['entries']) >= self.batch_size or \
+                    (self.max_weight is not None and
+                     batch['weight'] >= self.max_weight):
+                # Later requests start a new batch
+                del self.batches[key]
+                batch['full'].set()
+            if self.submitters is not None and \
+                    self.waiting >= self.submitters:
+                # Every submitter is waiting, so no batch can grow anymore
+                for other in self.batches.values():
+                    other['full'].set()
+                self.batches.clear()
+
+        try:
+            return self.wait_result(entry, batch, key, leader)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def wait_result(self, entry, batch, key, leader):
+        """ Waits for the result of a request added to a batch by submit() """
+        if not leader:
+            entry['done'].wait()
+            if entry['error'] is not None:
+                raise entry['error']
+            return entry['result']
+
+        # The first request of a batch waits for more requests and runs the
+        # batch on behalf of all of them
+        batch['full'].wait(self.batch_wait)
+        with self.lock:
+            if self.batches.get(key) is batch:
+                del self.batches[key]
+        entries = batch['entries']
+
+        try:
+            results = self.run_batch([e['request'] for e in entries])
+            for other, result in zip(entries, results):
+                other['result'] = result
+            with self.lock:
+                self.batch_count += 1
+                self.request_count += len(entries)
+                self.total_weight += batch['weight']
+        except Exception as e:
+            for other in entries:
+                other['error'] = e
+            raise
+        finally:
+            for other in entries:
+                other['done'].set()
+
+        return entry['result']
+
+    def stats(self):
+        stats = 'batches: %d, requests: %d' % (self.batch_count,
+                                               self.request_count)
+        if self.max_weight is not None:
+            stats += ', weight: %d' % self.total_weight
+        return stats
+
+
 class LogUtil(object):
     def __init__(self, log_file, filemode='w'):
         fmt = logging.Formatter(fmt='%(asctime)-15s: %(message)s',
@@ -0,0 +1,74 @@
+import os
+import sys
+import threading
+import SocketServer
+import BaseHTTPServer
+
+import pytest
+
+# The modules of src/parserindexer import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'parserindexer'))
+
+
+class StubServer(object):
+    """ A local HTTP server answering every request with a handler function,
+    which is given the method, path, headers and body of the request, and
+    returns the status, headers and body of the response. The requests are
+    recorded in `requests`.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else ''
+                stub.requests.append((self.command, self.path, body))
+                status, headers, content = stub.handle(
+                    self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_PUT = do_POST = respond
+
+            def log_message(self, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread = None
+
+
+@pytest.fixture
+def stub_server():
+    """ Factory of StubServer servers, closed at the end of the test """
+    servers = []
+
+    def start(handle):
+        server = StubServer(handle)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,214 @@
+import json
+import time
+import random
+import urlparse
+import warnings
+
+import pytest
+
+from ads_client import AdsClient
+
+LPSC = '"Lunar and Planetary Science Conference"'
+
+
+class AdsStub(object):
+    """ Answers like the ADS search API. Each request takes the next of the
+    scripted (status, headers) responses, and then gets HTTP 200 with the
+    documents matching its query among `docs`.
+    """
+
+    def __init__(self, docs=(), script=(), headers=None, max_rows=None):
+        self.docs = list(docs)
+        self.script = list(script)
+        self.headers = headers or {}
+        self.max_rows = max_rows
+        self.queries = []
+        self.times = []
+
+    def __call__(self, method, path, headers, body):
+        params = urlparse.parse_qs(urlparse.urlparse(path).query)
+        query = params['q'][0]
+        self.queries.append(query)
+        self.times.append(time.time())
+        if self.script:
+            status, response_headers = self.script.pop(0)
+            return status, response_headers, 'error'
+
+        docs = [dict(d) for d in self.docs if self.matches(d, query)]
+        found = len(docs)
+        if self.max_rows is not None:
+            docs = docs[:self.max_rows]
+        if 'page' not in params['fl'][0].split(','):
+            for d in docs:
+                d.pop('page', None)
+        content = json.dumps({'response': {'numFound': found, 'docs': docs}})
+        return 200, dict(self.headers), content
+
+    @staticmethod
+    def matches(doc, query):
+        pages = []
+        for term in query.split(' AND '):
+            field, value = term.split(':', 1)
+            if field == 'page':
+                pages = value.strip('()').split(' OR ')
+            elif field == 'year' and value != doc['year']:
+                return False
+        return any(p in doc['page'] for p in pages)
+
+
+def abstract(year, page):
+    return {'year': year, 'page': [page], 'title': ['%s-%s' % (year, page)]}
+
+
+def lpsc_query(year, page):
+    return 'year:%s AND page:%s AND pub:%s' % (year, page, LPSC)
+
+
+def client(server, **kwargs):
+    kwargs.setdefault('backoff_base', 0.01)
+    return AdsClient('token', server.url, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def ignore_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def test_search(stub_server):
+    stub = AdsStub([abstract('2016', '1001')])
+    server = stub_server(stub)
+
+    docs = client(server).search(lpsc_query('2016', '1001'))
+    assert [d['title'] for d in docs] == [['2016-1001']]
+
+
+def test_retries_429_and_5xx(stub_server):
+    stub = AdsStub([abstract('2016', '1001')],
+                   script=[(429, {}), (503, {}), (500, {})])
+    ads_client = client(stub_server(stub))
+
+    docs = ads_client.search(lpsc_query('2016', '1001'))
+    assert len(docs) == 1
+    assert len(stub.queries) == 4
+    assert ads_client.retries == 3
+
+
+def test_gives_up_after_max_retries(stub_server):
+    stub = AdsStub(script=[(503, {})] * 10)
+    ads_client = client(stub_server(stub), max_retries=2)
+
+    assert ads_client.search(lpsc_query('2016', '1001')) is None
+    assert len(stub.queries) == 3
+
+
+def test_client_errors_are_not_retried(stub_server):
+    stub = AdsStub(script=[(400, {})])
+    ads_client = client(stub_server(stub))
+
+    assert ads_client.search(lpsc_query('2016', '1001')) is None
+    assert len(stub.queries) == 1
+
+
+def test_no_retries(stub_server):
+    stub = AdsStub(script=[(503, {})])
+    ads_client = client(stub_server(stub), max_retries=0)
+
+    assert ads_client.search(lpsc_query('2016', '1001')) is None
+    assert len(stub.queries) == 1
+
+
+def test_negative_retries():
+    with pytest.raises(RuntimeError):
+        AdsClient('token', 'http://localhost', max_retries=-1)
+
+
+def test_retry_after(stub_server):
+    stub = AdsStub([abstract('2016', '1001')],
+                   script=[(429, {'Retry-After': '0.5'})])
+    client(stub_server(stub)).search(lpsc_query('2016', '1001'))
+
+    assert stub.times[1] - stub.times[0] >= 0.5
+
+
+def test_backoff_jitter():
+    ads_client = AdsClient('token', 'http://localhost', backoff_base=1.0,
+                           backoff_cap=5.0)
+    random.seed(0)
+    for attempt in range(6):
+        delays = [ads_client.backoff(attempt) for _ in range(200)]
+        limit = min(5.0, 2 ** attempt)
+        assert all(0 <= d <= limit for d in delays)
+        # Full jitter spreads the retries over the whole interval
+        assert min(delays) < 0.1 * limit
+        assert max(delays) > 0.9 * limit
+
+
+def test_rate_limit_pacing(stub_server):
+    stub = AdsStub([abstract('2016', '1001')])
+    server = stub_server(stub)
+    ads_client = client(server)
+    stub.headers = {'X-RateLimit-Remaining': '0',
+                    'X-RateLimit-Reset': str(time.time() + 1)}
+
+    ads_client.search(lpsc_query('2016', '1001'))
+    ads_client.search(lpsc_query('2016', '1001'))
+
+    # The second request waits for the rate limit to reset
+    assert stub.times[1] - stub.times[0] >= 0.8
+
+
+def test_rate_limit_exhausted(stub_server):
+    stub = AdsStub([abstract('2016', '1001')],
+                   headers={'X-RateLimit-Remaining': '0',
+                            'X-RateLimit-Reset': str(time.time() + 3600)})
+    ads_client = client(stub_server(stub), max_rate_limit_wait=10)
+
+    assert ads_client.search(lpsc_query('2016', '1001')) is not None
+    assert ads_client.search(lpsc_query('2016', '1001')) is None
+    assert len(stub.queries) == 1
+
+
+def test_batch_demux(stub_server):
+    stub = AdsStub([abstract('2016', '1001'), abstract('2016', '1002'),
+                    abstract('2015', '1002'), abstract('2016', '1003')])
+    ads_client = client(stub_server(stub), max_concurrency=4, batch_size=4,
+                        batch_wait=1)
+
+    queries = [lpsc_query('2016', p) for p in ['1001', '1002', '1003', '1004']]
+    results = ads_client.search_many(queries)
+
+    assert stub.queries == ['year:2016 AND pub:%s AND page:(1001 OR 1002 OR '
+                            '1003 OR 1004)' % LPSC]
+    assert [[d['title'] for d in docs] for docs in results] == \
+        [[['2016-1001']], [['2016-1002']], [['2016-1003']], []]
+    assert all('page' not in d for docs in results for d in docs)
+
+
+def test_batches_by_year(stub_server):
+    stub = AdsStub([abstract('2016', '1001'), abstract('2015', '1001')])
+    ads_client = client(stub_server(stub), max_concurrency=2, batch_size=2,
+                        batch_wait=0.2)
+
+    results = ads_client.search_many([lpsc_query('2016', '1001'),
+                                      lpsc_query('2015', '1001')])
+
+    assert sorted(stub.queries) == [lpsc_query('2015', '1001'),
+                                    lpsc_query('2016', '1001')]
+    assert [[d['title'] for d in docs] for docs in results] == \
+        [[['2016-1001']], [['2015-1001']]]
+
+
+def test_truncated_batch(stub_server):
+    stub = AdsStub([abstract('2016', '1001'), abstract('2016', '1001'),
+                    abstract('2016', '1002')], max_rows=2)
+    ads_client = client(stub_server(stub), max_concurrency=2, batch_size=2,
+                        batch_wait=1)
+
+    results = ads_client.search_many([lpsc_query('2016', '1001'),
+                                      lpsc_query('2016', '1002')])
+
+    # 1002 is not in the rows returned, so it is looked up on its own
+    assert stub.queries[1:] == [lpsc_query('2016', '1002')]
+    assert [len(docs) for docs in results] == [2, 1]
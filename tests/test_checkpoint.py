@@ -0,0 +1,84 @@
+import os
+import json
+
+import checkpoint
+from checkpoint import Checkpoint
+
+
+def write_records(out_file, paths, truncated=None):
+    with open(out_file, 'w') as f:
+        for path in paths:
+            f.write(json.dumps({'file': path}) + '\n')
+        if truncated is not None:
+            f.write(json.dumps({'file': truncated})[:5])
+
+
+def read_records(out_file):
+    with open(out_file) as f:
+        return [json.loads(line)['file'] for line in f]
+
+
+def test_resume(tmpdir):
+    files = []
+    for name in ['a', 'b', 'c', 'd']:
+        tmpdir.join(name).write(name)
+        files.append(str(tmpdir.join(name)))
+    manifest_file = str(tmpdir.join('out.manifest'))
+    out_file = str(tmpdir.join('out.jsonl'))
+
+    first = Checkpoint(manifest_file)
+    first.completed(files[0])
+    first.completed(files[1])
+    first.failed(files[2])
+    first.close()
+    # d was written but the run crashed before it was marked completed, and
+    # the record of c was truncated
+    write_records(out_file, files[:2] + [files[3]], truncated=files[2])
+    tmpdir.join('b').write('changed')
+
+    resumed = Checkpoint(manifest_file, resume=True)
+    current_paths, stale = resumed.current_paths()
+    assert current_paths == set([files[0]])
+    assert stale == 1
+
+    assert Checkpoint.prepare_output(out_file, current_paths) == 3
+    assert read_records(out_file) == [files[0]]
+    assert list(resumed.pending(files, current_paths)) == files[1:]
+
+
+def test_pending_is_lazy(tmpdir):
+    manifest_file = str(tmpdir.join('out.manifest'))
+    Checkpoint(manifest_file).close()
+    resumed = Checkpoint(manifest_file, resume=True)
+
+    def files():
+        yield 'a'
+        raise AssertionError('read past the first file')
+
+    pending = resumed.pending(files(), set())
+    assert next(pending) == 'a'
+
+
+def test_record_reuses_digest(tmpdir, monkeypatch):
+    tmpdir.join('a').write('a')
+    path = str(tmpdir.join('a'))
+    manifest_file = str(tmpdir.join('out.manifest'))
+    first = Checkpoint(manifest_file)
+    first.failed(path)
+    first.close()
+
+    resumed = Checkpoint(manifest_file, resume=True)
+    hashed = []
+    file_sha256 = checkpoint.file_sha256
+    monkeypatch.setattr(checkpoint, 'file_sha256',
+                        lambda f: hashed.append(f) or file_sha256(f))
+    current_paths, _ = resumed.current_paths()
+    for f in resumed.pending([path], current_paths):
+        resumed.completed(f)
+    resumed.close()
+
+    # The file is hashed once, when it is selected
+    assert hashed == [path]
+    with open(manifest_file) as f:
+        assert f.readlines()[-1] == 'completed\t%s\t%s\n' % (
+            file_sha256(path), os.path.abspath(path))
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import re
+import ast
+import json
+import urllib
+import threading
+
+import corenlp_parser
+from corenlp_parser import CoreNLPParser
+
+
+def test_cache_key_output_format(monkeypatch):
+    monkeypatch.setattr(corenlp_parser, 'protobuf_available', lambda: True)
+    json_parser = CoreNLPParser('http://localhost:9000', None)
+    json_parser.enable_cache(object())
+    protobuf_parser = CoreNLPParser('http://localhost:9000', None)
+    protobuf_parser.enable_cache(object())
+    protobuf_parser.enable_protobuf()
+
+    # JSON and protobuf runs cache different token objects
+    assert json_parser.cache_props != protobuf_parser.cache_props
+
+    # The timeout does not change the annotations
+    json_parser.props['timeout'] = '1000'
+    assert json_parser.annotation_props() == json_parser.cache_props
+
+
+def test_cache_key_ner_model(tmpdir):
+    model = tmpdir.join('ner.ser.gz')
+    model.write('model 1')
+    parser = CoreNLPParser('http://localhost:9000', str(model))
+    parser.enable_cache(object())
+    key = parser.cache_props
+
+    model.write('model 2')
+    parser.enable_cache(object())
+    assert parser.cache_props != key
+    assert str(model) not in parser.cache_props
+
+
+def test_minimal_annotators():
+    parser = CoreNLPParser('http://localhost:9000', None)
+    # The output sentences keep their POS tags and lemmas by default
+    assert parser.props['annotators'] == 'tokenize,ssplit,pos,lemma,ner'
+
+    parser.enable_cache(object())
+    key = parser.cache_props
+    parser.enable_minimal_annotators()
+    assert parser.props['annotators'] == 'tokenize,ssplit,ner'
+    assert parser.cache_props != key
+
+
+def java_offset(text, i):
+    """ Offset of text[i] in UTF-16 code units, like CoreNLP """
+    return len(text[:i].encode('utf-16-le')) // 2
+
+
+class CoreNLPStub(object):
+    """ Annotates like a CoreNLP server: whitespace-separated tokens,
+    sentences ending with a period or a boundary to discard, capitalized
+    words tagged Target, and offsets in UTF-16 code units
+    """
+
+    def __call__(self, method, path, headers, body):
+        props = ast.literal_eval(urllib.unquote(
+            re.search(r'properties=([^&]*)', path).group(1).replace('+', ' ')))
+        discard = props.get('ssplit.boundariesToDiscard', '').split(',')
+        text = urllib.unquote(body).decode('utf8')
+        matches = list(re.finditer(r'\S+', text))
+
+        sentences = [[]]
+        for m in matches:
+            if m.group() in discard:
+                sentences.append([])
+                continue
+            sentences[-1].append(m)
+            if m.group().endswith('.'):
+                sentences.append([])
+
+        output = []
+        doc_tokens = 0
+        ends = [0] + [m.end() for m in matches]
+        for sentence in [s for s in sentences if len(s) > 0]:
+            tokens = []
+            mentions = []
+            for i, m in enumerate(sentence):
+                before = text[max(e for e in ends if e <= m.start()):m.start()]
+                following = [x.start() for x in matches if x.start() >= m.end()]
+                after = text[m.end():following[0] if following else len(text)]
+                ner = 'Target' if m.group()[0].isupper() else 'O'
+                token = {
+                    'index': i + 1,
+                    'word': m.group(),
+                    'originalText': m.group(),
+                    'characterOffsetBegin': java_offset(text, m.start()),
+                    'characterOffsetEnd': java_offset(text, m.end()),
+                    'before': before,
+                    'after': after,
+                    'ner': ner
+                }
+                tokens.append(token)
+                if ner != 'O':
+                    mentions.append({
+                        'docTokenBegin': doc_tokens + i,
+                        'docTokenEnd': doc_tokens + i + 1,
+                        'characterOffsetBegin': token['characterOffsetBegin'],
+                        'characterOffsetEnd': token['characterOffsetEnd'],
+                        'text': m.group(),
+                        'ner': ner
+                    })
+            output.append({'index': len(output), 'tokens': tokens,
+                           'entitymentions': mentions})
+            doc_tokens += len(tokens)
+
+        return 200, {}, json.dumps({'sentences': output})
+
+
+DOCUMENTS = [
+    u'The rover \U0001F680 found Hematite at Gale.\nIt drilled Windjana.  ',
+    u'',
+    u'Curiosity \u00e9tudie Mars \U0001F30D Sol 200',
+    u'  Opportunity saw Jarosite. Spirit saw Silica.\n'
+]
+
+
+def test_parse_batch(stub_server):
+    server = stub_server(CoreNLPStub())
+    parser = CoreNLPParser(server.url, None)
+
+    alone = [parser.parse(text) if text else parser.build_result([])
+             for text in DOCUMENTS]
+    requests = len(server.requests)
+    batched = parser.parse_batch(DOCUMENTS)
+
+    # One request, with the results of each document annotated alone
+    assert len(server.requests) == requests + 1
+    assert batched == alone
+    # The offsets count the emojis as two UTF-16 code units
+    assert [(n['text'], n['begin']) for n in batched[2]['ner']] == \
+        [(u'Curiosity', 0), (u'Mars', 17), (u'Sol', 25)]
+
+
+def test_parse_batch_max_chars(stub_server):
+    server = stub_server(CoreNLPStub())
+    parser = CoreNLPParser(server.url, None)
+
+    batched = parser.parse_batch(DOCUMENTS, max_chars=130)
+    # Two requests, with two documents each
+    assert len(server.requests) == 2
+    assert batched == parser.parse_batch(DOCUMENTS)
+
+
+def test_document_batching(stub_server):
+    server = stub_server(CoreNLPStub())
+    parser = CoreNLPParser(server.url, None)
+    texts = [t for t in DOCUMENTS if t]
+    alone = [parser.parse(text) for text in texts]
+
+    parser.enable_document_batching(batch_size=len(texts), batch_wait=5)
+    results = [None] * len(texts)
+
+    def parse(i):
+        results[i] = parser.parse(texts[i])
+
+    threads = [threading.Thread(target=parse, args=(i,))
+               for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The documents parsed concurrently are annotated by one request
+    assert len(server.requests) == len(texts) + 1
+    assert results == alone
+    assert parser.document_batcher.stats().startswith(
+        'batches: 1, requests: 3')
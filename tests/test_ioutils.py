@@ -0,0 +1,56 @@
+import os
+import json
+
+from ioutils import CrawlState
+from ioutils import crawl_files
+from ioutils import read_jsonlines
+from sentences import COLUMNAR_VERSION
+from sentences import encode_sentences
+
+
+def test_deleted_file_is_skipped(tmpdir):
+    for name in ['a.pdf', 'b.pdf', 'c.pdf']:
+        tmpdir.join(name).write(name)
+    state = CrawlState(str(tmpdir.join('state.json')))
+
+    changed = state.changed(crawl_files(str(tmpdir)))
+    assert os.path.basename(next(changed)) == 'a.pdf'
+    # Deleted between the walk and its stat
+    tmpdir.join('b.pdf').remove()
+    assert [os.path.basename(p) for p in changed] == ['c.pdf']
+
+
+def test_periodic_save(tmpdir):
+    for name in ['a.pdf', 'b.pdf', 'c.pdf']:
+        tmpdir.join(name).write(name)
+    state_file = tmpdir.join('state.json')
+    state = CrawlState(str(state_file), save_every=2)
+
+    for path in state.changed(crawl_files(str(tmpdir))):
+        state.mark_processed(path)
+        if os.path.basename(path) == 'b.pdf':
+            break
+
+    # Saved after the second file, without save()
+    assert len(json.loads(state_file.read())) == 2
+    assert [os.path.basename(p) for p in CrawlState(
+        str(state_file)).changed(crawl_files(str(tmpdir)))] == ['c.pdf']
+
+
+def test_read_jsonlines_decodes_sentences(tmpdir):
+    sentences = [{'index': 0, 'tokens': [
+        {'index': 1, 'word': u'Gale', 'characterOffsetBegin': 0,
+         'characterOffsetEnd': 4, 'ner': 'Target'}]}]
+    out_file = tmpdir.join('out.jsonl')
+    out_file.write(json.dumps({'metadata': {
+        'sentences': encode_sentences(sentences)}}) + '\n' + json.dumps(
+        {'metadata': {'sentences': sentences}}) + '\n')
+
+    docs = list(read_jsonlines(str(out_file), decode=True))
+    # Both encodings read alike
+    for doc in docs:
+        assert doc['metadata']['sentences'][0]['tokens'][0]['word'] == 'Gale'
+    assert docs[0]['metadata']['sentences'].to_list() == sentences
+
+    raw = next(read_jsonlines(str(out_file)))
+    assert raw['metadata']['sentences']['columnar'] == COLUMNAR_VERSION
@@ -0,0 +1,131 @@
+import os
+import sys
+
+import pytest
+
+from jsre_parser import JsreParser
+from jsre_parser import JsreRecords
+from jsre_parser import JsreTemplate
+from corenlp_parser import CoreNLPParser
+from jsre_worker import JsreWorkerPool
+
+JARS = ['dist/xjsre.jar', 'lib/commons-beanutils.jar',
+        'lib/commons-cli-1.0.jar', 'lib/commons-collections.jar',
+        'lib/commons-digester.jar', 'lib/commons-logging.jar',
+        'lib/libsvm-2.8.jar', 'lib/log4j-1.2.8.jar']
+
+
+@pytest.fixture
+def jsre_parser(tmpdir, monkeypatch):
+    """ A JsreParser whose jSRE runs are predicted by fake_predict() """
+    root = tmpdir.mkdir('jsre')
+    for path in JARS + ['log-config.txt', 'jsre-config.xml']:
+        root.join(path).ensure()
+    model = tmpdir.join('model.zip')
+    model.write('')
+    monkeypatch.setenv('CLASSPATH', '')
+    parser = JsreParser('http://localhost:9000', None, str(root), str(model),
+                        str(tmpdir))
+
+    def fake_predict(in_file, out_file, work_dir=None):
+        parser.jvm_runs += 1
+        with open(in_file) as f, open(out_file, 'w') as out:
+            for line in f:
+                out.write('%d\n' % ('Contains' in line))
+
+    parser.jvm_runs = 0
+    monkeypatch.setattr(parser, 'predict', fake_predict)
+    return parser
+
+
+def test_predict_batch(jsre_parser):
+    records = [u'0\tContains\tbody\n', u'1\tOther\tbody\n']
+    assert jsre_parser.predict_batch(records) == ['1\n', '0\n']
+    assert jsre_parser.jvm_runs == 1
+
+
+def test_workers_exit_untrapped(jsre_parser, tmpdir):
+    # Workers that cannot trap the exits of jSRE are not used
+    worker = [sys.executable, '-c', 'print("READY EXIT_UNTRAPPED")']
+    jsre_parser.worker_pool = JsreWorkerPool(worker, 1, str(tmpdir))
+
+    records = [u'0\tContains\tbody\n']
+    with pytest.warns(UserWarning):
+        assert jsre_parser.predict_batch(records) == ['1\n']
+    assert jsre_parser.predict_batch(records) == ['1\n']
+    assert jsre_parser.jvm_runs == 2
+    # No work directory is left behind
+    assert [n for n in os.listdir(str(tmpdir)) if n.startswith('jsre_')] == []
+
+
+def sentence(index, words):
+    """ A CoreNLP sentence of (word, ner) tokens, decoded from JSON """
+    tokens = []
+    offset = 0
+    for i, (word, ner) in enumerate(words):
+        word, ner = unicode(word), unicode(ner)
+        tokens.append({'index': i + 1, 'word': word, 'originalText': word,
+                       'lemma': word.lower(), 'pos': 'NN', 'ner': ner,
+                       'characterOffsetBegin': offset,
+                       'characterOffsetEnd': offset + len(word)})
+        offset += len(word) + 1
+    return {'index': index, 'tokens': tokens}
+
+
+SENTENCES = [
+    sentence(0, [('Gale', 'Target'), ('has', 'O'), ('olivine', 'Mineral'),
+                 ('and', 'O'), ('Fe', 'Element'), ('Rocknest', 'Target')]),
+    sentence(1, [('Nothing', 'O'), ('here', 'O')]),
+    sentence(2, [('Bathurst', 'Target'), ('has', 'O'), ('Mg', 'Element')])
+]
+
+
+def test_records():
+    records = JsreRecords()
+    for s in SENTENCES:
+        tokens = s['tokens']
+        targets = [t for t in tokens if t['ner'] == 'Target']
+        elements = [t for t in tokens if t['ner'] == 'Element']
+        records.add(JsreTemplate(s), targets, elements, s, 'te')
+
+    lines = list(records)
+    assert len(records) == len(lines) == 3
+    assert [line.split('\t')[1] for line in lines] == \
+        ['te_0_0', 'te_0_1', 'te_2_0']
+    assert lines[0] == ('0\tte_0_0\t0&&Gale&&gale&&NN&&Target&&A '
+                        '1&&has&&has&&NN&&O&&O '
+                        '2&&olivine&&olivine&&NN&&Mineral&&O '
+                        '3&&and&&and&&NN&&O&&O '
+                        '4&&Fe&&fe&&NN&&Element&&T '
+                        '5&&Rocknest&&rocknest&&NN&&Target&&O \n')
+    # The records are generated again on every iteration
+    assert list(records) == lines
+    assert [(p[0], p[1]['word'], p[2]['word']) for p in records.pairs()] == \
+        [('te_0_0', 'Gale', 'Fe'), ('te_0_1', 'Rocknest', 'Fe'),
+         ('te_2_0', 'Bathurst', 'Mg')]
+
+    both = JsreRecords.concat([records, records])
+    assert len(both) == 6
+    assert list(both) == lines * 2
+
+
+def test_parse(jsre_parser, monkeypatch):
+    monkeypatch.setattr(CoreNLPParser, 'parse', lambda self, text: {
+        'ner': [], 'sentences': SENTENCES})
+    written = []
+
+    def predict(in_file, out_file, work_dir=None):
+        with open(in_file) as f, open(out_file, 'w') as out:
+            for line in f:
+                written.append(line)
+                out.write('1.0\n')
+
+    monkeypatch.setattr(jsre_parser, 'predict', predict)
+    result = jsre_parser.parse('text')
+
+    assert len(written) == 5
+    assert [(r['target_names'][0], r['cont_ids'][0])
+            for r in result['relation']] == [
+        ('Gale', 'element_21_23'), ('Rocknest', 'element_21_23'),
+        ('Gale', 'mineral_9_16'), ('Rocknest', 'mineral_9_16'),
+        ('Bathurst', 'element_13_15')]
@@ -0,0 +1,283 @@
+import os
+import sys
+import threading
+
+import pytest
+
+import jsre_worker
+from jsre_worker import JsreWorker
+from jsre_worker import JsreWorkerPool
+from jsre_worker import WorkerError
+from jsre_worker import WorkerUnsupportedError
+from jsre_worker import compile_worker
+from jsre_worker import java_worker_command
+
+# Speaks the protocol of JsreWorker.java. It labels the records containing
+# 'Contains' 1 and the others 0, answers ERROR to the requests containing
+# 'FAIL', and exits on the requests containing 'CRASH' while the file named
+# by FAKE_CRASH exists, removing it. Every start is logged in FAKE_STARTS.
+FAKE_WORKER = r'''
+import os
+import sys
+
+with open(os.environ['FAKE_STARTS'], 'a') as f:
+    f.write('start\n')
+sys.stdout.write(os.environ.get('FAKE_READY', 'READY') + '\n')
+sys.stdout.flush()
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    records = []
+    while line and line != '\n':
+        records.append(line)
+        line = sys.stdin.readline()
+    crash_file = os.environ.get('FAKE_CRASH')
+    if any('CRASH' in r for r in records) and crash_file and \
+            os.path.exists(crash_file):
+        os.remove(crash_file)
+        sys.exit(3)
+    if any('FAIL' in r for r in records):
+        sys.stdout.write('ERROR jSRE did not produce an output file\n')
+    else:
+        sys.stdout.write('OK %d\n' % len(records))
+        for r in records:
+            sys.stdout.write('%d\n' % ('Contains' in r))
+    sys.stdout.flush()
+'''
+
+
+@pytest.fixture
+def fake_worker(tmpdir, monkeypatch):
+    script = tmpdir.join('fake_worker.py')
+    script.write(FAKE_WORKER)
+    starts = tmpdir.join('starts')
+    starts.write('')
+    monkeypatch.setenv('FAKE_STARTS', str(starts))
+    monkeypatch.setenv('FAKE_CRASH', str(tmpdir.join('crash')))
+
+    class Fake(object):
+        command = [sys.executable, str(script)]
+        tmp_dir = str(tmpdir)
+
+        @staticmethod
+        def starts():
+            return len(starts.readlines())
+
+        @staticmethod
+        def crash_next():
+            tmpdir.join('crash').write('')
+
+    return Fake
+
+
+def records(*labels):
+    return [u'%d\t%s\tbody\n' % (i, label) for i, label in enumerate(labels)]
+
+
+def test_batches(fake_worker):
+    worker = JsreWorker(fake_worker.command, fake_worker.tmp_dir)
+    try:
+        assert worker.predict(records('Contains', 'Other')) == ['1\n', '0\n']
+        assert worker.predict(records('Other')) == ['0\n']
+        assert worker.predict(records()) == []
+    finally:
+        worker.stop()
+
+    # The process is started once for all the batches
+    assert fake_worker.starts() == 1
+    assert worker.batches == 3
+    assert worker.restarts == 0
+
+
+def test_work_dir(fake_worker, tmpdir):
+    config_file = tmpdir.join('jsre-config.xml')
+    config_file.write('<config/>')
+    worker = JsreWorker(fake_worker.command, fake_worker.tmp_dir,
+                        [str(config_file)])
+    worker.predict(records('Other'))
+    work_dir = worker.work_dir
+    assert os.path.exists(os.path.join(work_dir, 'jsre-config.xml'))
+
+    worker.stop()
+    assert not os.path.exists(work_dir)
+
+
+def test_error(fake_worker):
+    worker = JsreWorker(fake_worker.command, fake_worker.tmp_dir)
+    try:
+        assert worker.predict(records('FAIL')) is None
+        # The worker is still usable
+        assert worker.predict(records('Contains')) == ['1\n']
+    finally:
+        worker.stop()
+
+    assert fake_worker.starts() == 1
+
+
+def test_crash_restart(fake_worker):
+    worker = JsreWorker(fake_worker.command, fake_worker.tmp_dir)
+    try:
+        worker.predict(records('Other'))
+        fake_worker.crash_next()
+        # The batch is sent again to a new process
+        assert worker.predict(records('Contains', 'CRASH')) == ['1\n', '0\n']
+    finally:
+        worker.stop()
+
+    assert fake_worker.starts() == 2
+    assert worker.restarts == 1
+
+
+def test_restart_after_exit(fake_worker):
+    worker = JsreWorker(fake_worker.command, fake_worker.tmp_dir)
+    try:
+        worker.predict(records('Other'))
+        worker.process.kill()
+        worker.process.wait()
+        assert worker.predict(records('Contains')) == ['1\n']
+    finally:
+        worker.stop()
+
+    assert worker.restarts == 1
+
+
+def test_max_restarts(fake_worker):
+    worker = JsreWorker([sys.executable, '-c', 'print("READY")'],
+                        fake_worker.tmp_dir, max_restarts=2)
+    with pytest.raises(WorkerError):
+        worker.predict(records('Other'))
+    assert worker.process is None
+
+
+def test_not_started(fake_worker):
+    worker = JsreWorker([sys.executable, '-c', 'print("Error: no jSRE")'],
+                        fake_worker.tmp_dir, max_restarts=1)
+    with pytest.raises(WorkerError):
+        worker.predict(records('Other'))
+
+
+def test_exit_untrapped(fake_worker, monkeypatch):
+    monkeypatch.setenv('FAKE_READY', 'READY EXIT_UNTRAPPED')
+    pool = JsreWorkerPool(fake_worker.command, 2, fake_worker.tmp_dir)
+    with pytest.raises(WorkerUnsupportedError):
+        pool.predict(records('Other'))
+
+    # The worker is not restarted, as it would exit with jSRE again
+    assert fake_worker.starts() == 1
+    assert pool.unsupported is not None
+    assert 'not used' in pool.stats()
+
+
+def test_model_reloaded(fake_worker, monkeypatch):
+    monkeypatch.setenv('FAKE_READY', 'READY MODEL_RELOADED')
+    pool = JsreWorkerPool(fake_worker.command, 1, fake_worker.tmp_dir)
+    try:
+        with pytest.warns(UserWarning):
+            assert pool.predict(records('Contains')) == ['1\n']
+    finally:
+        pool.close()
+
+    # The worker is still used, but reads the model for every batch, and
+    # the log says so
+    assert pool.workers[0].model_reloaded
+    assert 'model read for every batch' in pool.stats()
+
+
+def fake_java(tmpdir, monkeypatch, version):
+    bin_dir = tmpdir.mkdir('bin')
+    for name, script in [
+            ('java', 'import sys\n'
+                     'sys.stderr.write(\'java version "%s"\\n\')\n' % version),
+            ('javac', '')]:
+        command = bin_dir.join(name)
+        command.write('#!%s\n%s' % (sys.executable, script))
+        command.chmod(0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, os.environ['PATH']))
+    source = tmpdir.join('JsreWorker.java')
+    source.write('class JsreWorker {}')
+    monkeypatch.setattr(jsre_worker, 'WORKER_SOURCE', str(source))
+
+
+@pytest.mark.parametrize('version, major, allow', [
+    ('1.8.0_292', 8, False), ('17.0.2', 17, False), ('18', 18, True),
+    ('21.0.1', 21, True), ('24', 24, False)])
+def test_security_manager_option(tmpdir, monkeypatch, version, major, allow):
+    fake_java(tmpdir, monkeypatch, version)
+    assert jsre_worker.java_version() == major
+    command = java_worker_command('model', str(tmpdir.join('build')))
+    assert ('-Djava.security.manager=allow' in command) == allow
+
+
+def test_pool(fake_worker):
+    pool = JsreWorkerPool(fake_worker.command, 2, fake_worker.tmp_dir)
+    results = []
+
+    def predict(label):
+        results.append((label, pool.predict(records(label) * 3)))
+
+    threads = [threading.Thread(target=predict, args=(label,))
+               for label in ['Contains', 'Other'] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+
+    assert sorted(results) == sorted(
+        [('Contains', ['1\n'] * 3), ('Other', ['0\n'] * 3)] * 4)
+    assert fake_worker.starts() <= 2
+    assert pool.stats() == 'batches: 8, restarts: 0'
+
+
+def test_concurrent_compile(tmpdir, monkeypatch):
+    # A javac writing the classes slowly, one byte at a time
+    bin_dir = tmpdir.mkdir('bin')
+    javac = bin_dir.join('javac')
+    javac.write('#!%s\n'
+                'import sys, time\n'
+                'out_dir = sys.argv[sys.argv.index("-d") + 1]\n'
+                'for name in ["JsreWorker.class", "JsreWorker$1.class"]:\n'
+                '    with open(out_dir + "/" + name, "w") as f:\n'
+                '        for c in "class":\n'
+                '            f.write(c)\n'
+                '            f.flush()\n'
+                '            time.sleep(0.01)\n' % sys.executable)
+    javac.chmod(0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bin_dir, os.environ['PATH']))
+    source = tmpdir.join('JsreWorker.java')
+    source.write('class JsreWorker {}')
+    monkeypatch.setattr(jsre_worker, 'WORKER_SOURCE', str(source))
+    build_dir = str(tmpdir.join('build'))
+
+    partial = []
+    done = threading.Event()
+
+    def watch():
+        # Classes in the build directory are always complete
+        while not done.is_set():
+            for name in os.listdir(build_dir) \
+                    if os.path.exists(build_dir) else []:
+                if name.endswith('.class'):
+                    with open(os.path.join(build_dir, name)) as f:
+                        if f.read() != 'class':
+                            partial.append(name)
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    threads = [threading.Thread(target=compile_worker, args=(build_dir,))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    watcher.join()
+
+    assert partial == []
+    assert sorted(os.listdir(build_dir)) == ['JsreWorker$1.class',
+                                             'JsreWorker.class']
+
+    # Up to date, so not compiled again
+    monkeypatch.setenv('PATH', '')
+    assert compile_worker(build_dir) == build_dir
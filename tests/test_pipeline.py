@@ -0,0 +1,26 @@
+import pytest
+
+from pipeline import pipeline_args
+
+
+def test_pipeline_args_defaults():
+    args = pipeline_args(['ads', 'corenlp'], {'workers': 4}, in_file='a.pdf',
+                         in_list=None, out_file='out.jsonl',
+                         log_file='log.txt', tika_server_url=None,
+                         ner_model='ner.ser.gz')
+
+    assert args.in_file == 'a.pdf'
+    assert args.ner_model == 'ner.ser.gz'
+    assert args.workers == 4
+    # Command line defaults of the other arguments
+    assert args.in_dir is None
+    assert args.pattern == '*.pdf'
+    assert args.ads_concurrency == 4
+    assert args.corenlp_server_url == 'http://localhost:9000'
+    assert args.corenlp_batch_size == 1
+    assert not hasattr(args, 'jsre_model')
+
+
+def test_pipeline_args_unknown_option():
+    with pytest.raises(TypeError):
+        pipeline_args([], {'jsre_workers': 2}, in_file='a.pdf')
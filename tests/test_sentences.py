@@ -0,0 +1,84 @@
+import json
+
+from sentences import decode_sentences
+from sentences import encode_sentences
+
+
+def token(index, word, begin, **fields):
+    token = {'index': index, 'word': word, 'originalText': word,
+             'characterOffsetBegin': begin,
+             'characterOffsetEnd': begin + len(word), 'ner': 'O'}
+    token.update(fields)
+    return token
+
+
+def round_trip(sentences):
+    encoded = json.loads(json.dumps(encode_sentences(sentences)))
+    return decode_sentences(encoded).to_list()
+
+
+def test_round_trip():
+    sentences = [
+        {'index': 0,
+         'tokens': [token(1, u'Gale', 0, ner='Target'),
+                    token(2, u'crater', 5)],
+         'entitymentions': [{'text': u'Gale', 'ner': 'Target',
+                             'tokenBegin': 0, 'tokenEnd': 1}]},
+        {'index': 1, 'tokens': [token(1, u'Olivine', 12)]}
+    ]
+    assert round_trip(sentences) == sentences
+
+
+def test_explicit_none():
+    # Fields whose value is None are kept, fields missing from some tokens
+    # are not added
+    sentences = [{'index': 0,
+                  'tokens': [token(1, u'a', 0, lemma=None),
+                             token(2, u'b', 2, lemma=u'b', speaker=None),
+                             token(3, u'c', 4)],
+                  'entitymentions': [{'text': u'a', 'ner': None},
+                                     {'text': u'b'}]}]
+    decoded = round_trip(sentences)
+    assert decoded == sentences
+
+    tokens = decode_sentences(encode_sentences(sentences))[0]['tokens']
+    assert tokens[0]['lemma'] is None
+    assert 'lemma' in tokens[0]
+    assert 'lemma' not in tokens[2]
+    assert tokens[2].get('lemma', 'missing') == 'missing'
+    assert sorted(tokens[1].keys()) == sorted(sentences[0]['tokens'][1])
+
+
+def test_index_elided_only_when_implicit():
+    sentences = [{'tokens': [{'word': u'a'}, {'word': u'b'}]}]
+    tokens = decode_sentences(encode_sentences(sentences))[0]['tokens']
+    assert 'index' not in tokens[0]
+    assert tokens[0].keys() == ['word']
+    assert round_trip(sentences) == sentences
+
+    # Indices other than 1..n are stored
+    sentences = [{'tokens': [token(3, u'a', 0), token(4, u'b', 2)]}]
+    assert round_trip(sentences) == sentences
+
+    sentences = [{'tokens': [token(1, u'a', 0), token(2, u'b', 2)]}]
+    encoded = encode_sentences(sentences)
+    assert '_index' not in encoded['sentences'][0]['tokens']['columns']
+    assert round_trip(sentences) == sentences
+
+
+def test_version_1():
+    # Version 1 stored the missing values as None and always elided indices
+    encoded = {
+        'columnar': 1,
+        'strings': [u'a', u'b', u'O'],
+        'sentences': [{'tokens': {
+            'count': 2,
+            'columns': {'word': [0, 1], 'ner': [2, 2], '_lemma': [None, 1]},
+            'offsets': [0, 1, 1, 2]}}]
+    }
+    tokens = decode_sentences(encoded).to_list()[0]['tokens']
+    assert tokens == [
+        {'index': 1, 'word': u'a', 'ner': u'O', 'characterOffsetBegin': 0,
+         'characterOffsetEnd': 1},
+        {'index': 2, 'word': u'b', 'ner': u'O', 'lemma': 1,
+         'characterOffsetBegin': 2, 'characterOffsetEnd': 4}]
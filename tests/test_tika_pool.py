@@ -0,0 +1,145 @@
+import time
+import warnings
+
+import pytest
+import requests
+
+from tika_pool import TikaServerPool
+
+
+class TikaStub(object):
+    """ Answers like a Tika server, with a configurable status and delay """
+
+    def __init__(self, status=200, delay=0):
+        self.status = status
+        self.delay = delay
+
+    def __call__(self, method, path, headers, body):
+        time.sleep(self.delay)
+        return self.status, {}, 'parsed'
+
+
+def send(url):
+    """ Sends a request like tika-python, which does not raise on HTTP
+    errors but returns their status """
+    response = requests.put(url + '/tika', data='%PDF', timeout=5)
+    return {'status': response.status_code, 'content': response.text}
+
+
+def start_pool(stub_server, stubs, **kwargs):
+    servers = [stub_server(stub) for stub in stubs]
+    kwargs.setdefault('health_check_interval', 0)
+    return TikaServerPool([s.url for s in servers], **kwargs), servers
+
+
+@pytest.fixture(autouse=True)
+def ignore_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def test_round_robin(stub_server):
+    pool, servers = start_pool(stub_server, [TikaStub() for _ in range(3)],
+                               strategy='round_robin')
+    urls = []
+    for _ in range(6):
+        server = pool.acquire()
+        urls.append(server.url)
+        pool.release(server)
+
+    assert urls == [s.url for s in servers] * 2
+
+
+def test_least_loaded(stub_server):
+    pool, servers = start_pool(stub_server, [TikaStub() for _ in range(3)],
+                               strategy='least_loaded')
+    busy = [pool.acquire() for _ in range(3)]
+    assert sorted(s.url for s in busy) == sorted(s.url for s in servers)
+
+    # The server handed back first has the fewest requests in flight
+    pool.release(busy[1])
+    assert pool.acquire() is busy[1]
+
+
+def test_5xx_ejects_server(stub_server):
+    stubs = [TikaStub(status=503), TikaStub()]
+    pool, servers = start_pool(stub_server, stubs, max_failures=2)
+
+    for _ in range(4):
+        assert pool.request(send)['status'] == 200
+
+    # Every request failing on the first server was retried on the second
+    assert not pool.servers[0].healthy
+    assert pool.servers[1].healthy
+    assert len(servers[0].requests) == 2
+    assert len(servers[1].requests) == 4
+    assert pool.ejections == 1
+
+
+def test_5xx_of_every_server_is_returned(stub_server):
+    pool, servers = start_pool(stub_server,
+                               [TikaStub(status=500), TikaStub(status=503)])
+
+    assert pool.request(send)['status'] in (500, 503)
+    assert len(servers[0].requests) == 1
+    assert len(servers[1].requests) == 1
+
+
+def test_client_error_is_not_a_failure(stub_server):
+    pool, servers = start_pool(stub_server, [TikaStub(status=422), TikaStub()],
+                               strategy='round_robin', max_failures=1)
+
+    assert pool.request(send)['status'] == 422
+    assert all(s.healthy for s in pool.servers)
+
+
+def test_connection_errors(stub_server):
+    pool, servers = start_pool(stub_server, [TikaStub()])
+    servers[0].close()
+
+    with pytest.raises(RuntimeError):
+        pool.request(send)
+
+
+def test_readmission(stub_server):
+    stubs = [TikaStub(status=503), TikaStub()]
+    pool, servers = start_pool(stub_server, stubs, max_failures=1)
+    pool.request(send)
+    assert not pool.servers[0].healthy
+
+    # Still failing the health probe
+    pool.health_check()
+    assert not pool.servers[0].healthy
+
+    stubs[0].status = 200
+    pool.health_check()
+    assert pool.servers[0].healthy
+    assert pool.servers[0].failures == 0
+    assert pool.readmissions == 1
+
+
+def test_slow_server_ejection(stub_server):
+    stubs = [TikaStub(delay=0.5), TikaStub()]
+    pool, servers = start_pool(stub_server, stubs, slow_threshold=0.2)
+
+    pool.health_check()
+    assert not pool.servers[0].healthy
+    assert pool.servers[1].healthy
+    for _ in range(3):
+        pool.request(send)
+    assert len(servers[0].requests) == 1
+
+    stubs[0].delay = 0
+    pool.health_check()
+    assert pool.servers[0].healthy
+
+
+def test_all_ejected_servers_are_tried(stub_server):
+    stubs = [TikaStub(status=503), TikaStub(status=503)]
+    pool, servers = start_pool(stub_server, stubs, max_failures=1)
+    pool.request(send)
+    assert not any(s.healthy for s in pool.servers)
+
+    stubs[1].status = 200
+    assert pool.request(send)['status'] == 200
@@ -0,0 +1,214 @@
+import time
+import threading
+
+import pytest
+
+from utils import Batcher
+from utils import parallel_map
+
+
+class CountingItems(object):
+    """ An input stream recording how many items were read """
+
+    def __init__(self, count):
+        self.count = count
+        self.read = 0
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        for i in range(self.count):
+            with self.lock:
+                self.read += 1
+            yield i
+
+
+def test_sequential():
+    results = list(parallel_map(lambda x: x * 2, range(5)))
+    assert results == [(i, i * 2) for i in range(5)]
+
+
+def test_input_order():
+    # Later items finish first
+    def func(x):
+        time.sleep(0.01 * (10 - x))
+        return x * 2
+
+    results = list(parallel_map(func, range(10), workers=4))
+    assert results == [(i, i * 2) for i in range(10)]
+
+
+def test_completion_order():
+    def func(x):
+        time.sleep(0.2 if x == 0 else 0)
+        return x
+
+    results = list(parallel_map(func, range(8), workers=4, ordered=False))
+    assert sorted(results) == [(i, i) for i in range(8)]
+    assert results[-1] == (0, 0)
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_bounded_input(ordered):
+    items = CountingItems(2000)
+    release = threading.Event()
+
+    def func(x):
+        if x == 0:
+            release.wait(5)
+        return x
+
+    results = parallel_map(func, items, workers=4, ordered=ordered)
+    if ordered:
+        # The slow first item holds back the results of the others
+        threading.Timer(0.5, release.set).start()
+        assert next(results) == (0, 0)
+    else:
+        next(results)
+        release.set()
+    assert items.read <= 2 * 4 + 1
+
+    rest = list(results)
+    assert items.read == 2000
+    assert len(rest) == 1999
+
+
+def test_max_pending():
+    items = CountingItems(100)
+    results = parallel_map(lambda x: x, items, workers=2, max_pending=5)
+    next(results)
+    assert items.read <= 5 + 1
+    assert len(list(results)) == 99
+
+
+def test_error():
+    def func(x):
+        if x == 3:
+            raise ValueError('failed on %d' % x)
+        return x
+
+    results = parallel_map(func, range(6), workers=3)
+    assert [next(results) for _ in range(3)] == [(0, 0), (1, 1), (2, 2)]
+    with pytest.raises(ValueError):
+        next(results)
+
+
+class RecordingBatches(object):
+    """ Runs batches by doubling their requests, recording every batch """
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, requests):
+        with self.lock:
+            self.batches.append(list(requests))
+        if self.fail:
+            raise ValueError('batch failed')
+        return [r * 2 for r in requests]
+
+
+def submit_all(batcher, requests, key=lambda r: None):
+    """ Submits each request from its own thread
+    :return: list of (request, result or exception) pairs """
+    results = []
+    lock = threading.Lock()
+
+    def submit(request):
+        try:
+            result = batcher.submit(request, key(request))
+        except Exception as e:
+            result = e
+        with lock:
+            results.append((request, result))
+
+    threads = [threading.Thread(target=submit, args=(r,)) for r in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_batcher():
+    run_batch = RecordingBatches()
+    batcher = Batcher(run_batch, batch_size=4, batch_wait=5)
+
+    start = time.time()
+    results = submit_all(batcher, range(8))
+
+    # Full batches do not wait, and each request gets its own result
+    assert time.time() - start < 4
+    assert sorted(results) == [(i, i * 2) for i in range(8)]
+    assert sorted(len(b) for b in run_batch.batches) == [4, 4]
+    assert sorted(r for b in run_batch.batches for r in b) == list(range(8))
+    assert batcher.stats() == 'batches: 2, requests: 8'
+
+
+def test_batcher_wait():
+    run_batch = RecordingBatches()
+    batcher = Batcher(run_batch, batch_size=4, batch_wait=0.2)
+
+    start = time.time()
+    assert batcher.submit(3) == 6
+    assert 0.2 <= time.time() - start < 2
+    assert run_batch.batches == [[3]]
+
+
+def test_batcher_submitters():
+    run_batch = RecordingBatches()
+    batcher = Batcher(run_batch, batch_size=8, batch_wait=5, submitters=3)
+
+    start = time.time()
+    results = submit_all(batcher, range(3))
+
+    # The batch cannot fill, and is run once every submitter is waiting
+    assert time.time() - start < 4
+    assert sorted(results) == [(i, i * 2) for i in range(3)]
+    assert [sorted(b) for b in run_batch.batches] == [[0, 1, 2]]
+
+
+def test_batcher_submitters_keys():
+    run_batch = RecordingBatches()
+    batcher = Batcher(run_batch, batch_size=8, batch_wait=5, submitters=4)
+
+    start = time.time()
+    results = submit_all(batcher, range(4), key=lambda r: r % 2)
+
+    # Every batch being collected is run
+    assert time.time() - start < 4
+    assert sorted(results) == [(i, i * 2) for i in range(4)]
+    assert sorted(sorted(b) for b in run_batch.batches) == [[0, 2], [1, 3]]
+
+
+def test_batcher_keys():
+    run_batch = RecordingBatches()
+    batcher = Batcher(run_batch, batch_size=2, batch_wait=5)
+
+    results = submit_all(batcher, range(4), key=lambda r: r % 2)
+
+    assert sorted(results) == [(i, i * 2) for i in range(4)]
+    assert sorted(sorted(b) for b in run_batch.batches) == [[0, 2], [1, 3]]
+
+
+def test_batcher_max_weight():
+    run_batch = RecordingBatches()
+    batcher = Batcher(run_batch, batch_size=10, batch_wait=5, max_weight=4)
+
+    results = submit_all(batcher, ['ab', 'cd', 'ef', 'gh'])
+
+    # Each batch is full at 4 characters
+    assert sorted(results) == [(r, r * 2) for r in ['ab', 'cd', 'ef', 'gh']]
+    assert [len(b) for b in run_batch.batches] == [2, 2]
+    assert batcher.stats() == 'batches: 2, requests: 4, weight: 8'
+
+
+def test_batcher_error():
+    batcher = Batcher(RecordingBatches(fail=True), batch_size=3, batch_wait=5)
+
+    results = submit_all(batcher, range(3))
+
+    # The error is raised in every request of the batch
+    assert len(results) == 3
+    assert all(isinstance(e, ValueError) for _, e in results)
+    assert batcher.stats() == 'batches: 0, requests: 0'